@@ -1,112 +1,63 @@
 #!/usr/bin/env python3
 """Regenerate activities.json from database (standalone version)"""
 
-import json
+import os
 import sqlite3
 import sys
 import io
-import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "run_page"))
+from generator.db import init_db
+from generator.exporter import (
+    filter_activities,
+    iter_activities,
+    write_activities_json,
+)
 
 # Ensure UTF-8 output
 sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding="utf-8")
 
 SQL_FILE = "run_page/data.db"
 JSON_FILE = "src/static/activities.json"
-
-
-def load_activities_from_db():
-    """Load activities from database and convert to list of dicts"""
-    conn = sqlite3.connect(SQL_FILE)
-    cursor = conn.cursor()
-
-    # Get all activities with distance > 0.1, ordered by start_date_local
-    cursor.execute(
-        """
-        SELECT run_id, name, distance, moving_time, type, subtype,
-               start_date, start_date_local, location_country,
-               summary_polyline, average_heartrate, average_speed, elevation_gain
-        FROM activities
-        WHERE distance > 0.1
-        ORDER BY start_date_local
-    """
-    )
-
-    activities = cursor.fetchall()
-    conn.close()
-
-    activity_list = []
-    streak = 0
-    last_date = None
-
-    for activity in activities:
-        (
-            run_id,
-            name,
-            distance,
-            moving_time,
-            type_,
-            subtype,
-            start_date,
-            start_date_local,
-            location_country,
-            summary_polyline,
-            average_heartrate,
-            average_speed,
-            elevation_gain,
-        ) = activity
-
-        # Calculate streak
-        date = datetime.datetime.strptime(start_date_local, "%Y-%m-%d %H:%M:%S").date()
-        if last_date is None:
-            streak = 1
-        elif date == last_date:
-            pass
-        elif date == last_date + datetime.timedelta(days=1):
-            streak += 1
-        else:
-            streak = 1
-        last_date = date
-
-        # Build activity dict
-        activity_dict = {
-            "run_id": run_id,
-            "name": name,
-            "distance": distance,
-            "moving_time": moving_time,
-            "type": type_,
-            "subtype": subtype,
-            "start_date": start_date,
-            "start_date_local": start_date_local,
-            "location_country": location_country,
-            "summary_polyline": summary_polyline,
-            "average_heartrate": average_heartrate,
-            "average_speed": average_speed,
-            "elevation_gain": elevation_gain,
-            "streak": streak,
-        }
-
-        activity_list.append(activity_dict)
-
-    return activity_list
+IGNORE_BEFORE_SAVING = os.getenv("IGNORE_BEFORE_SAVING", "")
 
 
 def regenerate_activities_json():
     """Regenerate activities.json from the database"""
     print(f"Loading activities from database: {SQL_FILE}")
+    print(f"Writing to: {JSON_FILE}")
 
-    activities_list = load_activities_from_db()
+    # keep the first activities to show them below, the rest is streamed
+    samples = []
 
-    print(f"Loaded {len(activities_list)} activities")
-    print(f"Writing to: {JSON_FILE}")
+    def keep_samples(activities):
+        for activity in activities:
+            if len(samples) < 10:
+                samples.append(activity)
+            yield activity
 
+    # bring the schema up to date before reading it directly
+    init_db(SQL_FILE)
+    conn = sqlite3.connect(SQL_FILE)
     with open(JSON_FILE, "w", encoding="utf-8") as f:
-        json.dump(activities_list, f, ensure_ascii=False)
+        count = write_activities_json(
+            keep_samples(
+                filter_activities(
+                    iter_activities(conn), ignore_before_saving=IGNORE_BEFORE_SAVING
+                )
+            ),
+            f,
+            fast=True,
+            ensure_ascii=False,
+        )
+    conn.close()
 
+    print(f"Loaded {count} activities")
     print("✓ Successfully regenerated activities.json")
 
     # Show a few examples of location_country
     print("\nSample location_country values:")
-    for i, activity in enumerate(activities_list[:10]):
+    for i, activity in enumerate(samples):
         location = activity.get("location_country", "")
         name = activity.get("name", "")
         run_id = activity.get("run_id", "")
@@ -2,7 +2,7 @@ import argparse
 from openai import OpenAI
 from config import SQL_FILE, PNG_FOLDER
 from generator import Generator
-import polyline
+from polyline_codec import decode_points
 import base64
 import os
 import cairosvg  # 替换 svglib.svglib 和 reportlab.graphics
@@ -96,7 +96,7 @@ def generate_route_svg(
         format: Output format, either 'svg' or 'png'.
     """
     try:
-        points = polyline.decode(polyline_str)
+        points = decode_points(polyline_str)
     except Exception as e:
         print(f"Error decoding polyline: {e}")
         return
@@ -0,0 +1,86 @@
+"""
+Compare the ORM export (Activity rows + strptime + to_dict, the old
+Generator.load) against generator.exporter.iter_activities, in rows/second.
+
+python run_page/benchmarks/bench_export.py [--db run_page/data.db] [--repeat 5]
+"""
+
+import argparse
+import datetime
+import io
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from config import SQL_FILE
+from generator.db import Activity, init_db
+from generator.exporter import iter_activities, write_activities_json
+
+
+def orm_export(session):
+    activities = (
+        session.query(Activity)
+        .filter(Activity.distance > 0.1)
+        .order_by(Activity.start_date_local)
+    )
+    activity_list = []
+    streak = 0
+    last_date = None
+    for activity in activities:
+        date = datetime.datetime.strptime(
+            activity.start_date_local, "%Y-%m-%d %H:%M:%S"
+        ).date()
+        if last_date is None:
+            streak = 1
+        elif date == last_date:
+            pass
+        elif date == last_date + datetime.timedelta(days=1):
+            streak += 1
+        else:
+            streak = 1
+        activity.streak = streak
+        last_date = date
+        activity_list.append(activity.to_dict())
+    out = io.StringIO()
+    json.dump(activity_list, out)
+    session.expunge_all()
+    return len(activity_list)
+
+
+def raw_export(session, fast=False):
+    out = io.StringIO()
+    # full resolution polylines, the same output as the orm path
+    return write_activities_json(
+        iter_activities(session.connection().connection, resolution=0),
+        out,
+        fast=fast,
+        # orjson only writes non-ASCII characters as they are
+        ensure_ascii=not fast,
+    )
+
+
+def bench(name, func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"{name:<22} {rows} rows  {best * 1000:8.1f} ms  {rows / best:12.0f} rows/s")
+    return best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", default=SQL_FILE, help="sqlite db file")
+    parser.add_argument("--repeat", type=int, default=5)
+    options = parser.parse_args()
+
+    session = init_db(options.db)
+    orm = bench("orm + json.dump", lambda: orm_export(session), options.repeat)
+    raw = bench("raw cursor", lambda: raw_export(session), options.repeat)
+    bench("raw cursor + orjson", lambda: raw_export(session, True), options.repeat)
+    print(f"speedup: {orm / raw:.1f}x")
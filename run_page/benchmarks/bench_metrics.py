@@ -0,0 +1,122 @@
+"""
+Compare the point by point metrics (gpxpy segment methods, the old
+Track._calc_moving_time and tulipsport compute_elevation_gain loops) against
+track_metrics, in points/second.
+
+python run_page/benchmarks/bench_metrics.py [--points 20000] [--repeat 5]
+"""
+
+import argparse
+import datetime
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+import gpxpy
+import track_metrics
+
+
+def make_points(size):
+    """A random walk, one point every 1-15 seconds"""
+    random.seed(0)
+    lat, lng, ele = 40.0, 116.3, 50.0
+    now = datetime.datetime(2023, 5, 1, tzinfo=datetime.UTC)
+    points = []
+    for _ in range(size):
+        lat += random.uniform(-1, 1) * 5e-5
+        lng += random.uniform(-1, 1) * 5e-5
+        ele += random.uniform(-1, 1)
+        now += datetime.timedelta(seconds=random.randint(1, 15))
+        points.append((lat, lng, ele, now, random.randint(100, 180)))
+    return points
+
+
+def loop_calc_moving_time(times):
+    moving_time = 0
+    start_time = times[0]
+    for i in range(1, len(times)):
+        if times[i] - times[i - 1] <= datetime.timedelta(seconds=10):
+            moving_time += times[i].timestamp() - start_time.timestamp()
+        start_time = times[i]
+    return int(moving_time)
+
+
+def loop_elevation_gain(altitudes):
+    total_gain = 0
+    for i in range(1, len(altitudes)):
+        if float(altitudes[i]) > float(altitudes[i - 1]):
+            total_gain += float(altitudes[i]) - float(altitudes[i - 1])
+    return total_gain
+
+
+def loop_metrics(segment, times, elevations, heart_rates):
+    return (
+        segment.length_2d(),
+        loop_calc_moving_time(times),
+        segment.get_moving_data(),
+        segment.get_uphill_downhill().uphill,
+        loop_elevation_gain(elevations),
+        sum(heart_rates) / len(heart_rates),
+    )
+
+
+def numpy_metrics(lats, lngs, timestamps, elevations, heart_rates):
+    return (
+        track_metrics.track_length(lats, lngs),
+        track_metrics.moving_time(timestamps),
+        track_metrics.moving_data(lats, lngs, timestamps, elevations),
+        track_metrics.elevation_gain(elevations),
+        track_metrics.elevation_gain(elevations, smooth=False),
+        track_metrics.average_heart_rate(heart_rates),
+    )
+
+
+def bench(name, func, size, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(
+        f"{name:<10} {size} points  {best * 1000:8.1f} ms  {size / best:12.0f} points/s"
+    )
+    return best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--points", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5)
+    options = parser.parse_args()
+
+    points = make_points(options.points)
+    segment = gpxpy.gpx.GPXTrackSegment(
+        [
+            gpxpy.gpx.GPXTrackPoint(lat, lng, elevation=ele, time=t)
+            for lat, lng, ele, t, _ in points
+        ]
+    )
+    times = [p[3] for p in points]
+    elevations = [p[2] for p in points]
+    heart_rates = [p[4] for p in points]
+    lats = [p[0] for p in points]
+    lngs = [p[1] for p in points]
+    timestamps = [t.timestamp() for t in times]
+
+    loop = bench(
+        "loops",
+        lambda: loop_metrics(segment, times, elevations, heart_rates),
+        options.points,
+        options.repeat,
+    )
+    vectorized = bench(
+        "numpy",
+        lambda: numpy_metrics(lats, lngs, timestamps, elevations, heart_rates),
+        options.points,
+        options.repeat,
+    )
+    print(f"speedup: {loop / vectorized:.1f}x")
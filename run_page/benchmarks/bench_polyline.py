@@ -0,0 +1,100 @@
+"""
+Compare the polyline package against polyline_codec: encoding, decoding and
+merging tracks one after the other (re-encoding every point each time like
+Track.append used to, against appending the new points only). Exits with 1 if
+polyline_codec gives a different result.
+
+python run_page/benchmarks/bench_polyline.py [--points 20000] [--tracks 50] [--repeat 5]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+import polyline
+import polyline_codec
+
+
+def make_points(size):
+    """A random walk, about 5 meters a point"""
+    random.seed(0)
+    lat, lng = 40.0, 116.3
+    points = []
+    for _ in range(size):
+        lat += random.uniform(-1, 1) * 5e-5
+        lng += random.uniform(-1, 1) * 5e-5
+        points.append((lat, lng))
+    return points
+
+
+def package_merge(tracks):
+    points = []
+    for track in tracks:
+        points.extend(track)
+        polyline_str = polyline.encode(points)
+    return polyline_str
+
+
+def codec_merge(tracks):
+    polyline_str, previous = "", None
+    for track in tracks:
+        lats = [p[0] for p in track]
+        lngs = [p[1] for p in track]
+        polyline_str = polyline_codec.append(polyline_str, lats, lngs, previous)
+        previous = track[-1]
+    return polyline_str
+
+
+def bench(name, func, size, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(
+        f"{name:<16} {size} points  {best * 1000:8.1f} ms  {size / best:12.0f} points/s"
+    )
+    return best, result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--points", type=int, default=20000)
+    parser.add_argument("--tracks", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=5)
+    options = parser.parse_args()
+
+    points = make_points(options.points)
+    size = options.points
+    step = max(size // options.tracks, 1)
+    tracks = [points[i : i + step] for i in range(0, size, step)]
+    encoded = polyline.encode(points)
+    cases = (
+        (
+            "encode",
+            lambda: polyline.encode(points),
+            lambda: polyline_codec.encode_points(points),
+        ),
+        (
+            "decode",
+            lambda: polyline.decode(encoded),
+            lambda: polyline_codec.decode_points(encoded),
+        ),
+        ("merge", lambda: package_merge(tracks), lambda: codec_merge(tracks)),
+    )
+    differences = 0
+    for name, package_func, codec_func in cases:
+        package, expected = bench(
+            f"polyline {name}", package_func, size, options.repeat
+        )
+        codec, actual = bench(f"codec {name}", codec_func, size, options.repeat)
+        print(f"speedup: {package / codec:.1f}x")
+        if actual != expected:
+            differences += 1
+            print(f"{name}: polyline_codec gives a different result")
+    sys.exit(1 if differences else 0)
@@ -0,0 +1,119 @@
+"""
+Compare the point by point privacy filter (every track point against every
+IGNORE_POLYLINE point with haversine) against polyline_processor.filter_out
+on random tracks around a random ignore polyline. Exits with 1 if filter_out
+keeps different points.
+
+python run_page/benchmarks/bench_privacy_filter.py [--points 2000] [--tracks 20]
+    [--ignore-points 500] [--range 200] [--start-end-range 200] [--repeat 3]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+import polyline_codec
+import polyline_processor
+from haversine import haversine
+
+
+def make_walk(size, lat, lng, step=5e-5):
+    """A random walk from (lat, lng), about 5 meters a point"""
+    points = []
+    for _ in range(size):
+        lat += random.uniform(-1, 1) * step
+        lng += random.uniform(-1, 1) * step
+        points.append((lat, lng))
+    return points
+
+
+def scalar_filter_out(polyline_str, ignore_points, ignore_range, start_end_range):
+    """filter_out as it was, one haversine call at a time"""
+    pl = polyline_codec.decode_points(polyline_str)
+    start_index, end_index = 0, len(pl) - 1
+    starting_distance = 0
+    for i in range(1, len(pl)):
+        starting_distance += haversine(pl[i], pl[i - 1])
+        if starting_distance > start_end_range:
+            start_index = i
+            break
+    ending_distance = 0
+    for i in range(len(pl) - 2, -1, -1):
+        ending_distance += haversine(pl[i], pl[i + 1])
+        if ending_distance > start_end_range:
+            end_index = i
+            break
+    if start_index >= end_index:
+        return None
+    new_pl = [
+        point
+        for point in pl[start_index : end_index + 1]
+        if not any(haversine(point, p) < ignore_range for p in ignore_points)
+    ]
+    return polyline_codec.encode_points(new_pl) if new_pl else None
+
+
+def bench(name, func, size, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(
+        f"{name:<16} {size} points  {best * 1000:8.1f} ms  {size / best:12.0f} points/s"
+    )
+    return best, result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--points", type=int, default=2000)
+    parser.add_argument("--tracks", type=int, default=20)
+    parser.add_argument("--ignore-points", type=int, default=500)
+    parser.add_argument("--range", type=int, default=200, help="IGNORE_RANGE")
+    parser.add_argument(
+        "--start-end-range", type=int, default=200, help="IGNORE_START_END_RANGE"
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    options = parser.parse_args()
+
+    random.seed(0)
+    home = (40.0, 116.3)
+    ignore_points = make_walk(options.ignore_points, *home)
+    # tracks starting around the ignore polyline, like runs from home
+    tracks = [
+        polyline_codec.encode_points(make_walk(options.points, *home))
+        for _ in range(options.tracks)
+    ]
+    ignore_range = options.range / 1000
+    start_end_range = options.start_end_range / 1000
+    polyline_processor.IGNORE_POLYLINE = ignore_points
+    polyline_processor.IGNORE_RANGE = ignore_range
+    polyline_processor.IGNORE_START_END_RANGE = start_end_range
+    polyline_processor.ignore_index.cache_clear()
+
+    size = options.points * options.tracks
+    scalar, expected = bench(
+        "haversine",
+        lambda: [
+            scalar_filter_out(t, ignore_points, ignore_range, start_end_range)
+            for t in tracks
+        ],
+        size,
+        options.repeat,
+    )
+    indexed, actual = bench(
+        "filter_out",
+        lambda: [polyline_processor.filter_out(t) for t in tracks],
+        size,
+        options.repeat,
+    )
+    print(f"speedup: {scalar / indexed:.1f}x")
+    if actual != expected:
+        print("filter_out keeps different points")
+        sys.exit(1)
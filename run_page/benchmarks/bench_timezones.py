@@ -0,0 +1,94 @@
+"""
+Compare resolving local start times the old way (a zone lookup and
+datetime.now per activity) against the timezones cache, one activity at a
+time and as one batch, on start points around a few places. The gain is
+bigger with timezonefinder, whose lookups are much slower than tzfpy's.
+
+python run_page/benchmarks/bench_timezones.py [--activities 2000] [--repeat 5]
+"""
+
+import argparse
+import datetime
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+import pytz
+import timezones
+
+CITIES = ((39.9, 116.4), (31.2, 121.5), (22.5, 114.1), (35.7, 139.7), (51.5, -0.1))
+
+
+def make_starts(size):
+    """Start points within about 500 m of a few places, one activity a day"""
+    random.seed(0)
+    start = datetime.datetime(2020, 1, 1, 7, tzinfo=datetime.UTC)
+    starts = []
+    for i in range(size):
+        lat, lng = random.choice(CITIES)
+        lat += random.uniform(-1, 1) * 0.005
+        lng += random.uniform(-1, 1) * 0.005
+        starts.append((start + datetime.timedelta(days=i), (lat, lng)))
+    return starts
+
+
+def lookup_each(starts):
+    result = []
+    for start_time, (lat, lng) in starts:
+        tz_name = timezones._lookup(lat, lng)
+        result.append(
+            start_time + datetime.datetime.now(pytz.timezone(tz_name)).utcoffset()
+        )
+    return result
+
+
+def cached_each(starts):
+    return [
+        start_time + timezones.utc_offset(start_time, timezones.timezone_at(*point))
+        for start_time, point in starts
+    ]
+
+
+def cached_batch(starts):
+    tz_names = timezones.timezones_at([point for _, point in starts])
+    return [
+        start_time + timezones.utc_offset(start_time, tz_name)
+        for (start_time, _), tz_name in zip(starts, tz_names)
+    ]
+
+
+def bench(name, func, size, repeat, clear=True):
+    best = None
+    for _ in range(repeat):
+        if clear:
+            timezones._cell_timezone.cache_clear()
+            timezones._point_timezone.cache_clear()
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(
+        f"{name:<12} {size} activities  {best * 1000:8.1f} ms  {size / best:10.0f} activities/s"
+    )
+    return best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--activities", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    options = parser.parse_args()
+
+    starts = make_starts(options.activities)
+    size = options.activities
+    lookup = bench("lookup", lambda: lookup_each(starts), size, options.repeat)
+    cached = bench("cached", lambda: cached_each(starts), size, options.repeat)
+    batch = bench("batch", lambda: cached_batch(starts), size, options.repeat)
+    print(f"speedup: {lookup / cached:.1f}x cached, {lookup / batch:.1f}x batch")
+    print(
+        f"cells: {timezones._cell_timezone.cache_info().currsize}"
+        f" points: {timezones._point_timezone.cache_info().currsize}"
+    )
@@ -0,0 +1,59 @@
+"""
+Load every FIT file of a folder with both FIT loaders (the garmin_fit_sdk
+Decoder and the mmap fit_reader), report the fields that differ and the time
+each loader took. Exits with 1 if any track differs.
+Like when syncing, Track.load_fit removes the FIT files the SDK finds corrupted.
+
+python run_page/benchmarks/check_fit_loader.py [--fit-dir FIT_OUT] [--rel-tol 1e-9]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from check_gpx_loader import fields, same
+from config import FIT_FOLDER
+from gpxtrackposter.track import Track
+
+
+def load(file_name, loader):
+    t = Track()
+    t.load_fit(file_name, loader=loader)
+    return t
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--fit-dir", default=FIT_FOLDER, help="folder of fit files")
+    parser.add_argument("--rel-tol", type=float, default=1e-9)
+    options = parser.parse_args()
+
+    file_names = sorted(
+        os.path.join(options.fit_dir, name)
+        for name in os.listdir(options.fit_dir)
+        if name.endswith(".fit")
+    )
+    elapsed = {"sdk": 0.0, "mmap": 0.0}
+    differences = 0
+    for file_name in file_names:
+        tracks = {}
+        # mmap first, a file the SDK finds corrupted is gone afterwards
+        for loader in ("mmap", "sdk"):
+            start = time.perf_counter()
+            tracks[loader] = fields(load(file_name, loader))
+            elapsed[loader] += time.perf_counter() - start
+        expected, actual = tracks["sdk"], tracks["mmap"]
+        for key in expected.keys() | actual.keys():
+            if not same(expected.get(key), actual.get(key), options.rel_tol):
+                differences += 1
+                print(f"{os.path.basename(file_name)} {key}: ", end="")
+                print(f"{expected.get(key)!r:.80} != {actual.get(key)!r:.80}")
+
+    for loader, seconds in elapsed.items():
+        print(f"{loader:<10} {len(file_names)} files  {seconds * 1000:8.1f} ms")
+    print(f"speedup: {elapsed['sdk'] / max(elapsed['mmap'], 1e-9):.1f}x")
+    print(f"differences: {differences}")
+    sys.exit(1 if differences else 0)
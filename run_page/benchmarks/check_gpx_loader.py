@@ -0,0 +1,80 @@
+"""
+Load every GPX file of a folder with both GPX loaders (gpxpy and the
+iterparse gpx_stream reader), report the fields that differ and the time
+each loader took. Exits with 1 if any track differs.
+
+python run_page/benchmarks/check_gpx_loader.py [--gpx-dir GPX_OUT] [--rel-tol 1e-9]
+"""
+
+import argparse
+import math
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from config import GPX_FOLDER
+from gpxtrackposter.track import Track
+
+
+def load(file_name, loader):
+    t = Track()
+    t.load_gpx(file_name, loader=loader)
+    return t
+
+
+def fields(t):
+    """What ends up in the db, plus the points kept for drawing"""
+    if t.start_time is None or t.start_time_local is None:
+        d = {"start_time": t.start_time, "length": t.length}
+    else:
+        d = t.to_namedtuple()._asdict()
+    d["line_sizes"] = [len(line) for line in t.lines()]
+    d["times"] = list(t.times)
+    d["elevations"] = list(t.elevations)
+    d["heart_rates"] = list(t.heart_rates)
+    return d
+
+
+def same(a, b, rel_tol):
+    if isinstance(a, float) and isinstance(b, float):
+        return (math.isnan(a) and math.isnan(b)) or math.isclose(
+            a, b, rel_tol=rel_tol, abs_tol=rel_tol
+        )
+    if isinstance(a, (list, tuple)) and isinstance(b, (list, tuple)):
+        return len(a) == len(b) and all(same(x, y, rel_tol) for x, y in zip(a, b))
+    return a == b
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--gpx-dir", default=GPX_FOLDER, help="folder of gpx files")
+    parser.add_argument("--rel-tol", type=float, default=1e-9)
+    options = parser.parse_args()
+
+    file_names = sorted(
+        os.path.join(options.gpx_dir, name)
+        for name in os.listdir(options.gpx_dir)
+        if name.endswith(".gpx")
+    )
+    elapsed = {"gpxpy": 0.0, "iterparse": 0.0}
+    differences = 0
+    for file_name in file_names:
+        tracks = {}
+        for loader in elapsed:
+            start = time.perf_counter()
+            tracks[loader] = fields(load(file_name, loader))
+            elapsed[loader] += time.perf_counter() - start
+        expected, actual = tracks["gpxpy"], tracks["iterparse"]
+        for key in expected.keys() | actual.keys():
+            if not same(expected.get(key), actual.get(key), options.rel_tol):
+                differences += 1
+                print(f"{os.path.basename(file_name)} {key}: ", end="")
+                print(f"{expected.get(key)!r:.80} != {actual.get(key)!r:.80}")
+
+    for loader, seconds in elapsed.items():
+        print(f"{loader:<10} {len(file_names)} files  {seconds * 1000:8.1f} ms")
+    print(f"speedup: {elapsed['gpxpy'] / max(elapsed['iterparse'], 1e-9):.1f}x")
+    print(f"differences: {differences}")
+    sys.exit(1 if differences else 0)
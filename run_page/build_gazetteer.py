@@ -0,0 +1,163 @@
+"""
+Build the gazetteer of generator.offline_geocoder from the public GeoNames
+dumps (https://download.geonames.org/export/dump/, CC BY 4.0):
+
+    cities1000.zip (or cities500, cities5000, cities15000), unzipped
+    admin1CodesASCII.txt, admin2Codes.txt, countryInfo.txt
+    alternateNamesV2.zip or alternatenames/CN.zip, unzipped (optional,
+    for names in --language instead of English)
+
+Every place becomes one lat,lon,city,province,country row, the city being
+its second level division (the prefecture in China) when there is one.
+"""
+
+import argparse
+import csv
+import os
+
+from generator.offline_geocoder import GAZETTEER_FILE
+
+# columns of the GeoNames cities files
+GEONAME_ID, NAME, LATITUDE, LONGITUDE = 0, 1, 4, 5
+COUNTRY_CODE, ADMIN1_CODE, ADMIN2_CODE = 8, 10, 11
+# column of the geonameid in countryInfo.txt
+COUNTRY_GEONAME_ID = 16
+
+
+def _rows(file_name):
+    with open(file_name, encoding="utf-8") as f:
+        for line in f:
+            if line.startswith("#") or not line.strip():
+                continue
+            yield line.rstrip("\n").split("\t")
+
+
+def read_divisions(file_name):
+    """admin1CodesASCII.txt or admin2Codes.txt -> {code: (geonameid, name)}"""
+    if not os.path.exists(file_name):
+        return {}
+    return {row[0]: (row[3], row[1]) for row in _rows(file_name)}
+
+
+def read_countries(file_name):
+    """countryInfo.txt -> {iso code: (geonameid, name)}"""
+    return {row[0]: (row[COUNTRY_GEONAME_ID], row[4]) for row in _rows(file_name)}
+
+
+def read_alternate_names(file_name, geoname_ids, language):
+    """
+    {geonameid: name in language} from alternateNamesV2.txt for geoname_ids,
+    preferred names first, short, colloquial and historic ones last.
+    """
+    names = {}
+    for row in _rows(file_name):
+        geoname_id, isolanguage, name = row[1], row[2], row[3]
+        if geoname_id not in geoname_ids:
+            continue
+        if isolanguage != language and not isolanguage.startswith(language + "-"):
+            continue
+        flags = row[4:8] + [""] * (8 - len(row))
+        rank = (
+            flags[0] != "1",
+            any(flag == "1" for flag in flags[1:4]),
+            isolanguage != language,
+        )
+        if geoname_id not in names or rank < names[geoname_id][0]:
+            names[geoname_id] = (rank, name)
+    return {geoname_id: name for geoname_id, (_, name) in names.items()}
+
+
+def build_gazetteer(
+    cities_file,
+    admin1_file,
+    admin2_file,
+    countries_file,
+    alternate_names_file=None,
+    language="zh",
+    country_codes=None,
+):
+    """Yield the (lat, lon, city, province, country) rows of the gazetteer"""
+    admin1 = read_divisions(admin1_file)
+    admin2 = read_divisions(admin2_file)
+    countries = read_countries(countries_file)
+
+    places = []
+    for row in _rows(cities_file):
+        country_code = row[COUNTRY_CODE]
+        if country_codes and country_code not in country_codes:
+            continue
+        province = admin1.get(f"{country_code}.{row[ADMIN1_CODE]}")
+        city = admin2.get(f"{country_code}.{row[ADMIN1_CODE]}.{row[ADMIN2_CODE]}")
+        places.append(
+            (
+                float(row[LATITUDE]),
+                float(row[LONGITUDE]),
+                city or (row[GEONAME_ID], row[NAME]),
+                province or (None, ""),
+                countries.get(country_code, (None, country_code)),
+            )
+        )
+
+    translations = {}
+    if alternate_names_file:
+        geoname_ids = {
+            geoname_id
+            for place in places
+            for geoname_id, _ in place[2:]
+            if geoname_id is not None
+        }
+        translations = read_alternate_names(alternate_names_file, geoname_ids, language)
+
+    for lat, lon, *divisions in places:
+        yield (
+            round(lat, 5),
+            round(lon, 5),
+            *(translations.get(geoname_id, name) for geoname_id, name in divisions),
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "geonames_dir", help="directory holding the unzipped GeoNames files"
+    )
+    parser.add_argument(
+        "--cities", default="cities1000.txt", help="cities file in geonames_dir"
+    )
+    parser.add_argument(
+        "--alternate-names",
+        help="alternateNamesV2.txt or a per country file like CN.txt in geonames_dir",
+    )
+    parser.add_argument(
+        "--language", default="zh", help="language of the alternate names"
+    )
+    parser.add_argument(
+        "--countries",
+        nargs="*",
+        help="only keep the places of these ISO country codes, e.g. CN",
+    )
+    parser.add_argument("--output", default=GAZETTEER_FILE)
+    options = parser.parse_args()
+
+    def path(file_name):
+        return os.path.join(options.geonames_dir, file_name)
+
+    rows = build_gazetteer(
+        path(options.cities),
+        path("admin1CodesASCII.txt"),
+        path("admin2Codes.txt"),
+        path("countryInfo.txt"),
+        alternate_names_file=(
+            path(options.alternate_names) if options.alternate_names else None
+        ),
+        language=options.language,
+        country_codes=set(options.countries or ()),
+    )
+    count = 0
+    with open(options.output, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["lat", "lon", "city", "province", "country"])
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    print(f"{count} places written to {options.output}")
@@ -13,7 +13,7 @@ from xml.dom import minidom
 import eviltransform
 import gpxpy
 import numpy as np
-import polyline
+from polyline_codec import encode_points
 import requests
 from config import (
     BASE_TIMEZONE,
@@ -25,7 +25,9 @@ from config import (
     start_point,
 )
 from generator import Generator
+from generator.id_index import get_downloaded_ids
 from tzlocal import get_localzone
+from track_metrics import gpx_elevation_gain
 from utils import adjust_time_to_utc, adjust_timestamp_to_utc, to_date
 
 # struct body
@@ -581,7 +583,7 @@ class Codoon:
         elevation_gain = None
         if run_points_data:
             gpx_data = self.parse_points_to_gpx(run_points_data)
-            elevation_gain = gpx_data.get_uphill_downhill().uphill
+            elevation_gain = gpx_elevation_gain(gpx_data)
             if with_gpx:
                 # pass the track no points
                 if str(log_id) not in old_gpx_ids:
@@ -591,7 +593,7 @@ class Codoon:
         if heart_rate_dict:
             heart_rate = sum(heart_rate_dict.values()) / len(heart_rate_dict)
 
-        polyline_str = polyline.encode(latlng_data) if latlng_data else ""
+        polyline_str = encode_points(latlng_data)
         start_latlng = start_point(*latlng_data[0]) if latlng_data else None
         start_date = self._gt(start_time)
         end_date = self._gt(end_time)
@@ -632,8 +634,7 @@ class Codoon:
     def get_old_tracks(self, old_ids, with_gpx=False, with_tcx=False):
         run_records = self.get_runs_records()
 
-        old_gpx_ids = os.listdir(GPX_FOLDER)
-        old_gpx_ids = [i.split(".")[0] for i in old_gpx_ids if not i.startswith(".")]
+        old_gpx_ids = get_downloaded_ids(GPX_FOLDER)
         new_run_routes = [i for i in run_records if str(i["log_id"]) not in old_ids]
         tracks = []
         for i in new_run_routes:
@@ -683,10 +684,8 @@ if __name__ == "__main__":
         j.login_by_phone()
 
     generator = Generator(SQL_FILE)
-    old_tracks_ids = generator.get_old_tracks_ids()
+    old_tracks_ids = generator.get_known_ids()
     tracks = j.get_old_tracks(old_tracks_ids, options.with_gpx, options.with_tcx)
 
-    generator.sync_from_app(tracks)
-    activities_list = generator.load()
-    with open(JSON_FILE, "w") as f:
-        json.dump(activities_list, f, indent=0)
+    generator.sync_from_app(tracks, source="codoon")
+    generator.export_json(JSON_FILE)
@@ -18,7 +18,12 @@ FOLDER_DICT = {
 }
 SQL_FILE = os.path.join(parent, "run_page", "data.db")
 JSON_FILE = os.path.join(parent, "src", "static", "activities.json")
+# names of the imported data files before the manifest, read once by it
 SYNCED_FILE = os.path.join(parent, "imported.json")
+# imported data files, see synced_data_file_logger.SyncedFileManifest
+SYNCED_MANIFEST_FILE = os.path.join(parent, "imported.db")
+# parsed GPX/TCX/FIT files, see gpxtrackposter.track_loader.TrackCache
+TRACK_CACHE_FILE = os.path.join(parent, "run_page", "track_cache.db")
 
 
 BASE_TIMEZONE = "Asia/Shanghai"
@@ -8,6 +8,7 @@ import aiofiles
 import httpx
 
 from config import JSON_FILE, SQL_FILE, FOLDER_DICT
+from generator.id_index import get_downloaded_ids
 from utils import make_activities_file
 
 COROS_URL_DICT = {
@@ -138,10 +139,6 @@ class Coros:
         return None, None
 
 
-def get_downloaded_ids(folder):
-    return [i.split(".")[0] for i in os.listdir(folder) if not i.startswith(".")]
-
-
 async def download_and_generate(account, password, only_run, file_type):
     folder = FOLDER_DICT[file_type]
     downloaded_ids = get_downloaded_ids(folder)
@@ -153,7 +150,7 @@ async def download_and_generate(account, password, only_run, file_type):
     activity_id_type_dict = dict(zip(activity_ids, activity_types))
     print("activity_ids: ", len(activity_ids))
     print("downloaded_ids: ", len(downloaded_ids))
-    to_generate_coros_ids = list(set(activity_ids) - set(downloaded_ids))
+    to_generate_coros_ids = list(set(activity_ids) - downloaded_ids)
     print("to_generate_activity_ids: ", len(to_generate_coros_ids))
 
     start_time = time.time()
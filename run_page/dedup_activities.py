@@ -0,0 +1,27 @@
+"""
+List the activities stored more than once, from different sources, and with
+--apply remove them, keeping the one of the preferred source, see
+generator.dedup.
+"""
+
+import argparse
+
+from config import JSON_FILE, SQL_FILE
+from generator import Generator
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--apply",
+        action="store_true",
+        help="remove the duplicates, they are only listed without it",
+    )
+    options = parser.parse_args()
+
+    generator = Generator(SQL_FILE)
+    duplicates = generator.dedup(dry_run=not options.apply)
+    for run_id, duplicate_of in duplicates:
+        print(f"{run_id} is a duplicate of {duplicate_of}")
+    print(f"{len(duplicates)} duplicates")
+    if duplicates and options.apply:
+        generator.export_json(JSON_FILE)
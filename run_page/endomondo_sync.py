@@ -8,7 +8,7 @@ import os
 from collections import namedtuple
 from datetime import datetime, timedelta
 
-import polyline
+from polyline_codec import encode_points
 from config import BASE_TIMEZONE, ENDOMONDO_FILE_DIR, JSON_FILE, SQL_FILE
 from generator import Generator
 
@@ -41,7 +41,7 @@ def parse_run_endomondo_to_nametuple(en_dict):
                 # WTF TODO? maybe more points?
                 lat, lon = attr.get("location")[0]
                 location_points.append([lat.get("latitude"), lon.get("longitude")])
-    polyline_str = polyline.encode(location_points) if location_points else ""
+    polyline_str = encode_points(location_points)
     start_latlng = start_point(*location_points[0]) if location_points else None
     start_date = en_dict.get("start_time")
     start_date = datetime.strptime(start_date, "%Y-%m-%d %H:%M:%S.%f")
@@ -99,7 +99,7 @@ def get_all_en_endomondo_json_file(file_dir=ENDOMONDO_FILE_DIR):
 
 def run_enomondo_sync():
     generator = Generator(SQL_FILE)
-    old_tracks_ids = generator.get_old_tracks_ids()
+    old_tracks_ids = generator.get_known_ids()
     json_files_list = get_all_en_endomondo_json_file()
     if not json_files_list:
         raise Exception("No json files found in {}".format(ENDOMONDO_FILE_DIR))
@@ -110,10 +110,8 @@ def run_enomondo_sync():
         en_dict = parse_one_endomondo_json(i)
         track = parse_run_endomondo_to_nametuple(en_dict)
         tracks.append(track)
-    generator.sync_from_app(tracks)
-    activities_list = generator.load()
-    with open(JSON_FILE, "w") as f:
-        json.dump(activities_list, f)
+    generator.sync_from_app(tracks, source="endomondo")
+    generator.export_json(JSON_FILE)
 
 
 if __name__ == "__main__":
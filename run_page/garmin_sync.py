@@ -20,6 +20,7 @@ import garth
 import httpx
 from config import FOLDER_DICT, JSON_FILE, SQL_FILE
 from garmin_device_adaptor import process_garmin_data
+from generator.id_index import get_downloaded_ids
 from utils import make_activities_file
 
 # logging.basicConfig(level=logging.DEBUG)
@@ -323,10 +324,6 @@ async def gather_with_concurrency(n, tasks):
     return await asyncio.gather(*(sem_task(task) for task in tasks))
 
 
-def get_downloaded_ids(folder):
-    return [i.split(".")[0] for i in os.listdir(folder) if not i.startswith(".")]
-
-
 def get_garmin_summary_infos(activity_summary, activity_id):
     garmin_summary_infos = {}
     try:
@@ -439,9 +436,8 @@ if __name__ == "__main__":
         gpx_folder = FOLDER_DICT["gpx"]
         if not os.path.exists(gpx_folder):
             os.mkdir(gpx_folder)
-        downloaded_gpx_ids = get_downloaded_ids(gpx_folder)
-        # merge downloaded_ids:list
-        downloaded_ids = list(set(downloaded_ids + downloaded_gpx_ids))
+        # a fit may have been manually imported as gpx
+        downloaded_ids |= get_downloaded_ids(gpx_folder)
 
     loop = asyncio.get_event_loop()
     future = asyncio.ensure_future(
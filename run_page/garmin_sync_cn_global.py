@@ -43,9 +43,7 @@ if __name__ == "__main__":
     # If the activity is manually imported with a GPX, the GPX file will be synced
 
     # load synced activity list
-    downloaded_fit = get_downloaded_ids(FIT_FOLDER)
-    downloaded_gpx = get_downloaded_ids(GPX_FOLDER)
-    downloaded_activity = list(set(downloaded_fit + downloaded_gpx))
+    downloaded_activity = get_downloaded_ids(FIT_FOLDER, GPX_FOLDER)
 
     folder = FIT_FOLDER
     # make gpx or tcx dir
@@ -13,7 +13,16 @@ from gpxtrackposter import (
     month_of_life_drawer,
     year_summary_drawer,
 )
+from generator.spatial import parse_bbox
 from gpxtrackposter.exceptions import ParameterError, PosterError
+from gpxtrackposter.track import (
+    FIT_LOADER,
+    FIT_LOADERS,
+    GPX_LOADER,
+    GPX_LOADERS,
+    TCX_LOADER,
+    TCX_LOADERS,
+)
 
 # from flopp great repo
 __app_name__ = "create_poster"
@@ -192,6 +201,39 @@ def main():
         help='github svg style; "align-firstday", "align-monday" (default: "align-firstday").',
     )
 
+    args_parser.add_argument(
+        "--bbox",
+        dest="bbox",
+        metavar="MIN_LAT,MIN_LNG,MAX_LAT,MAX_LNG",
+        type=parse_bbox,
+        default=None,
+        help="Only draw the activities crossing this box, needs --from-db",
+    )
+
+    args_parser.add_argument(
+        "--gpx-loader",
+        dest="gpx_loader",
+        choices=GPX_LOADERS,
+        default=GPX_LOADER,
+        help='How GPX files are parsed; "gpxpy", "iterparse" (single pass, same result).',
+    )
+
+    args_parser.add_argument(
+        "--tcx-loader",
+        dest="tcx_loader",
+        choices=TCX_LOADERS,
+        default=TCX_LOADER,
+        help='How TCX files are parsed; "tcxreader", "iterparse" (single pass, same result).',
+    )
+
+    args_parser.add_argument(
+        "--fit-loader",
+        dest="fit_loader",
+        choices=FIT_LOADERS,
+        default=FIT_LOADER,
+        help='How FIT files are decoded; "sdk", "mmap" (only the needed messages, same result).',
+    )
+
     args_parser.add_argument(
         "--sport-type",
         dest="sport_type",
@@ -223,11 +265,19 @@ def main():
 
     loader.special_file_names = args.special
     loader.min_length = args.min_distance * 1000
+    loader.gpx_loader = args.gpx_loader
+    loader.tcx_loader = args.tcx_loader
+    loader.fit_loader = args.fit_loader
 
     if args.from_db:
         # for svg from db here if you want gpx please do not use --from-db
         # args.type == "grid" means have polyline data or not
-        tracks = loader.load_tracks_from_db(SQL_FILE, args.type == "grid")
+        tracks = loader.load_tracks_from_db(
+            SQL_FILE,
+            args.type == "grid",
+            bbox=args.bbox,
+            with_geometry=drawers[args.type].needs_geometry,
+        )
     else:
         tracks = loader.load_tracks(args.gpx_dir)
 
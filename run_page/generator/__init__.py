@@ -9,9 +9,24 @@ from sqlalchemy import func
 
 from polyline_processor import filter_out
 
-from .db import Activity, init_db, update_or_create_activity
-
-from synced_data_file_logger import save_synced_data_file_list
+from .db import (
+    BULK_CHUNK_SIZE,
+    Activity,
+    bulk_update_or_create_activities,
+    init_db,
+)
+from .dedup import dedup_activities
+from .filter_cache import FilterCache, filter_cache_file, refilter_polylines
+from .id_index import get_known_ids
+from .exporter import (
+    export_activities,
+    export_delta,
+    filter_activities,
+    iter_activities,
+)
+from .spatial import activities_in_bbox, activities_near
+
+from synced_data_file_logger import SyncedFileManifest
 
 IGNORE_BEFORE_SAVING = os.getenv("IGNORE_BEFORE_SAVING", False)
 
@@ -20,11 +35,15 @@ class Generator:
     def __init__(self, db_path):
         self.client = stravalib.Client()
         self.session = init_db(db_path)
+        self.filter_cache_file = filter_cache_file(db_path)
 
         self.client_id = ""
         self.client_secret = ""
         self.refresh_token = ""
         self.only_run = False
+        self.bulk_chunk_size = BULK_CHUNK_SIZE
+        # (min_lat, min_lng, max_lat, max_lng), only export activities in it
+        self.bbox = None
 
     def set_strava_config(self, client_id, client_secret, refresh_token):
         self.client_id = client_id
@@ -63,6 +82,7 @@ class Generator:
             else:
                 filters = {"before": datetime.datetime.now(datetime.timezone.utc)}
 
+        strava_activities = []
         for activity in self.client.get_activities(**filters):
             if self.only_run and activity.type != "Run":
                 continue
@@ -74,96 +94,140 @@ class Generator:
             #  strava use total_elevation_gain as elevation_gain
             activity.elevation_gain = activity.total_elevation_gain
             activity.subtype = activity.type
-            created = update_or_create_activity(self.session, activity)
-            if created:
-                sys.stdout.write("+")
-            else:
-                sys.stdout.write(".")
-            sys.stdout.flush()
+            strava_activities.append(activity)
+        self._bulk_sync(strava_activities, source="strava")
         self.session.commit()
 
+    def _bulk_sync(self, run_activities, source=None):
+        created, updated = bulk_update_or_create_activities(
+            self.session,
+            run_activities,
+            chunk_size=self.bulk_chunk_size,
+            source=source,
+        )
+        sys.stdout.write("+" * created + "." * updated)
+        sys.stdout.flush()
+
     def sync_from_data_dir(self, data_dir, file_suffix="gpx", activity_title_dict={}):
         loader = track_loader.TrackLoader()
         tracks = loader.load_tracks(
             data_dir, file_suffix=file_suffix, activity_title_dict=activity_title_dict
         )
+        self._sync_tracks(tracks, data_dir, file_suffix)
+
+    def sync_data_files(self, file_names, file_suffix="gpx"):
+        """Parse and upsert only these files of one data dir, see generator.watch"""
+        if not file_names:
+            return
+        loader = track_loader.TrackLoader()
+        tracks = loader.load_track_files(file_names, file_suffix=file_suffix)
+        self._sync_tracks(tracks, os.path.dirname(file_names[0]), file_suffix)
+
+    def _sync_tracks(self, tracks, data_dir, file_suffix):
         print(f"load {len(tracks)} tracks")
         if not tracks:
             print("No tracks found.")
             return
 
-        synced_files = []
-
-        for t in tracks:
-            created = update_or_create_activity(
-                self.session, t.to_namedtuple(run_from=file_suffix)
-            )
-            if created:
-                sys.stdout.write("+")
-            else:
-                sys.stdout.write(".")
-            synced_files.extend(t.file_names)
-            sys.stdout.flush()
-
-        save_synced_data_file_list(synced_files)
-
+        self._bulk_sync(
+            (t.to_namedtuple(run_from=file_suffix) for t in tracks), source=file_suffix
+        )
         self.session.commit()
 
-    def sync_from_app(self, app_tracks):
+        manifest = SyncedFileManifest()
+        manifest.save(
+            (os.path.join(data_dir, name), file_suffix, t.run_id)
+            for t in tracks
+            for name in t.file_names
+        )
+        manifest.close()
+
+    def sync_from_app(self, app_tracks, source=None):
+        """source: the app, see generator.dedup.DEDUP_SOURCE_PRIORITY"""
         if not app_tracks:
             print("No tracks found.")
             return
         print("Syncing tracks '+' means new track '.' means update tracks")
-        synced_files = []
-        for t in app_tracks:
-            created = update_or_create_activity(self.session, t)
-            if created:
-                sys.stdout.write("+")
-            else:
-                sys.stdout.write(".")
-            if "file_names" in t:
-                synced_files.extend(t.file_names)
-            sys.stdout.flush()
+        self._bulk_sync(app_tracks, source=source)
 
         self.session.commit()
 
+    def dedup(self, dry_run=True):
+        """Find the stored cross-source duplicates, remove them unless dry_run, see generator.dedup"""
+        duplicates = dedup_activities(self.session, dry_run=dry_run)
+        if not dry_run:
+            self.session.commit()
+        return duplicates
+
+    def _iter_activities(self):
+        """Exported activities ordered by start_date_local, with their running streak"""
+        return iter_activities(
+            self.session.connection().connection, self.only_run, bbox=self.bbox
+        )
+
     def load(self):
-        # if sub_type is not in the db, just add an empty string to it
-        query = self.session.query(Activity).filter(Activity.distance > 0.1)
-        if self.only_run:
-            query = query.filter(Activity.type == "Run")
-
-        activities = query.order_by(Activity.start_date_local)
-        activity_list = []
-
-        streak = 0
-        last_date = None
-        for activity in activities:
-            # Determine running streak.
-            date = datetime.datetime.strptime(
-                activity.start_date_local, "%Y-%m-%d %H:%M:%S"  # type: ignore
-            ).date()
-            if last_date is None:
-                streak = 1
-            elif date == last_date:
-                pass
-            elif date == last_date + datetime.timedelta(days=1):
-                streak += 1
-            else:
-                assert date > last_date
-                streak = 1
-            activity.streak = streak  # type: ignore
-            last_date = date
-            if not IGNORE_BEFORE_SAVING:
-                activity.summary_polyline = filter_out(activity.summary_polyline)  # type: ignore
-            activity_list.append(activity.to_dict())
+        cache = FilterCache(self.filter_cache_file)
+        activities = list(
+            filter_activities(
+                self._iter_activities(),
+                ignore_before_saving=IGNORE_BEFORE_SAVING,
+                privacy_filter=cache.filter_out,
+            )
+        )
+        cache.save()
+        cache.close()
+        self.session.commit()
+        return activities
+
+    def export_json(self, json_file, force=False):
+        """
+        Write the activities json file, only re-serializing changed activities.
+        Return the export version, see export_delta.
+        """
+        cache = FilterCache(self.filter_cache_file)
+        version = export_activities(
+            self.session,
+            json_file,
+            ignore_before_saving=IGNORE_BEFORE_SAVING,
+            force=force,
+            privacy_filter=cache.filter_out,
+            only_run=self.only_run,
+            bbox=self.bbox,
+        )
+        cache.save()
+        cache.close()
+        return version
+
+    def refilter_polylines(self, force=False):
+        """
+        Privacy filter the stored polylines again for the current settings,
+        see generator.filter_cache. Return how many were filtered.
+        """
+        return refilter_polylines(self.session, self.filter_cache_file, force=force)
+
+    def export_delta(self, since_version, json_file):
+        return export_delta(self.session, since_version, json_file)
+
+    def activities_in_bbox(self, bbox):
+        """run_ids of the activities crossing (min_lat, min_lng, max_lat, max_lng)"""
+        return activities_in_bbox(self.session, bbox)
+
+    def activities_near(self, lat, lng, radius):
+        """run_ids of the activities passing within radius km of (lat, lng)"""
+        return activities_near(self.session, lat, lng, radius)
 
-        return activity_list
+    def get_known_ids(self, prefix=None):
+        """Set of the run_ids (str) already synced, optionally only the ones starting with prefix"""
+        try:
+            return get_known_ids(self.session, prefix)
+        except Exception as e:
+            # pass the error
+            print(f"something wrong with {str(e)}")
+            return set()
 
     def get_old_tracks_ids(self):
         try:
-            activities = self.session.query(Activity).all()
-            return [str(a.run_id) for a in activities]
+            return [str(run_id) for (run_id,) in self.session.query(Activity.run_id)]
         except Exception as e:
             # pass the error
             print(f"something wrong with {str(e)}")
@@ -1,21 +1,33 @@
 import datetime
+import os
 import random
 import string
 
+from geopy.extra.rate_limiter import RateLimiter
 from geopy.geocoders import options, Nominatim
 from sqlalchemy import (
     Column,
+    Computed,
     Float,
+    Index,
     Integer,
     Interval,
     String,
     create_engine,
+    event,
     inspect,
     text,
 )
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
+from polyline_processor import POLYLINE_LEVELS, simplify_levels
+
+from .dedup import DEDUP, drop_duplicates
+from .offline_geocoder import get_offline_geocoder
+from .spatial import create_rtree, index_activity_bboxes
+
 Base = declarative_base()
 
 
@@ -28,6 +40,28 @@ def randomword():
 options.default_user_agent = "running_page"
 # reverse the location (lat, lon) -> location detail
 g = Nominatim(user_agent=randomword())
+# Nominatim usage policy allows at most one request per second,
+# so every cache miss is queued through this limiter
+reverse_geocode = RateLimiter(
+    g.reverse,
+    min_delay_seconds=1,
+    max_retries=1,
+    error_wait_seconds=2,
+    swallow_exceptions=True,
+)
+
+# decimal places of the lat/lon grid cell used as geocode cache key,
+# 3 is about 110 meters
+GEOCODE_PRECISION = int(os.getenv("GEOCODE_PRECISION", "3"))
+# only use the geocode cache, never call Nominatim (for full rebuilds)
+GEOCODE_CACHE_ONLY = os.getenv("GEOCODE_CACHE_ONLY", "").lower() in ("1", "true", "yes")
+# resolve cache misses with the GAZETTEER_FILE places before asking Nominatim,
+# whenever that file exists (see build_gazetteer.py), 0 to always ask Nominatim
+OFFLINE_GEOCODER = os.getenv("OFFLINE_GEOCODER", "1").lower() in ("1", "true", "yes")
+# WAL lets the exports read while a sync is writing, but the rows written
+# since the last checkpoint only live in the -wal file next to the database,
+# so it is off by default for a database committed to git like data.db
+SQLITE_WAL = os.getenv("SQLITE_WAL", "").lower() in ("1", "true", "yes")
 
 
 ACTIVITY_KEYS = [
@@ -46,6 +80,28 @@ ACTIVITY_KEYS = [
     "elevation_gain",
 ]
 
+# how many rows one INSERT ... ON CONFLICT executemany writes at a time
+BULK_CHUNK_SIZE = 500
+
+# columns refreshed when an already known run_id is synced again,
+# keep the same set as the update branch of update_or_create_activity
+UPSERT_UPDATE_KEYS = [
+    "name",
+    "distance",
+    "moving_time",
+    "elapsed_time",
+    "type",
+    "subtype",
+    "average_heartrate",
+    "average_speed",
+    "elevation_gain",
+    "summary_polyline",
+    "summary_polyline_overview",
+    "summary_polyline_city",
+    "summary_polyline_street",
+    "source",
+]
+
 
 class Activity(Base):
     __tablename__ = "activities"
@@ -61,11 +117,38 @@ class Activity(Base):
     start_date_local = Column(String)
     location_country = Column(String)
     summary_polyline = Column(String)
+    # pre-simplified summary_polyline, see polyline_processor.POLYLINE_LEVELS
+    summary_polyline_overview = Column(String)
+    summary_polyline_city = Column(String)
+    summary_polyline_street = Column(String)
     average_heartrate = Column(Float)
     average_speed = Column(Float)
     elevation_gain = Column(Float)
+    # where the activity was synced from ("strava", "gpx", "keep"...), see
+    # generator.dedup.DEDUP_SOURCE_PRIORITY, None for the older ones
+    source = Column(String)
+    # derived from start_date_local by sqlite, for integer range queries
+    start_date_local_epoch = Column(
+        Integer,
+        Computed("CAST(strftime('%s', start_date_local) AS INTEGER)", persisted=False),
+    )
+    start_year = Column(
+        Integer,
+        Computed("CAST(substr(start_date_local, 1, 4) AS INTEGER)", persisted=False),
+    )
+    start_month = Column(
+        Integer,
+        Computed("CAST(substr(start_date_local, 6, 2) AS INTEGER)", persisted=False),
+    )
     streak = None
 
+    __table_args__ = (
+        Index("ix_activities_start_date_local", "start_date_local"),
+        Index("ix_activities_type_start_date_local", "type", "start_date_local"),
+        Index("ix_activities_distance", "distance"),
+        Index("ix_activities_start_date", "start_date"),
+    )
+
     def to_dict(self):
         out = {}
         for key in ACTIVITY_KEYS:
@@ -81,6 +164,166 @@ class Activity(Base):
         return out
 
 
+class ActivityChange(Base):
+    """Bumped by triggers when a column the export reads changes, see generator.exporter"""
+
+    __tablename__ = "activity_changes"
+
+    run_id = Column(Integer, primary_key=True)
+    version = Column(Integer, index=True)
+
+
+class ExportState(Base):
+    """What the last export wrote for each activity, deleted ones keep a row without content_hash"""
+
+    __tablename__ = "export_state"
+
+    run_id = Column(Integer, primary_key=True)
+    version = Column(Integer, index=True)
+    # activity_changes.version, export settings and streak it was written with
+    source_version = Column(Integer)
+    fingerprint = Column(String)
+    streak = Column(Integer)
+    # sha1 of the json fragment written, the fragment itself is in the file
+    content_hash = Column(String)
+
+
+class DuplicateActivity(Base):
+    """An activity not stored because activity duplicate_of is the same one, see generator.dedup"""
+
+    __tablename__ = "duplicate_activities"
+
+    run_id = Column(Integer, primary_key=True)
+    duplicate_of = Column(Integer, index=True)
+    source = Column(String)
+
+
+class GeocodeCache(Base):
+    __tablename__ = "geocode_cache"
+
+    cell = Column(String, primary_key=True)
+    location_country = Column(String)
+
+
+def geocode_cell(start_point, precision=GEOCODE_PRECISION):
+    return (
+        f"{float(start_point.lat):.{precision}f},{float(start_point.lon):.{precision}f}"
+    )
+
+
+def need_location(run_activity):
+    location_country = getattr(run_activity, "location_country", "")
+    # or China for #176 to fix
+    return run_activity.start_latlng and (
+        not location_country or location_country == "China"
+    )
+
+
+def resolve_locations(session, start_points, cache_only=GEOCODE_CACHE_ONLY):
+    """
+    Resolve {cell: start_point} to {cell: location_country}.
+    Cells are looked up in the geocode cache first, then in the offline
+    gazetteer, the rest go one by one through the rate limited Nominatim
+    reverse and are remembered.
+    """
+    locations = {}
+    cells = list(start_points)
+    for i in range(0, len(cells), BULK_CHUNK_SIZE):
+        query = session.query(GeocodeCache).filter(
+            GeocodeCache.cell.in_(cells[i : i + BULK_CHUNK_SIZE])
+        )
+        locations.update({c.cell: c.location_country for c in query})
+
+    offline_geocoder = get_offline_geocoder() if OFFLINE_GEOCODER else None
+    if offline_geocoder:
+        misses = [cell for cell in start_points if cell not in locations]
+        for cell, location in zip(
+            misses,
+            offline_geocoder.reverse_batch(
+                (float(start_points[c].lat), float(start_points[c].lon)) for c in misses
+            ),
+        ):
+            if location:
+                locations[cell] = location
+    if cache_only:
+        return locations
+
+    for cell, start_point in start_points.items():
+        if cell in locations:
+            continue
+        location = reverse_geocode(
+            f"{start_point.lat}, {start_point.lon}", language="zh-CN"
+        )
+        # do not remember failures, so that they are retried next time
+        if not location:
+            continue
+        locations[cell] = str(location)
+        session.execute(
+            sqlite_insert(GeocodeCache.__table__)
+            .values(cell=cell, location_country=locations[cell])
+            .on_conflict_do_nothing()
+        )
+    return locations
+
+
+def get_elevation_gain(run_activity):
+    # https://github.com/stravalib/stravalib/blob/main/src/stravalib/strava_model.py#L639C1-L643C41
+    if (
+        hasattr(run_activity, "total_elevation_gain")
+        and run_activity.total_elevation_gain is not None
+    ):
+        return float(run_activity.total_elevation_gain)
+    elif (
+        hasattr(run_activity, "elevation_gain")
+        and run_activity.elevation_gain is not None
+    ):
+        return float(run_activity.elevation_gain)
+    return 0.0
+
+
+def get_location_country(session, run_activity):
+    location_country = getattr(run_activity, "location_country", "")
+    if need_location(run_activity):
+        start_point = run_activity.start_latlng
+        cell = geocode_cell(start_point)
+        location_country = resolve_locations(session, {cell: start_point}).get(
+            cell, location_country
+        )
+    return location_country
+
+
+def polyline_level_columns(summary_polyline):
+    return {
+        f"summary_polyline_{level}": level_polyline
+        for level, level_polyline in simplify_levels(summary_polyline).items()
+    }
+
+
+def make_activity_row(run_activity, location_country=None, source=None):
+    """Build the column dict of one activity, as written by the bulk upsert"""
+    row = {
+        "run_id": int(run_activity.id),
+        "name": run_activity.name,
+        "distance": float(run_activity.distance),
+        "moving_time": run_activity.moving_time,
+        "elapsed_time": run_activity.elapsed_time,
+        "type": run_activity.type,
+        "subtype": run_activity.subtype,
+        "start_date": run_activity.start_date,
+        "start_date_local": run_activity.start_date_local,
+        "location_country": location_country,
+        "summary_polyline": (
+            run_activity.map and run_activity.map.summary_polyline or ""
+        ),
+        "average_heartrate": run_activity.average_heartrate,
+        "average_speed": float(run_activity.average_speed),
+        "elevation_gain": get_elevation_gain(run_activity),
+        "source": source,
+    }
+    row.update(polyline_level_columns(row["summary_polyline"]))
+    return row
+
+
 def update_or_create_activity(session, run_activity):
     created = False
     try:
@@ -88,42 +331,10 @@ def update_or_create_activity(session, run_activity):
             session.query(Activity).filter_by(run_id=int(run_activity.id)).first()
         )
 
-        current_elevation_gain = 0.0  # default value
-
-        # https://github.com/stravalib/stravalib/blob/main/src/stravalib/strava_model.py#L639C1-L643C41
-        if (
-            hasattr(run_activity, "total_elevation_gain")
-            and run_activity.total_elevation_gain is not None
-        ):
-            current_elevation_gain = float(run_activity.total_elevation_gain)
-        elif (
-            hasattr(run_activity, "elevation_gain")
-            and run_activity.elevation_gain is not None
-        ):
-            current_elevation_gain = float(run_activity.elevation_gain)
+        current_elevation_gain = get_elevation_gain(run_activity)
 
         if not activity:
-            start_point = run_activity.start_latlng
-            location_country = getattr(run_activity, "location_country", "")
-            # or China for #176 to fix
-            if not location_country and start_point or location_country == "China":
-                try:
-                    location_country = str(
-                        g.reverse(
-                            f"{start_point.lat}, {start_point.lon}", language="zh-CN"  # type: ignore
-                        )
-                    )
-                # limit (only for the first time)
-                except Exception:
-                    try:
-                        location_country = str(
-                            g.reverse(
-                                f"{start_point.lat}, {start_point.lon}",
-                                language="zh-CN",  # type: ignore
-                            )
-                        )
-                    except Exception:
-                        pass
+            location_country = get_location_country(session, run_activity)
 
             activity = Activity(
                 run_id=run_activity.id,
@@ -158,6 +369,11 @@ def update_or_create_activity(session, run_activity):
             activity.summary_polyline = (
                 run_activity.map and run_activity.map.summary_polyline or ""
             )
+        for key, value in polyline_level_columns(activity.summary_polyline).items():
+            setattr(activity, key, value)
+        index_activity_bboxes(
+            session, [(int(run_activity.id), activity.summary_polyline)]
+        )
     except Exception as e:
         print(f"something wrong with {run_activity.id}")
         print(str(e))
@@ -165,34 +381,408 @@ def update_or_create_activity(session, run_activity):
     return created
 
 
-def add_missing_columns(engine, model):
-    inspector = inspect(engine)
-    table_name = model.__tablename__
-    columns = {col["name"] for col in inspector.get_columns(table_name)}
-    missing_columns = []
-
-    for column in model.__table__.columns:
-        if column.name not in columns:
-            missing_columns.append(column)
-    if missing_columns:
-        with engine.connect() as conn:
-            for column in missing_columns:
-                column_type = str(column.type)
-                conn.execute(
-                    text(
-                        f"ALTER TABLE {table_name} ADD COLUMN {column.name} {column_type}"
+def bulk_update_or_create_activities(
+    session, run_activities, chunk_size=BULK_CHUNK_SIZE, source=None
+):
+    """
+    Upsert a batch of activities with as few round trips as possible.
+
+    The known run_ids are fetched in one query, so only new activities go
+    through the location lookup, then every row is written with
+    INSERT ... ON CONFLICT DO UPDATE in chunks of chunk_size.
+    New activities that are the same as an activity of another source are
+    resolved first, see generator.dedup.
+    source: where the activities come from, stored with them.
+    Return the (created, updated) counts.
+    """
+    known_ids = {run_id for (run_id,) in session.query(Activity.run_id)}
+    if DEDUP:
+        run_activities = drop_duplicates(session, run_activities, known_ids, source)
+    created = updated = 0
+    chunk = []
+    for run_activity in run_activities:
+        chunk.append(run_activity)
+        if len(chunk) >= chunk_size:
+            c, u = _upsert_activities_chunk(session, chunk, known_ids, source)
+            created, updated = created + c, updated + u
+            chunk = []
+    if chunk:
+        c, u = _upsert_activities_chunk(session, chunk, known_ids, source)
+        created, updated = created + c, updated + u
+    return created, updated
+
+
+def _upsert_activities_chunk(session, run_activities, known_ids, source=None):
+    new_activities = []
+    old_activities = []
+    for run_activity in run_activities:
+        try:
+            run_id = int(run_activity.id)
+        except Exception as e:
+            print(f"something wrong with {run_activity.id}")
+            print(str(e))
+            continue
+        if run_id in known_ids:
+            old_activities.append(run_activity)
+        else:
+            new_activities.append(run_activity)
+            known_ids.add(run_id)
+
+    # one location lookup per grid cell for the whole chunk
+    start_points = {
+        geocode_cell(a.start_latlng): a.start_latlng
+        for a in new_activities
+        if need_location(a)
+    }
+    locations = resolve_locations(session, start_points) if start_points else {}
+
+    created = updated = 0
+    rows = []
+    for run_activity, is_new in [(a, True) for a in new_activities] + [
+        (a, False) for a in old_activities
+    ]:
+        try:
+            location_country = None
+            if is_new:
+                location_country = getattr(run_activity, "location_country", "")
+                if need_location(run_activity):
+                    location_country = locations.get(
+                        geocode_cell(run_activity.start_latlng), location_country
                     )
-                )
+            rows.append(make_activity_row(run_activity, location_country, source))
+        except Exception as e:
+            print(f"something wrong with {run_activity.id}")
+            print(str(e))
+            continue
+        if is_new:
+            created += 1
+        else:
+            updated += 1
+    if rows:
+        stmt = sqlite_insert(Activity.__table__)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Activity.run_id],
+            set_={key: stmt.excluded[key] for key in UPSERT_UPDATE_KEYS},
+        )
+        session.execute(stmt, rows)
+        index_activity_bboxes(
+            session, ((row["run_id"], row["summary_polyline"]) for row in rows)
+        )
+    return created, updated
+
+
+CHANGE_TRIGGERS = [
+    "activity_changes_insert",
+    "activity_changes_update",
+    "activity_changes_delete",
+]
+
+
+def create_change_triggers(conn):
+    # an upsert, as the conflict clause of the statement firing a trigger
+    # (the bulk upsert) overrides the OR REPLACE of the statements in it
+    bump = (
+        "INSERT INTO activity_changes (run_id, version) "
+        "SELECT NEW.run_id, IFNULL(MAX(version), 0) + 1 FROM activity_changes "
+        "WHERE true ON CONFLICT (run_id) DO UPDATE SET version = excluded.version;"
+    )
+    conn.execute(
+        text(
+            "CREATE TRIGGER IF NOT EXISTS activity_changes_insert "
+            f"AFTER INSERT ON activities BEGIN {bump} END"
+        )
+    )
+    # the bulk upsert sets every column again, only real changes matter
+    changed = " OR ".join(
+        f"OLD.{column} IS NOT NEW.{column}"
+        for column in ACTIVITY_KEYS[1:]
+        + [f"summary_polyline_{level}" for level in POLYLINE_LEVELS]
+    )
+    conn.execute(
+        text(
+            "CREATE TRIGGER IF NOT EXISTS activity_changes_update "
+            f"AFTER UPDATE ON activities WHEN {changed} BEGIN {bump} END"
+        )
+    )
+    conn.execute(
+        text(
+            "CREATE TRIGGER IF NOT EXISTS activity_changes_delete "
+            "AFTER DELETE ON activities BEGIN "
+            "DELETE FROM activity_changes WHERE run_id = OLD.run_id; END"
+        )
+    )
+
+
+def _execute_all(conn, statements):
+    for statement in statements:
+        conn.execute(text(statement))
+
+
+def _add_columns(conn, table_name, columns):
+    """Add the (name, type) columns the table does not have yet"""
+    existing = {col["name"] for col in inspect(conn).get_columns(table_name)}
+    for name, column_type in columns:
+        if name not in existing:
+            conn.execute(
+                text(f"ALTER TABLE {table_name} ADD COLUMN {name} {column_type}")
+            )
+
+
+# The migrations spell out the tables and columns as they were when they were
+# added, so that a later change to the models never changes what an old
+# migration does.
+
+# the activities table of the databases from before the versioned migrations
+LEGACY_ACTIVITY_COLUMNS = [
+    ("run_id", "INTEGER NOT NULL"),
+    ("name", "VARCHAR"),
+    ("distance", "FLOAT"),
+    ("moving_time", "DATETIME"),
+    ("elapsed_time", "DATETIME"),
+    ("type", "VARCHAR"),
+    ("subtype", "VARCHAR"),
+    ("start_date", "VARCHAR"),
+    ("start_date_local", "VARCHAR"),
+    ("location_country", "VARCHAR"),
+    ("summary_polyline", "VARCHAR"),
+    ("average_heartrate", "FLOAT"),
+    ("average_speed", "FLOAT"),
+    ("elevation_gain", "FLOAT"),
+]
+
+
+def _migrate_legacy_schema(conn):
+    """Databases from before the versioned migrations: the activities table and its missing columns"""
+    columns = ", ".join(
+        f"{name} {column_type}" for name, column_type in LEGACY_ACTIVITY_COLUMNS
+    )
+    conn.execute(
+        text(f"CREATE TABLE IF NOT EXISTS activities ({columns}, PRIMARY KEY (run_id))")
+    )
+    _add_columns(conn, "activities", LEGACY_ACTIVITY_COLUMNS)
+
+
+def _migrate_activities_indexes(conn):
+    _execute_all(
+        conn,
+        [
+            "CREATE INDEX IF NOT EXISTS ix_activities_start_date_local "
+            "ON activities (start_date_local)",
+            "CREATE INDEX IF NOT EXISTS ix_activities_type_start_date_local "
+            "ON activities (type, start_date_local)",
+            "CREATE INDEX IF NOT EXISTS ix_activities_distance "
+            "ON activities (distance)",
+        ],
+    )
+
+
+def _migrate_activities_generated_columns(conn):
+    _add_columns(
+        conn,
+        "activities",
+        [
+            (
+                "start_date_local_epoch",
+                "INTEGER GENERATED ALWAYS AS "
+                "(CAST(strftime('%s', start_date_local) AS INTEGER)) VIRTUAL",
+            ),
+            (
+                "start_year",
+                "INTEGER GENERATED ALWAYS AS "
+                "(CAST(substr(start_date_local, 1, 4) AS INTEGER)) VIRTUAL",
+            ),
+            (
+                "start_month",
+                "INTEGER GENERATED ALWAYS AS "
+                "(CAST(substr(start_date_local, 6, 2) AS INTEGER)) VIRTUAL",
+            ),
+        ],
+    )
+
+
+def _migrate_activities_polyline_levels(conn):
+    _add_columns(
+        conn,
+        "activities",
+        [
+            ("summary_polyline_overview", "VARCHAR"),
+            ("summary_polyline_city", "VARCHAR"),
+            ("summary_polyline_street", "VARCHAR"),
+        ],
+    )
+    rows = conn.execute(text("SELECT run_id, summary_polyline FROM activities"))
+    updates = [
+        {"run_id": run_id, **polyline_level_columns(summary_polyline)}
+        for run_id, summary_polyline in rows
+    ]
+    if updates:
+        columns = ", ".join(f"{key} = :{key}" for key in updates[0] if key != "run_id")
+        conn.execute(
+            text(f"UPDATE activities SET {columns} WHERE run_id = :run_id"), updates
+        )
+
+
+def _migrate_activities_rtree(conn):
+    create_rtree(conn)
+    index_activity_bboxes(
+        conn,
+        conn.execute(text("SELECT run_id, summary_polyline FROM activities")).all(),
+    )
+
+
+def _migrate_stats_tables(conn):
+    # the stats tables it made had no readers, _migrate_drop_stats_tables
+    # removes them again
+    pass
+
+
+def _migrate_activities_source(conn):
+    _add_columns(conn, "activities", [("source", "VARCHAR")])
+    _execute_all(
+        conn,
+        [
+            "CREATE TABLE IF NOT EXISTS duplicate_activities ("
+            "run_id INTEGER NOT NULL, duplicate_of INTEGER, source VARCHAR, "
+            "PRIMARY KEY (run_id))",
+            "CREATE INDEX IF NOT EXISTS ix_duplicate_activities_duplicate_of "
+            "ON duplicate_activities (duplicate_of)",
+            "CREATE INDEX IF NOT EXISTS ix_activities_start_date "
+            "ON activities (start_date)",
+        ],
+    )
+
+
+def _migrate_filtered_polylines(conn):
+    conn.execute(
+        text(
+            "CREATE TABLE IF NOT EXISTS filtered_polylines ("
+            "polyline_hash VARCHAR NOT NULL, fingerprint VARCHAR, polyline VARCHAR, "
+            "PRIMARY KEY (polyline_hash))"
+        )
+    )
+
+
+def _migrate_export_changes(conn):
+    # activities without a change row yet count as version 0, their export
+    # state has no source_version so they are all exported once more
+    _execute_all(
+        conn,
+        [
+            "CREATE TABLE IF NOT EXISTS activity_changes ("
+            "run_id INTEGER NOT NULL, version INTEGER, PRIMARY KEY (run_id))",
+            "CREATE INDEX IF NOT EXISTS ix_activity_changes_version "
+            "ON activity_changes (version)",
+            "CREATE TABLE IF NOT EXISTS export_state ("
+            "run_id INTEGER NOT NULL, version INTEGER, PRIMARY KEY (run_id))",
+            "CREATE INDEX IF NOT EXISTS ix_export_state_version "
+            "ON export_state (version)",
+        ],
+    )
+    _add_columns(
+        conn,
+        "export_state",
+        [
+            ("source_version", "INTEGER"),
+            ("fingerprint", "VARCHAR"),
+            ("streak", "INTEGER"),
+            ("activity_json", "VARCHAR"),
+        ],
+    )
+    create_change_triggers(conn)
+
+
+def _migrate_geocode_cache(conn):
+    # made by create_all before the migrations spelled out their tables
+    conn.execute(
+        text(
+            "CREATE TABLE IF NOT EXISTS geocode_cache ("
+            "cell VARCHAR NOT NULL, location_country VARCHAR, PRIMARY KEY (cell))"
+        )
+    )
+
+
+def _migrate_export_state_hashes(conn):
+    # the fragments were a second copy of every activity in the database,
+    # the activities without a hash are all exported once more
+    _add_columns(conn, "export_state", [("content_hash", "VARCHAR")])
+    columns = {col["name"] for col in inspect(conn).get_columns("export_state")}
+    if "activity_json" in columns:
+        conn.execute(text("ALTER TABLE export_state DROP COLUMN activity_json"))
+    # the triggers made before failed on the changes of the bulk upsert
+    for trigger in CHANGE_TRIGGERS:
+        conn.execute(text(f"DROP TRIGGER IF EXISTS {trigger}"))
+    create_change_triggers(conn)
+
+
+def _migrate_drop_filtered_polylines(conn):
+    # the filter cache has its own file now, see generator.filter_cache
+    conn.execute(text("DROP TABLE IF EXISTS filtered_polylines"))
+
+
+# made by the stats tables migration
+STATS_TRIGGERS = ["stats_dirty_insert", "stats_dirty_delete", "stats_dirty_update"]
+STATS_TABLES = [
+    "daily_stats",
+    "weekly_stats",
+    "monthly_stats",
+    "yearly_stats",
+    "stats_dirty",
+]
+
+
+def _migrate_drop_stats_tables(conn):
+    _execute_all(
+        conn,
+        [f"DROP TRIGGER IF EXISTS {trigger}" for trigger in STATS_TRIGGERS]
+        + [f"DROP TABLE IF EXISTS {table_name}" for table_name in STATS_TABLES],
+    )
+
+
+# PRAGMA user_version of a database is how many of them were applied,
+# only append to this list, never change or reorder released migrations
+MIGRATIONS = [
+    _migrate_legacy_schema,
+    _migrate_activities_indexes,
+    _migrate_activities_generated_columns,
+    _migrate_activities_polyline_levels,
+    _migrate_activities_rtree,
+    _migrate_stats_tables,
+    _migrate_activities_source,
+    _migrate_filtered_polylines,
+    _migrate_export_changes,
+    _migrate_geocode_cache,
+    _migrate_export_state_hashes,
+    _migrate_drop_filtered_polylines,
+    _migrate_drop_stats_tables,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def migrate_db(engine):
+    with engine.begin() as conn:
+        version = conn.exec_driver_sql("PRAGMA user_version").scalar()
+        if version >= SCHEMA_VERSION:
+            return
+        # a new database goes through all of them to get its tables
+        for migration in MIGRATIONS[version:]:
+            migration(conn)
+        conn.exec_driver_sql(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+
+def _set_sqlite_pragma(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    # the journal mode is stored in the file, so a database switched to WAL
+    # before goes back to a rollback journal without SQLITE_WAL
+    cursor.execute(f"PRAGMA journal_mode={'WAL' if SQLITE_WAL else 'DELETE'}")
+    cursor.close()
 
 
 def init_db(db_path):
     engine = create_engine(
         f"sqlite:///{db_path}", connect_args={"check_same_thread": False}
     )
-    Base.metadata.create_all(engine)
-
-    # check missing columns
-    add_missing_columns(engine, Activity)
+    event.listen(engine, "connect", _set_sqlite_pragma)
+    migrate_db(engine)
 
     sm = sessionmaker(bind=engine)
     session = sm()
@@ -0,0 +1,273 @@
+"""
+Cross-source duplicate activities.
+
+The same run often arrives from several sources (a FIT file, its Strava
+copy, a Keep record), each with its own run_id. Two activities are the same
+run when they start within DEDUP_WINDOW seconds, their distances differ by
+at most DEDUP_DISTANCE_RATIO and their start points are at most
+DEDUP_START_DISTANCE km apart (when both have one).
+
+DuplicateIndex keeps activities in buckets of DEDUP_WINDOW seconds of their
+start (UTC), so an activity is only compared with the ones of its bucket and
+the two next to it. Of two duplicates the source first in
+DEDUP_SOURCE_PRIORITY is kept, then the longer one, then the one stored
+first. The other one is deleted (or not stored) and remembered in
+duplicate_activities, so it is not stored again on the next sync.
+
+A sync only drops duplicates with DEDUP=1, dedup_activities.py lists the
+stored ones and only removes them with --apply.
+"""
+
+import datetime
+import math
+import os
+from collections import defaultdict, namedtuple
+
+from haversine import haversine
+from polyline_codec import first_point
+from sqlalchemy import text
+
+# drop the duplicates while syncing, off by default as it deletes stored activities
+DEDUP = os.getenv("DEDUP", "").lower() in ("1", "true", "yes")
+DEDUP_WINDOW = int(os.getenv("DEDUP_WINDOW", "120"))
+DEDUP_DISTANCE_RATIO = float(os.getenv("DEDUP_DISTANCE_RATIO", "0.1"))
+DEDUP_START_DISTANCE = float(os.getenv("DEDUP_START_DISTANCE", "0.5"))
+# the sources to keep first, the ones not listed (and None) come last
+DEDUP_SOURCE_PRIORITY = os.getenv(
+    "DEDUP_SOURCE_PRIORITY",
+    "fit,tcx,gpx,strava,keep,joyrun,codoon,oppo,nike,tulipsport,endomondo",
+).split(",")
+
+EPOCH = datetime.datetime(1970, 1, 1)
+# enough characters of an encoded polyline for its first point
+FIRST_POINT_CHARS = 32
+
+DedupEntry = namedtuple("DedupEntry", "run_id source start distance start_point")
+
+
+def _timestamp(start_date):
+    """UTC seconds of a start_date (str or datetime), None if it is not a date"""
+    try:
+        if not isinstance(start_date, datetime.datetime):
+            start_date = datetime.datetime.fromisoformat(str(start_date))
+    except ValueError:
+        return None
+    if start_date.tzinfo is not None:
+        start_date = start_date.astimezone(datetime.UTC).replace(tzinfo=None)
+    return (start_date - EPOCH).total_seconds()
+
+
+def _source_rank(source):
+    try:
+        return DEDUP_SOURCE_PRIORITY.index(source)
+    except ValueError:
+        return len(DEDUP_SOURCE_PRIORITY)
+
+
+def wins(entry, other):
+    """entry is kept over its duplicate other, which is kept on a tie"""
+    return (_source_rank(entry.source), -(entry.distance or 0)) < (
+        _source_rank(other.source),
+        -(other.distance or 0),
+    )
+
+
+class DuplicateIndex:
+    """
+    DedupEntry by start time bucket.
+    distance_ratio, start_distance: None to not compare distances or start points.
+    """
+
+    def __init__(
+        self,
+        window=DEDUP_WINDOW,
+        distance_ratio=DEDUP_DISTANCE_RATIO,
+        start_distance=DEDUP_START_DISTANCE,
+    ):
+        self.window = window
+        self.distance_ratio = distance_ratio
+        self.start_distance = start_distance
+        self.buckets = defaultdict(list)
+
+    def _bucket(self, entry):
+        return math.floor(entry.start / self.window)
+
+    def add(self, entry):
+        self.buckets[self._bucket(entry)].append(entry)
+
+    def remove(self, entry):
+        self.buckets[self._bucket(entry)].remove(entry)
+
+    def same_activity(self, entry, other):
+        if entry.run_id == other.run_id or abs(entry.start - other.start) > self.window:
+            return False
+        if self.distance_ratio is not None and entry.distance and other.distance:
+            difference = abs(entry.distance - other.distance)
+            if difference > self.distance_ratio * max(entry.distance, other.distance):
+                return False
+        return not (
+            self.start_distance is not None
+            and entry.start_point
+            and other.start_point
+            and haversine(entry.start_point, other.start_point) > self.start_distance
+        )
+
+    def find(self, entry):
+        """The indexed duplicate of entry starting closest to it, None if there is none"""
+        bucket = self._bucket(entry)
+        matches = [
+            other
+            for b in (bucket - 1, bucket, bucket + 1)
+            for other in self.buckets.get(b, ())
+            if self.same_activity(entry, other)
+        ]
+        return min(matches, key=lambda o: abs(o.start - entry.start), default=None)
+
+
+def _stored_entries(conn, start=None, end=None):
+    """DedupEntry of the stored activities, starting between start and end (str)"""
+    sql = (
+        "SELECT run_id, source, start_date, distance, "
+        f"substr(summary_polyline, 1, {FIRST_POINT_CHARS}) FROM activities"
+    )
+    params = {}
+    if start is not None:
+        sql += " WHERE start_date >= :start AND start_date < :end"
+        params = {"start": start, "end": end}
+    entries = []
+    for run_id, source, start_date, distance, polyline_start in conn.execute(
+        text(sql + " ORDER BY start_date, run_id"), params
+    ):
+        timestamp = _timestamp(start_date)
+        if timestamp is not None:
+            entries.append(
+                DedupEntry(
+                    run_id, source, timestamp, distance, first_point(polyline_start)
+                )
+            )
+    return entries
+
+
+def _date_str(timestamp):
+    return (EPOCH + datetime.timedelta(seconds=timestamp)).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _record_duplicate(conn, loser, winner):
+    conn.execute(
+        text(
+            "INSERT OR REPLACE INTO duplicate_activities (run_id, duplicate_of, source) "
+            "VALUES (:run_id, :duplicate_of, :source)"
+        ),
+        {"run_id": loser.run_id, "duplicate_of": winner.run_id, "source": loser.source},
+    )
+    conn.execute(
+        text(
+            "UPDATE duplicate_activities SET duplicate_of = :winner "
+            "WHERE duplicate_of = :loser"
+        ),
+        {"winner": winner.run_id, "loser": loser.run_id},
+    )
+
+
+def _delete_activity(conn, run_id):
+    conn.execute(
+        text("DELETE FROM activities WHERE run_id = :run_id"), {"run_id": run_id}
+    )
+
+
+def _activity_entry(run_activity, source):
+    timestamp = _timestamp(run_activity.start_date)
+    if timestamp is None:
+        return None
+    summary_polyline = run_activity.map and run_activity.map.summary_polyline
+    return DedupEntry(
+        int(run_activity.id),
+        source,
+        timestamp,
+        float(run_activity.distance or 0),
+        first_point(summary_polyline),
+    )
+
+
+def drop_duplicates(session, run_activities, known_ids, source=None):
+    """
+    The run_activities to upsert: updates of known run_ids, and the new ones
+    that are not the duplicate of a better activity. A stored activity a new
+    one wins over is deleted and removed from known_ids.
+    """
+    duplicate_ids = {
+        run_id
+        for (run_id,) in session.execute(
+            text("SELECT run_id FROM duplicate_activities")
+        )
+    }
+    kept = {}
+    entries = []
+    for run_activity in run_activities:
+        try:
+            run_id = int(run_activity.id)
+            entry = (
+                None if run_id in known_ids else _activity_entry(run_activity, source)
+            )
+        except (TypeError, ValueError):
+            # not a valid activity, the upsert reports it
+            run_id, entry = id(run_activity), None
+        if run_id in duplicate_ids:
+            continue
+        kept[run_id] = run_activity
+        if entry is not None:
+            entries.append(entry)
+    if not entries:
+        return list(kept.values())
+
+    index = DuplicateIndex()
+    for stored in _stored_entries(
+        session,
+        _date_str(min(e.start for e in entries) - index.window),
+        _date_str(max(e.start for e in entries) + index.window + 1),
+    ):
+        index.add(stored)
+    for entry in entries:
+        match = index.find(entry)
+        if match is None:
+            index.add(entry)
+            continue
+        if wins(entry, match):
+            winner, loser = entry, match
+            index.remove(match)
+            index.add(entry)
+            if match.run_id in known_ids:
+                _delete_activity(session, match.run_id)
+                known_ids.discard(match.run_id)
+            else:
+                del kept[match.run_id]
+        else:
+            winner, loser = match, entry
+            del kept[entry.run_id]
+        _record_duplicate(session, loser, winner)
+        print(f"{loser.run_id} ({loser.source}) is a duplicate of {winner.run_id}")
+    return list(kept.values())
+
+
+def dedup_activities(session, dry_run=True):
+    """
+    Find the duplicates already stored, one pass over all activities, and
+    remove them unless dry_run. Return the (duplicate run_id, kept run_id) pairs.
+    """
+    index = DuplicateIndex()
+    duplicates = []
+    for entry in _stored_entries(session):
+        match = index.find(entry)
+        if match is None:
+            index.add(entry)
+            continue
+        winner, loser = (entry, match) if wins(entry, match) else (match, entry)
+        if loser is match:
+            index.remove(match)
+            index.add(entry)
+        duplicates.append((loser, winner))
+    if not dry_run:
+        for loser, winner in duplicates:
+            _delete_activity(session, loser.run_id)
+            _record_duplicate(session, loser, winner)
+    return [(loser.run_id, winner.run_id) for loser, winner in duplicates]
@@ -0,0 +1,447 @@
+"""
+Fast activities export and incremental activities.json export.
+
+Activities are read as plain tuples from a DB-API cursor, so no ORM object or
+datetime is built per row, and streamed into the json array.
+
+For the incremental export, triggers bump the activity_changes version of an
+activity whenever a column the export reads changes (see generator.db), and
+export_state keeps the sha1 of the json fragment every activity was last
+exported as, with the change version, export settings and streak it was
+written with and the export version that last changed it. An export reads
+run_id, day and those versions for the exported activities (a streak depends
+on the days before it), and only reads, filters and serializes the activities
+whose state is behind, or whose fragment in the file is not the one exported.
+The other fragments are taken from the file itself, which is rewritten from
+the first fragment that changed (mostly the new activities at its end) and is
+identical to json.dump(Generator.load()).
+"""
+
+import datetime
+import hashlib
+import json
+import os
+
+from polyline_processor import filter_fingerprint, filter_out, pick_polyline_level
+from sqlalchemy import func, text
+
+from .db import ACTIVITY_KEYS, ExportState
+from .spatial import bbox_filter_sql
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Interval columns are stored by sqlalchemy as a datetime since the epoch
+EPOCH = datetime.datetime(1970, 1, 1)
+
+# finest detail (meters) the activities.json polylines need to keep, the
+# coarsest stored polyline level within it is exported, 0 (default) exports
+# the full polylines
+EXPORT_POLYLINE_RESOLUTION = float(os.getenv("EXPORT_POLYLINE_RESOLUTION", "0"))
+
+
+# julian day number of the local start day, consecutive days differ by one
+DAY_SQL = "CAST(julianday(substr({0}start_date_local, 1, 10)) AS INTEGER)"
+
+# how many activities one changed rows query reads at a time
+EXPORT_CHUNK_SIZE = 500
+
+
+def _conditions(only_run=False, bbox=None, table=""):
+    """table: "a." when activities is aliased in a join"""
+    conditions = [f"{table}distance > 0.1"]
+    params = {}
+    if only_run:
+        conditions.append(f"{table}type = 'Run'")
+    if bbox:
+        bbox_sql, params = bbox_filter_sql(bbox, column=f"{table}run_id")
+        conditions.append(bbox_sql)
+    return conditions, params
+
+
+def _activities_sql(
+    only_run=False, resolution=EXPORT_POLYLINE_RESOLUTION, bbox=None, run_ids=None
+):
+    """run_ids: only these activities, still with the other conditions"""
+    level = pick_polyline_level(resolution)
+    columns = [
+        (
+            f"COALESCE(summary_polyline_{level}, summary_polyline)"
+            if key == "summary_polyline" and level
+            else key
+        )
+        for key in ACTIVITY_KEYS
+    ]
+    conditions, params = _conditions(only_run, bbox)
+    if run_ids is not None:
+        params = dict(params)
+        for i, run_id in enumerate(run_ids):
+            params[f"run_id_{i}"] = run_id
+        ids = ", ".join(f":run_id_{i}" for i in range(len(run_ids)))
+        conditions.append(f"run_id IN ({ids})")
+    sql = f"""
+SELECT {", ".join(columns)}, {DAY_SQL.format("")}
+FROM activities
+WHERE {" AND ".join(conditions)}
+ORDER BY start_date_local, run_id
+"""
+    return sql, params
+
+
+def _next_streak(streak, last_day, day):
+    """Running streak of an activity on day, after one on last_day with streak"""
+    if last_day is None or day is None:
+        return 1
+    if day == last_day:
+        return streak
+    if day == last_day + 1:
+        return streak + 1
+    return 1
+
+
+def interval_to_str(value):
+    """Same as str(timedelta) of a stored Interval, e.g. 1970-01-01 00:18:49.000000 -> 0:18:49"""
+    if value is None:
+        return None
+    if value.startswith("1970-01-01 ") and value.endswith(".000000"):
+        return f"{int(value[11:13])}{value[13:19]}"
+    return str(datetime.datetime.fromisoformat(value) - EPOCH)
+
+
+def iter_activities(
+    connection, only_run=False, resolution=EXPORT_POLYLINE_RESOLUTION, bbox=None
+):
+    """
+    Yield the exported activities as dicts (summary_polyline not filtered yet),
+    ordered by start_date_local with their running streak.
+    connection: a DB-API connection, sqlite3 or session.connection().connection
+    resolution: see EXPORT_POLYLINE_RESOLUTION
+    bbox: (min_lat, min_lng, max_lat, max_lng), only activities whose track
+    box intersects it, see generator.spatial
+    """
+    cursor = connection.cursor()
+    cursor.execute(*_activities_sql(only_run, resolution, bbox))
+    streak = 0
+    last_day = None
+    for row in cursor:
+        day = row[-1]
+        streak = _next_streak(streak, last_day, day)
+        last_day = day
+        yield _activity(row, streak)
+
+
+def _activity(row, streak):
+    activity = dict(zip(ACTIVITY_KEYS, row))
+    activity["moving_time"] = interval_to_str(activity["moving_time"])
+    activity["streak"] = streak
+    return activity
+
+
+def filter_activities(
+    activities, ignore_before_saving=False, privacy_filter=filter_out
+):
+    """privacy_filter: filter_out, or the one of a generator.filter_cache.FilterCache"""
+    for activity in activities:
+        if not ignore_before_saving:
+            activity["summary_polyline"] = privacy_filter(activity["summary_polyline"])
+        yield activity
+
+
+def dumps(activity, fast=False, ensure_ascii=True):
+    # orjson never escapes non-ASCII characters
+    if fast and not ensure_ascii and orjson is not None:
+        return orjson.dumps(activity).decode("utf-8")
+    return json.dumps(activity, ensure_ascii=ensure_ascii)
+
+
+def write_activities_json(activities, f, fast=False, ensure_ascii=True):
+    """Stream activities into f as one json array, return how many were written"""
+    count = 0
+    f.write("[")
+    for activity in activities:
+        if count:
+            f.write(", ")
+        f.write(dumps(activity, fast, ensure_ascii))
+        count += 1
+    f.write("]")
+    return count
+
+
+def export_fingerprint(
+    ignore_before_saving=False, resolution=EXPORT_POLYLINE_RESOLUTION
+):
+    """sha1 of the settings an exported fragment depends on besides its row"""
+    settings = (
+        f"{bool(ignore_before_saving)}{filter_fingerprint()}"
+        f"{pick_polyline_level(resolution)}"
+    )
+    return hashlib.sha1(settings.encode("utf-8")).hexdigest()
+
+
+def _export_scan(cursor, fingerprint, only_run=False, bbox=None):
+    """
+    (run_id, streak, change version, stale) of the exported activities in
+    export order, stale when export_state is behind activity_changes, was
+    written with other settings or with another streak
+    """
+    conditions, params = _conditions(only_run, bbox, table="a.")
+    cursor.execute(
+        f"""
+SELECT a.run_id, {DAY_SQL.format("a.")}, IFNULL(c.version, 0),
+       s.source_version IS NOT IFNULL(c.version, 0)
+       OR s.fingerprint IS NOT :fingerprint,
+       s.streak
+FROM activities a
+LEFT JOIN activity_changes c ON c.run_id = a.run_id
+LEFT JOIN export_state s ON s.run_id = a.run_id
+WHERE {" AND ".join(conditions)}
+ORDER BY a.start_date_local, a.run_id
+""",
+        {**params, "fingerprint": fingerprint},
+    )
+    streak = 0
+    last_day = None
+    for run_id, day, change_version, stale, stored_streak in cursor.fetchall():
+        streak = _next_streak(streak, last_day, day)
+        last_day = day
+        yield run_id, streak, change_version, bool(stale) or stored_streak != streak
+
+
+def _read_activities(cursor, streaks, only_run, resolution, bbox):
+    """The activities of streaks (run_id -> streak) as iter_activities yields them"""
+    run_ids = list(streaks)
+    for i in range(0, len(run_ids), EXPORT_CHUNK_SIZE):
+        chunk = run_ids[i : i + EXPORT_CHUNK_SIZE]
+        cursor.execute(*_activities_sql(only_run, resolution, bbox, chunk))
+        for row in cursor.fetchall():
+            yield _activity(row, streaks[row[0]])
+
+
+def content_hash(fragment):
+    return hashlib.sha1(fragment.encode("utf-8")).hexdigest()
+
+
+def read_fragments(json_file):
+    """
+    The activities of an exported json file as (run_id, start, end) of their
+    text in it, with the text, None when the file is missing or not an array
+    of activities.
+    """
+    try:
+        with open(json_file, encoding="utf-8") as f:
+            content = f.read()
+    except (OSError, UnicodeDecodeError):
+        return None
+    decoder = json.JSONDecoder()
+    fragments = []
+    position = content.find("[") + 1
+    try:
+        while True:
+            while content[position] in " \t\r\n,":
+                position += 1
+            if content[position] == "]":
+                return fragments, content
+            activity, end = decoder.raw_decode(content, position)
+            fragments.append((activity["run_id"], position, end))
+            position = end
+    except (IndexError, KeyError, TypeError, ValueError):
+        return None
+
+
+def _splice(json_file, content, file_fragments, fragments):
+    """
+    Rewrite json_file from the first activity that differs from content,
+    the text it has with file_fragments (see read_fragments), to have the
+    (run_id, fragment) fragments. Return False when nothing differs.
+    """
+    i = 0
+    for (run_id, start, end), (new_run_id, fragment) in zip(file_fragments, fragments):
+        if run_id != new_run_id or content[start:end] != fragment:
+            break
+        i += 1
+    if i == len(fragments) == len(file_fragments):
+        return False
+    if i:
+        offset = file_fragments[i - 1][2]
+        tail = "".join(f", {fragment}" for _, fragment in fragments[i:]) + "]"
+    else:
+        offset = content.find("[") + 1
+        tail = ", ".join(fragment for _, fragment in fragments) + "]"
+    with open(json_file, "r+b") as f:
+        f.seek(len(content[:offset].encode("utf-8")))
+        f.write(tail.encode("utf-8"))
+        f.truncate()
+    return True
+
+
+def _write(json_file, fragments):
+    # write aside and rename, so a reader never sees a half written file
+    tmp_file = f"{json_file}.tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        f.write("[" + ", ".join(fragment for _, fragment in fragments) + "]")
+    os.replace(tmp_file, json_file)
+
+
+def export_activities(
+    session,
+    json_file,
+    ignore_before_saving=False,
+    force=False,
+    privacy_filter=filter_out,
+    only_run=False,
+    bbox=None,
+    resolution=EXPORT_POLYLINE_RESOLUTION,
+):
+    """
+    privacy_filter: see filter_activities
+    only_run, resolution, bbox: see iter_activities
+
+    Write json_file and return the new export version, or the current one
+    when nothing changed since the last export.
+    """
+    fingerprint = export_fingerprint(ignore_before_saving, resolution)
+    cursor = session.connection().connection.cursor()
+    cursor.execute("SELECT MAX(version) FROM export_state")
+    version = (cursor.fetchone()[0] or 0) + 1
+    cursor.execute(
+        "SELECT run_id, content_hash FROM export_state WHERE content_hash IS NOT NULL"
+    )
+    hashes = dict(cursor.fetchall())
+
+    order = []
+    streaks = {}
+    change_versions = {}
+    stale = set()
+    for run_id, streak, change_version, is_stale in _export_scan(
+        cursor, fingerprint, only_run, bbox
+    ):
+        order.append(run_id)
+        streaks[run_id] = streak
+        change_versions[run_id] = change_version
+        if is_stale:
+            stale.add(run_id)
+    exported_ids = set(order)
+    deleted = [run_id for run_id in hashes if run_id not in exported_ids]
+    if not (stale or deleted or force) and os.path.exists(json_file):
+        return version - 1
+
+    read = None if force else read_fragments(json_file)
+    if read is None:
+        file_fragments, content = [], ""
+        reread = set(order)
+    else:
+        file_fragments, content = read
+        texts = {run_id: content[start:end] for run_id, start, end in file_fragments}
+        # the activities the file does not have as they were exported are
+        # read again as well
+        reread = stale | {
+            run_id
+            for run_id in order
+            if run_id not in texts or content_hash(texts[run_id]) != hashes.get(run_id)
+        }
+
+    activities = filter_activities(
+        _read_activities(
+            cursor,
+            {run_id: streaks[run_id] for run_id in order if run_id in reread},
+            only_run,
+            resolution,
+            bbox,
+        ),
+        ignore_before_saving=ignore_before_saving,
+        privacy_filter=privacy_filter,
+    )
+    new_texts = {activity["run_id"]: json.dumps(activity) for activity in activities}
+    states = [
+        {
+            "run_id": run_id,
+            "source_version": change_versions[run_id],
+            "fingerprint": fingerprint,
+            "streak": streaks[run_id],
+            "content_hash": content_hash(fragment),
+        }
+        for run_id, fragment in new_texts.items()
+    ]
+    updated = [
+        state
+        for state in states
+        if state["content_hash"] != hashes.get(state["run_id"])
+    ]
+    if updated:
+        session.execute(
+            text(
+                "INSERT OR REPLACE INTO export_state "
+                "(run_id, version, source_version, fingerprint, streak, content_hash) "
+                "VALUES (:run_id, :version, :source_version, :fingerprint, :streak, "
+                ":content_hash)"
+            ),
+            [{**state, "version": version} for state in updated],
+        )
+    updated_ids = {state["run_id"] for state in updated}
+    if len(updated) < len(states):
+        # exported as they were, only the state they were made from changed
+        session.execute(
+            text(
+                "UPDATE export_state SET source_version = :source_version, "
+                "fingerprint = :fingerprint, streak = :streak WHERE run_id = :run_id"
+            ),
+            [state for state in states if state["run_id"] not in updated_ids],
+        )
+    if deleted:
+        session.execute(
+            text(
+                "UPDATE export_state SET version = :version, source_version = NULL, "
+                "fingerprint = NULL, streak = NULL, content_hash = NULL "
+                "WHERE run_id = :run_id"
+            ),
+            [{"run_id": run_id, "version": version} for run_id in deleted],
+        )
+    session.commit()
+
+    fragments = [
+        (run_id, new_texts[run_id] if run_id in new_texts else texts[run_id])
+        for run_id in order
+    ]
+    if read is None:
+        _write(json_file, fragments)
+    else:
+        _splice(json_file, content, file_fragments, fragments)
+    return version if updated or deleted else version - 1
+
+
+def export_delta(session, since_version, json_file):
+    """
+    Changes made by the exports after since_version, to update a client in
+    place, the updated activities as json_file has them
+    """
+    version = session.query(func.max(ExportState.version)).scalar() or 0
+    states = (
+        session.query(ExportState.run_id, ExportState.content_hash)
+        .filter(ExportState.version > since_version)
+        .order_by(ExportState.run_id)
+        .all()
+    )
+    deleted = [run_id for run_id, fragment_hash in states if fragment_hash is None]
+    updated_ids = {run_id for run_id, fragment_hash in states if fragment_hash}
+    updated = []
+    if updated_ids:
+        read = read_fragments(json_file)
+        if read is None:
+            raise ValueError(f"{json_file} is not an exported activities file")
+        file_fragments, content = read
+        updated = sorted(
+            (
+                json.loads(content[start:end])
+                for run_id, start, end in file_fragments
+                if run_id in updated_ids
+            ),
+            key=lambda activity: activity["run_id"],
+        )
+    return {
+        "version": version,
+        "since_version": since_version,
+        "updated": updated,
+        "deleted": deleted,
+    }
@@ -0,0 +1,150 @@
+"""
+Privacy filtered polylines kept next to the database.
+
+filter_out only depends on the polyline and the privacy settings
+(polyline_processor.filter_fingerprint), so its output is stored in
+filtered_polylines by sha1 of the source polyline, next to a sha1 of the
+settings it was made with. A polyline is only filtered again when it is new
+or changed, or when the settings changed; refilter_polylines redoes every
+stored polyline at once after a settings change.
+
+The cache is a file of its own (filter_cache_file), not a table of the
+database, which is committed to git and would hold every polyline twice.
+"""
+
+import hashlib
+import os
+import sqlite3
+
+from polyline_processor import POLYLINE_LEVELS, filter_fingerprint, filter_out
+from sqlalchemy import text
+
+FILTER_CACHE_FILE_NAME = "filter_cache.db"
+FILTER_TABLE = "filtered_polylines"
+POLYLINE_COLUMNS = ["summary_polyline"] + [
+    f"summary_polyline_{level}" for level in POLYLINE_LEVELS
+]
+
+
+def _sha1(value):
+    return hashlib.sha1(value.encode("utf-8")).hexdigest()
+
+
+def settings_hash():
+    """sha1 of the privacy settings, the whole fingerprint holds IGNORE_POLYLINE"""
+    return _sha1(filter_fingerprint())
+
+
+def filter_cache_file(db_path):
+    """The filter cache of the database at db_path, in the same directory"""
+    return os.path.join(
+        os.path.dirname(os.path.abspath(db_path)), FILTER_CACHE_FILE_NAME
+    )
+
+
+class FilterCache:
+    """
+    filter_out through filtered_polylines. The polylines filtered with the
+    current settings are all read at once, the ones filtered here are written
+    by save.
+    """
+
+    def __init__(self, file_name):
+        self.conn = sqlite3.connect(file_name)
+        self.conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {FILTER_TABLE} ("
+            "polyline_hash TEXT PRIMARY KEY, fingerprint TEXT, polyline TEXT)"
+        )
+        self.fingerprint = settings_hash()
+        # polyline sha1 -> filtered polyline (None when nothing is left)
+        self.filtered = dict(
+            self.conn.execute(
+                f"SELECT polyline_hash, polyline FROM {FILTER_TABLE} "
+                "WHERE fingerprint = ?",
+                (self.fingerprint,),
+            )
+        )
+        self.new = {}
+
+    def filter_out(self, polyline_str):
+        if not polyline_str:
+            return filter_out(polyline_str)
+        polyline_hash = _sha1(polyline_str)
+        if polyline_hash not in self.filtered:
+            filtered = filter_out(polyline_str)
+            self.filtered[polyline_hash] = self.new[polyline_hash] = filtered
+        return self.filtered[polyline_hash]
+
+    def update(self, polylines):
+        """
+        Filter the polylines not filtered with these settings yet and save
+        them, return how many were filtered
+        """
+        for polyline_str in polylines:
+            self.filter_out(polyline_str)
+        count = len(self.new)
+        self.save()
+        return count
+
+    def save(self):
+        """Write the polylines filtered since the last save"""
+        if not self.new:
+            return
+        self.conn.executemany(
+            f"INSERT OR REPLACE INTO {FILTER_TABLE} "
+            "(polyline_hash, fingerprint, polyline) VALUES (?, ?, ?)",
+            [
+                (polyline_hash, self.fingerprint, polyline)
+                for polyline_hash, polyline in self.new.items()
+            ],
+        )
+        self.conn.commit()
+        self.new = {}
+
+    def forget(self, polyline_hashes=None):
+        """Delete the polylines of polyline_hashes, all of them for None"""
+        if polyline_hashes is None:
+            self.conn.execute(f"DELETE FROM {FILTER_TABLE}")
+            self.filtered = {}
+        else:
+            self.conn.executemany(
+                f"DELETE FROM {FILTER_TABLE} WHERE polyline_hash = ?",
+                [(polyline_hash,) for polyline_hash in polyline_hashes],
+            )
+            for polyline_hash in polyline_hashes:
+                self.filtered.pop(polyline_hash, None)
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+def refilter_polylines(session, file_name, force=False):
+    """
+    Filter every polyline of the activities not filtered with the current
+    settings yet (all of them with force), and forget the ones no activity
+    has anymore. Return how many were filtered.
+    """
+    polylines = {
+        _sha1(polyline_str): polyline_str
+        for column in POLYLINE_COLUMNS
+        for (polyline_str,) in session.execute(
+            text(f"SELECT DISTINCT {column} FROM activities WHERE {column} != ''")
+        )
+    }
+    cache = FilterCache(file_name)
+    if force:
+        cache.forget()
+    else:
+        cache.forget(
+            [
+                polyline_hash
+                for (polyline_hash,) in cache.conn.execute(
+                    f"SELECT polyline_hash FROM {FILTER_TABLE}"
+                )
+                if polyline_hash not in polylines
+            ]
+        )
+    count = cache.update(polylines.values())
+    cache.close()
+    return count
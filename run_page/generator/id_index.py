@@ -0,0 +1,35 @@
+"""
+Known activity ids, for the "already have it?" checks of the syncers.
+
+Both return sets of str ids, so a membership test is O(1), and only read
+keys: the run_id column, or the file names of the download folders.
+"""
+
+import os
+
+from sqlalchemy import String, cast
+
+from .db import Activity
+
+
+def get_known_ids(session, prefix=None):
+    """run_ids in the database as str, only the ones starting with prefix if given"""
+    query = session.query(Activity.run_id)
+    if prefix:
+        query = query.filter(cast(Activity.run_id, String).startswith(prefix))
+    return {str(run_id) for (run_id,) in query}
+
+
+def get_downloaded_ids(*folders):
+    """Ids (file names without extension) of the files already downloaded to folders"""
+    ids = set()
+    for folder in folders:
+        if not os.path.isdir(folder):
+            continue
+        with os.scandir(folder) as entries:
+            ids.update(
+                entry.name.split(".")[0]
+                for entry in entries
+                if not entry.name.startswith(".")
+            )
+    return ids
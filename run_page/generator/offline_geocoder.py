@@ -0,0 +1,182 @@
+"""
+Offline reverse geocoding for location_country.
+
+A gazetteer (csv with lat,lon,city,province,country) is loaded once into a
+KD-tree over unit sphere vectors, so the nearest known place of a whole batch
+of start points is found without any network call. Names are normalized to
+the "city,province,country" format the frontend regex expects, e.g.
+呼和浩特市,内蒙古自治区,中国
+
+No gazetteer is shipped. build_gazetteer.py makes one from the public
+GeoNames dumps into GAZETTEER_FILE, the geocoder is used as soon as that
+file exists, see OFFLINE_GEOCODER in generator.db.
+"""
+
+import csv
+import math
+import os
+
+GAZETTEER_FILE = os.getenv(
+    "GAZETTEER_FILE", os.path.join(os.path.dirname(__file__), "gazetteer.csv")
+)
+# points farther than this (km) from every gazetteer place are left unresolved
+OFFLINE_GEOCODER_MAX_DISTANCE = float(os.getenv("OFFLINE_GEOCODER_MAX_DISTANCE", "5"))
+
+EARTH_RADIUS = 6371.0088
+
+# frontend: /[一-龥]{2,}(省|自治区)/
+PROVINCE_FULL_NAMES = {
+    "北京": "北京市",
+    "天津": "天津市",
+    "上海": "上海市",
+    "重庆": "重庆市",
+    "河北": "河北省",
+    "山西": "山西省",
+    "辽宁": "辽宁省",
+    "吉林": "吉林省",
+    "黑龙江": "黑龙江省",
+    "江苏": "江苏省",
+    "浙江": "浙江省",
+    "安徽": "安徽省",
+    "福建": "福建省",
+    "江西": "江西省",
+    "山东": "山东省",
+    "河南": "河南省",
+    "湖北": "湖北省",
+    "湖南": "湖南省",
+    "广东": "广东省",
+    "海南": "海南省",
+    "四川": "四川省",
+    "贵州": "贵州省",
+    "云南": "云南省",
+    "陕西": "陕西省",
+    "甘肃": "甘肃省",
+    "青海": "青海省",
+    "台湾": "台湾省",
+    "内蒙古": "内蒙古自治区",
+    "广西": "广西壮族自治区",
+    "西藏": "西藏自治区",
+    "宁夏": "宁夏回族自治区",
+    "新疆": "新疆维吾尔自治区",
+    "香港": "香港特别行政区",
+    "澳门": "澳门特别行政区",
+}
+# frontend: /([一-龥]{2,}(市|自治州|特别行政区|盟|地区))/
+CITY_SUFFIXES = ("市", "自治州", "特别行政区", "盟", "地区")
+
+
+def _is_chinese(name):
+    return bool(name) and all("一" <= c <= "龥" for c in name)
+
+
+def normalize_location(city, province, country):
+    city, province, country = city.strip(), province.strip(), country.strip()
+    province = PROVINCE_FULL_NAMES.get(province, province)
+    if city in PROVINCE_FULL_NAMES and PROVINCE_FULL_NAMES[city].endswith("市"):
+        # municipalities, 天津 -> 天津市
+        city = PROVINCE_FULL_NAMES[city]
+    elif _is_chinese(city) and not city.endswith(CITY_SUFFIXES):
+        city = city + "市"
+    return ",".join(i for i in (city, province, country) if i)
+
+
+def _to_xyz(lat, lon):
+    lat, lon = math.radians(lat), math.radians(lon)
+    return (
+        math.cos(lat) * math.cos(lon),
+        math.cos(lat) * math.sin(lon),
+        math.sin(lat),
+    )
+
+
+class KDTree:
+    """Minimal 3d KD-tree, nodes are (index, axis, left, right) tuples"""
+
+    def __init__(self, points):
+        self.points = points
+        self.root = self._build(list(range(len(points))), 0)
+
+    def _build(self, indexes, depth):
+        if not indexes:
+            return None
+        axis = depth % 3
+        indexes.sort(key=lambda i: self.points[i][axis])
+        mid = len(indexes) // 2
+        return (
+            indexes[mid],
+            axis,
+            self._build(indexes[:mid], depth + 1),
+            self._build(indexes[mid + 1 :], depth + 1),
+        )
+
+    def nearest(self, point, max_distance=math.inf):
+        """Return (index, squared distance) of the nearest point, index is None when nothing is within max_distance"""
+        best = [None, max_distance * max_distance]
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node is None:
+                continue
+            index, axis, left, right = node
+            p = self.points[index]
+            d = (p[0] - point[0]) ** 2 + (p[1] - point[1]) ** 2 + (p[2] - point[2]) ** 2
+            if d < best[1]:
+                best[0], best[1] = index, d
+            diff = point[axis] - p[axis]
+            near, far = (left, right) if diff < 0 else (right, left)
+            # the far side can only hold a closer point if the split plane is closer
+            if diff * diff < best[1]:
+                stack.append(far)
+            stack.append(near)
+        return best[0], best[1]
+
+
+class OfflineGeocoder:
+    def __init__(self, places, max_distance=OFFLINE_GEOCODER_MAX_DISTANCE):
+        """places: list of (lat, lon, location_country)"""
+        self.locations = [p[2] for p in places]
+        self.tree = KDTree([_to_xyz(p[0], p[1]) for p in places])
+        # great circle distance -> chord length on the unit sphere
+        self.max_chord = 2 * math.sin(min(max_distance / EARTH_RADIUS, math.pi) / 2)
+
+    @classmethod
+    def from_file(cls, file_name=GAZETTEER_FILE, **kwargs):
+        places = []
+        with open(file_name, encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                places.append(
+                    (
+                        float(row["lat"]),
+                        float(row["lon"]),
+                        normalize_location(
+                            row["city"], row["province"], row["country"]
+                        ),
+                    )
+                )
+        return cls(places, **kwargs)
+
+    def reverse(self, lat, lon):
+        index, _ = self.tree.nearest(_to_xyz(lat, lon), self.max_chord)
+        return None if index is None else self.locations[index]
+
+    def reverse_batch(self, points):
+        """points: iterable of (lat, lon), return a list of location_country or None"""
+        return [self.reverse(lat, lon) for lat, lon in points]
+
+
+_offline_geocoder = None
+
+
+def get_offline_geocoder():
+    """Load the gazetteer only once per process, None if there is no gazetteer"""
+    global _offline_geocoder
+    if _offline_geocoder is None:
+        if not os.path.exists(GAZETTEER_FILE):
+            _offline_geocoder = False
+            return None
+        try:
+            _offline_geocoder = OfflineGeocoder.from_file()
+        except (OSError, KeyError, ValueError) as e:
+            print(f"can not load gazetteer {GAZETTEER_FILE}: {e}")
+            _offline_geocoder = False
+    return _offline_geocoder or None
@@ -0,0 +1,159 @@
+"""
+R*Tree index over the activity bounding boxes.
+
+The bounding box of every summary_polyline is computed once at ingest and kept
+in the activities_rtree virtual table, keyed by run_id, so "which activities
+touch this area" is answered by sqlite without decoding any polyline.
+Boxes are (min_lat, min_lng, max_lat, max_lng), i.e. south, west, north, east.
+"""
+
+import math
+
+import polyline_codec
+from haversine import haversine
+from sqlalchemy import text
+
+RTREE_TABLE = "activities_rtree"
+
+# degrees of latitude per km
+KM_LAT = 1 / 111.195
+
+
+def polyline_bbox(summary_polyline):
+    """(min_lat, min_lng, max_lat, max_lng) of an encoded polyline, None if empty"""
+    if not summary_polyline:
+        return None
+    try:
+        lats, lngs = polyline_codec.decode(summary_polyline)
+    except ValueError as e:
+        print(f"can not decode polyline: {e}")
+        return None
+    if not len(lats):
+        return None
+    return float(lats.min()), float(lngs.min()), float(lats.max()), float(lngs.max())
+
+
+def radius_bbox(lat, lng, radius):
+    """Box around (lat, lng) holding every point within radius km"""
+    dlat = radius * KM_LAT
+    cos_lat = math.cos(math.radians(lat))
+    if cos_lat < 1e-6 or abs(lat) + dlat >= 90:
+        # near a pole every longitude is within reach
+        return max(lat - dlat, -90), -180, min(lat + dlat, 90), 180
+    dlng = min(dlat / cos_lat, 180)
+    return lat - dlat, lng - dlng, lat + dlat, lng + dlng
+
+
+def create_rtree(conn):
+    conn.execute(
+        text(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {RTREE_TABLE} "
+            "USING rtree(id, min_lat, max_lat, min_lng, max_lng)"
+        )
+    )
+    # a deleted activity must not be found by a spatial query anymore
+    conn.execute(
+        text(
+            f"CREATE TRIGGER IF NOT EXISTS {RTREE_TABLE}_delete "
+            "AFTER DELETE ON activities BEGIN "
+            f"DELETE FROM {RTREE_TABLE} WHERE id = OLD.run_id; END"
+        )
+    )
+
+
+def index_activity_bboxes(conn, rows):
+    """
+    rows: iterable of (run_id, summary_polyline), a session or a connection
+    Activities without a track are removed from the index.
+    """
+    boxes = []
+    empty = []
+    for run_id, summary_polyline in rows:
+        bbox = polyline_bbox(summary_polyline)
+        if bbox is None:
+            empty.append({"id": run_id})
+        else:
+            min_lat, min_lng, max_lat, max_lng = bbox
+            boxes.append(
+                {
+                    "id": run_id,
+                    "min_lat": min_lat,
+                    "max_lat": max_lat,
+                    "min_lng": min_lng,
+                    "max_lng": max_lng,
+                }
+            )
+    if boxes:
+        conn.execute(
+            text(
+                f"INSERT OR REPLACE INTO {RTREE_TABLE} "
+                "VALUES (:id, :min_lat, :max_lat, :min_lng, :max_lng)"
+            ),
+            boxes,
+        )
+    if empty:
+        conn.execute(text(f"DELETE FROM {RTREE_TABLE} WHERE id = :id"), empty)
+
+
+def bbox_filter_sql(bbox, column="run_id"):
+    """
+    SQL condition and named parameters selecting the activities whose box
+    intersects bbox, usable with sqlalchemy text() and with sqlite3 cursors.
+    """
+    min_lat, min_lng, max_lat, max_lng = bbox
+    sql = (
+        f"{column} IN (SELECT id FROM {RTREE_TABLE} "
+        "WHERE max_lat >= :bbox_min_lat AND min_lat <= :bbox_max_lat "
+        "AND max_lng >= :bbox_min_lng AND min_lng <= :bbox_max_lng)"
+    )
+    params = {
+        "bbox_min_lat": min_lat,
+        "bbox_min_lng": min_lng,
+        "bbox_max_lat": max_lat,
+        "bbox_max_lng": max_lng,
+    }
+    return sql, params
+
+
+def parse_bbox(value):
+    """ "min_lat,min_lng,max_lat,max_lng" -> tuple of floats"""
+    bbox = tuple(float(i) for i in value.split(","))
+    if len(bbox) != 4 or bbox[0] > bbox[2] or bbox[1] > bbox[3]:
+        raise ValueError(f"bad bbox {value}, need min_lat,min_lng,max_lat,max_lng")
+    return bbox
+
+
+def activities_in_bbox(session, bbox):
+    """run_ids of the activities whose bounding box intersects bbox"""
+    sql, params = bbox_filter_sql(bbox)
+    rows = session.execute(
+        text(f"SELECT run_id FROM activities WHERE {sql} ORDER BY start_date_local"),
+        params,
+    )
+    return [run_id for (run_id,) in rows]
+
+
+def activities_near(session, lat, lng, radius):
+    """
+    run_ids of the activities with a track point within radius km of (lat, lng).
+    The R*Tree narrows it down to the boxes near the circle, only those
+    polylines are decoded for the exact distance check.
+    """
+    sql, params = bbox_filter_sql(radius_bbox(lat, lng, radius))
+    rows = session.execute(
+        text(
+            f"SELECT run_id, summary_polyline FROM activities WHERE {sql} "
+            "ORDER BY start_date_local"
+        ),
+        params,
+    )
+    center = (lat, lng)
+    run_ids = []
+    for run_id, summary_polyline in rows:
+        try:
+            points = polyline_codec.decode_points(summary_polyline)
+        except ValueError:
+            continue
+        if any(haversine(center, point) <= radius for point in points):
+            run_ids.append(run_id)
+    return run_ids
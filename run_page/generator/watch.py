@@ -0,0 +1,128 @@
+"""
+Watch the data folders and import activity files as they land.
+
+Every folder is polled: its listing is only read again when the folder's
+mtime changed (a file was created, renamed or deleted), and only the entries
+that are new or changed since the last listing are looked at. Those wait until
+no file of the folder changed for debounce seconds, so a burst of files (or a
+file still being written) is imported once, in one batch. A batch is parsed
+and upserted with Generator.sync_data_files and the json exported again,
+which only re-serializes the changed activities.
+"""
+
+import os
+import time
+
+from gpxtrackposter.track_loader import shutdown_load_pool
+from synced_data_file_logger import SyncedFileManifest
+
+# seconds between two looks at the folders
+WATCH_INTERVAL = float(os.getenv("WATCH_INTERVAL", "2"))
+# seconds without changes in a folder before its new files are imported
+WATCH_DEBOUNCE = float(os.getenv("WATCH_DEBOUNCE", "3"))
+
+
+class FolderWatch:
+    """New or changed data files of one folder, see the module docstring"""
+
+    def __init__(self, data_dir, file_suffix):
+        self.data_dir = data_dir
+        self.file_suffix = file_suffix
+        self.dir_mtime_ns = None
+        # name: (size, mtime_ns) at the last listing
+        self.files = {}
+        # path: (size, mtime_ns) of the files waiting to be imported
+        self.pending = {}
+        self.last_change = 0.0
+
+    def _list(self):
+        files = {}
+        with os.scandir(self.data_dir) as entries:
+            for entry in entries:
+                name = entry.name
+                if name.startswith(".") or not name.endswith(f".{self.file_suffix}"):
+                    continue
+                try:
+                    if not entry.is_file():
+                        continue
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                files[name] = (stat.st_size, stat.st_mtime_ns)
+        return files
+
+    def start(self):
+        """Remember the files already there, they are not imported by poll"""
+        self.dir_mtime_ns = os.stat(self.data_dir).st_mtime_ns
+        self.files = self._list()
+
+    def poll(self, now):
+        """Return the files to import now, [] while a burst is going on"""
+        dir_mtime_ns = os.stat(self.data_dir).st_mtime_ns
+        if dir_mtime_ns != self.dir_mtime_ns:
+            self.dir_mtime_ns = dir_mtime_ns
+            files = self._list()
+            for name, fingerprint in files.items():
+                if self.files.get(name) != fingerprint:
+                    self.pending[os.path.join(self.data_dir, name)] = fingerprint
+                    self.last_change = now
+            self.files = files
+        # files still being written change without touching the folder
+        for file_name, fingerprint in list(self.pending.items()):
+            try:
+                stat = os.stat(file_name)
+            except OSError:
+                del self.pending[file_name]
+                continue
+            if (stat.st_size, stat.st_mtime_ns) != fingerprint:
+                fingerprint = (stat.st_size, stat.st_mtime_ns)
+                self.pending[file_name] = fingerprint
+                self.files[os.path.basename(file_name)] = fingerprint
+                self.last_change = now
+        if not self.pending or now - self.last_change < WATCH_DEBOUNCE:
+            return []
+        file_names = sorted(self.pending)
+        self.pending = {}
+        return file_names
+
+
+def watch(generator, folders, json_file, interval=WATCH_INTERVAL):
+    """
+    folders: {file suffix: data dir}, the ones that do not exist are left out.
+    Import what is not synced yet, then keep importing new files until
+    interrupted.
+    """
+    watches = []
+    for file_suffix, data_dir in folders.items():
+        if not os.path.isdir(data_dir):
+            print(f"{data_dir} does not exist, not watching it")
+            continue
+        folder_watch = FolderWatch(data_dir, file_suffix)
+        folder_watch.start()
+        generator.sync_from_data_dir(data_dir, file_suffix=file_suffix)
+        watches.append(folder_watch)
+    generator.export_json(json_file)
+    print(f"watching {', '.join(w.data_dir for w in watches)}")
+
+    try:
+        while True:
+            time.sleep(interval)
+            synced = False
+            for folder_watch in watches:
+                file_names = folder_watch.poll(time.monotonic())
+                if not file_names:
+                    continue
+                manifest = SyncedFileManifest()
+                file_names = [f for f in file_names if not manifest.is_synced(f)]
+                manifest.close()
+                if file_names:
+                    print(f"importing {len(file_names)} new files")
+                    generator.sync_data_files(file_names, folder_watch.file_suffix)
+                    synced = True
+            if synced:
+                version = generator.export_json(json_file)
+                print(f"exported {json_file}, version {version}")
+    except KeyboardInterrupt:
+        print("stop watching")
+    finally:
+        shutdown_load_pool()
@@ -0,0 +1,293 @@
+"""
+Selective FIT reader on a memory map, without garmin_fit_sdk's Decoder.
+
+Decoder.read() builds a dict for every message of the file (records, hrv,
+events, developer fields...), Track only uses the first session and file_id
+messages and the positions of the records. read_fit walks the definitions and
+messages of the mapped file, skips the messages of any other type by their
+size and unpacks only the fields Track reads, with one struct per definition.
+The semicircle latitudes and longitudes go straight into int arrays.
+
+Values follow the SDK (invalid values left out, Profile scales, offsets,
+type names, components and sub fields), so the tracks are the same as with
+the SDK. Whatever it does not handle the way the SDK would (compressed
+timestamp headers, array fields, hr messages to merge, broken structure)
+raises UnsupportedFitError, Track.load_fit decodes the file with the SDK
+then. The file CRC is not checked.
+"""
+
+import mmap
+import struct
+from array import array
+
+from garmin_fit_sdk import fit as FIT
+from garmin_fit_sdk.profile import Profile
+from garmin_fit_sdk.util import FIT_EPOCH_S
+
+NAN = float("nan")
+
+FILE_ID = Profile["mesg_num"]["FILE_ID"]
+SESSION = Profile["mesg_num"]["SESSION"]
+RECORD = Profile["mesg_num"]["RECORD"]
+# the SDK merges hr messages into the records' heart rates
+HR = Profile["mesg_num"]["HR"]
+
+# the fields Track reads of every message type
+FIELDS = {
+    FILE_ID: ("manufacturer", "product"),
+    SESSION: (
+        "start_time",
+        "sport",
+        "sub_sport",
+        "total_elapsed_time",
+        "total_timer_time",
+        "total_distance",
+        "avg_speed",
+        "avg_heart_rate",
+        "total_ascent",
+        "total_moving_time",
+        "enhanced_avg_speed",
+    ),
+    RECORD: (
+        "timestamp",
+        "position_lat",
+        "position_long",
+        "altitude",
+        "heart_rate",
+        "enhanced_altitude",
+    ),
+}
+
+_COMPRESSED_HEADER_MASK = 0x80
+_HEADER_SIZES = (12, 14)
+_CRC_SIZE = 2
+
+_HEADER = struct.Struct("<BBHI4s")
+
+
+class UnsupportedFitError(Exception):
+    """read_fit can not read the file like the SDK, decode it with the SDK"""
+
+
+class FitSummary:
+    """
+    What Track._load_fit_summary needs of a FIT file.
+    session, file_id: the first messages as the SDK decodes them, but only
+    with the fields Track reads, None if there is none.
+    lats, lngs (semicircles) and aligned with them timestamps, elevations and
+    heart_rates (nan where a record has none) of the records with a position.
+    """
+
+    __slots__ = (
+        "elevations",
+        "file_id",
+        "heart_rates",
+        "lats",
+        "lngs",
+        "session",
+        "timestamps",
+    )
+
+    def __init__(self):
+        self.session = None
+        self.file_id = None
+        self.lats = array("i")
+        self.lngs = array("i")
+        self.timestamps = array("d")
+        self.elevations = array("d")
+        self.heart_rates = array("d")
+
+
+class _Definition:
+    __slots__ = ("fields", "global_mesg_num", "size", "struct")
+
+    def __init__(self, global_mesg_num, size, struct=None, fields=()):
+        self.global_mesg_num = global_mesg_num
+        # message bytes after the record header
+        self.size = size
+        self.struct = struct
+        # (profile, invalid value) of every unpacked value
+        self.fields = fields
+
+
+def _profile_fields(global_mesg_num):
+    fields = Profile["messages"][global_mesg_num]["fields"]
+    names = FIELDS[global_mesg_num]
+    return {num: field for num, field in fields.items() if field["name"] in names}
+
+
+# {global message number: {field number: field profile}}
+_PROFILE_FIELDS = {num: _profile_fields(num) for num in FIELDS}
+_RECORD_PROFILES = {f["name"]: f for f in _PROFILE_FIELDS[RECORD].values()}
+
+
+def _profile_value(profile, raw_value):
+    """Decoder.__transform_values for a single value"""
+    value = raw_value
+    types = Profile["types"].get(profile["type"])
+    if types is not None:
+        value = types.get(raw_value, raw_value)
+    if profile["type"] in FIT.NUMERIC_FIELD_TYPES and len(profile["scale"]) == 1:
+        scale, offset = profile["scale"][0], profile["offset"][0]
+        value = (raw_value / scale if scale != 1 else raw_value) - offset
+    return value
+
+
+def _component_value(profile, raw_value):
+    """The value a field with one component gives its target field"""
+    value = raw_value / profile["scale"][0] - profile["offset"][0]
+    return int(value) if value.is_integer() else value
+
+
+def _read_definition(data, position, definitions):
+    """Read the definition message at position, return the position after it"""
+    header = data[position]
+    architecture = data[position + 2]
+    endian = "<" if architecture == FIT.ARCH_LITTLE_ENDIAN else ">"
+    global_mesg_num, num_fields = struct.unpack_from(endian + "HB", data, position + 3)
+    position += 6
+    field_definitions = [
+        tuple(data[i : i + 3]) for i in range(position, position + 3 * num_fields, 3)
+    ]
+    position += 3 * num_fields
+    size = sum(field_size for _, field_size, _ in field_definitions)
+    if header & FIT.DEV_DATA_MASK:
+        num_dev_fields = data[position]
+        size += sum(data[position + 2 : position + 1 + 3 * num_dev_fields : 3])
+        position += 1 + 3 * num_dev_fields
+
+    if global_mesg_num == HR:
+        raise UnsupportedFitError("hr messages")
+    wanted = _PROFILE_FIELDS.get(global_mesg_num)
+    definition = _Definition(global_mesg_num, size)
+    if wanted is not None:
+        layout = [endian]
+        fields = []
+        for field_num, field_size, base_type in field_definitions:
+            base_type &= FIT.BASE_TYPE_MASK
+            if base_type not in FIT.BASE_TYPE_DEFINITIONS:
+                raise UnsupportedFitError(f"base type {base_type}")
+            if field_num not in wanted:
+                layout.append(f"{field_size}x")
+                continue
+            base = FIT.BASE_TYPE_DEFINITIONS[base_type]
+            if field_size % base["size"]:
+                base = FIT.BASE_TYPE_DEFINITIONS[FIT.BASE_TYPE["UINT8"]]
+            if field_size != base["size"] or base["type"] == FIT.BASE_TYPE["STRING"]:
+                raise UnsupportedFitError(f"field {wanted[field_num]['name']}")
+            layout.append(base["type_code"])
+            fields.append((wanted[field_num], base["invalid"]))
+        # developer fields are skipped
+        layout.append(f"{size - sum(i for _, i, _ in field_definitions)}x")
+        definition.struct = struct.Struct("".join(layout))
+        definition.fields = fields
+    definitions[header & FIT.LOCAL_MESG_NUM_MASK] = definition
+    return position
+
+
+def _raw_message(definition, data, position):
+    """{field name: raw value} of the valid fields"""
+    return {
+        profile["name"]: value
+        for (profile, invalid), value in zip(
+            definition.fields, definition.struct.unpack_from(data, position)
+        )
+        if value != invalid
+    }
+
+
+def _message(definition, raw):
+    """The message as the SDK gives it, limited to the fields Track reads"""
+    profiles = {f["name"]: f for f, _ in definition.fields}
+    message = {
+        name: _profile_value(profiles[name], value) for name, value in raw.items()
+    }
+    for name, value in raw.items():
+        profile = profiles[name]
+        for sub_field in profile["sub_fields"]:
+            for map_item in sub_field["map"]:
+                if raw.get(map_item["name"]) == map_item["raw_value"]:
+                    message[sub_field["name"]] = _profile_value(sub_field, value)
+                    break
+        if len(profile["components"]) == 1:
+            target = Profile["messages"][definition.global_mesg_num]["fields"][
+                profile["components"][0]
+            ]
+            message[target["name"]] = _component_value(profile, value)
+    return message
+
+
+def _add_record(summary, raw):
+    """Track._load_fit_data on one record"""
+    if "position_lat" not in raw or "position_long" not in raw:
+        return
+    summary.lats.append(raw["position_lat"])
+    summary.lngs.append(raw["position_long"])
+    timestamp = raw.get("timestamp")
+    summary.timestamps.append(NAN if timestamp is None else timestamp + FIT_EPOCH_S)
+    # an altitude expands to enhanced_altitude, over the stored one
+    if "altitude" in raw:
+        elevation = _component_value(_RECORD_PROFILES["altitude"], raw["altitude"])
+    elif "enhanced_altitude" in raw:
+        elevation = _profile_value(
+            _RECORD_PROFILES["enhanced_altitude"], raw["enhanced_altitude"]
+        )
+    else:
+        elevation = NAN
+    summary.elevations.append(elevation)
+    summary.heart_rates.append(raw.get("heart_rate", NAN))
+
+
+def _read(data):
+    summary = FitSummary()
+    definitions = {}
+    position = 0
+    while position < len(data):
+        if len(data) - position < _HEADER.size:
+            raise UnsupportedFitError("truncated header")
+        header_size, _, _, data_size, data_type = _HEADER.unpack_from(data, position)
+        if header_size not in _HEADER_SIZES or data_type != b".FIT":
+            raise UnsupportedFitError("not a FIT file")
+        end = position + header_size + data_size
+        if end + _CRC_SIZE > len(data):
+            raise UnsupportedFitError("truncated file")
+        position += header_size
+        while position < end:
+            header = data[position]
+            if header & _COMPRESSED_HEADER_MASK:
+                raise UnsupportedFitError("compressed timestamp header")
+            if header & FIT.MESG_DEFINITION_MASK:
+                position = _read_definition(data, position, definitions)
+                continue
+            definition = definitions.get(header & FIT.LOCAL_MESG_NUM_MASK)
+            if definition is None:
+                raise UnsupportedFitError("undefined local message")
+            position += 1
+            if position + definition.size > end:
+                raise UnsupportedFitError("message across the end of the data")
+            if definition.struct is not None:
+                raw = _raw_message(definition, data, position)
+                if definition.global_mesg_num == RECORD:
+                    _add_record(summary, raw)
+                elif definition.global_mesg_num == SESSION:
+                    if summary.session is None:
+                        summary.session = _message(definition, raw)
+                elif summary.file_id is None:
+                    summary.file_id = _message(definition, raw)
+            position += definition.size
+        if position != end:
+            raise UnsupportedFitError("definition across the end of the data")
+        position += _CRC_SIZE
+    return summary
+
+
+def read_fit(file_name):
+    """Read file_name into a FitSummary, UnsupportedFitError for the SDK"""
+    with (
+        open(file_name, "rb") as file,
+        mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data,
+    ):
+        try:
+            return _read(data)
+        except (IndexError, struct.error) as e:
+            raise UnsupportedFitError(str(e))
@@ -0,0 +1,223 @@
+"""
+Single pass GPX reader on lxml.etree.iterparse, without gpxpy's object tree.
+
+Track.load_gpx parses the whole file into gpxpy objects before anything is
+computed. read_gpx streams the trackpoints once instead, every segment is
+simplified (Ramer-Douglas-Peucker, 10m like gpx.simplify) and measured with
+track_metrics as soon as it ends, so only the kept points of the file and
+the raw points of one segment are held. The loaders compute the same
+metrics on the same points, so the tracks are the same, see
+benchmarks/check_gpx_loader.py.
+"""
+
+import math
+from array import array
+
+from gpxpy.geo import distance
+from gpxpy.gpx import GPXException
+from gpxpy.gpxfield import parse_time
+from lxml import etree
+from track_metrics import elevation_gain, moving_data, moving_time, track_length
+
+NAN = float("nan")
+
+# gpx.simplify() default
+SIMPLIFY_MAX_DISTANCE = 10
+
+
+class GPXSummary:
+    """
+    What Track._load_gpx_stream_data needs of a GPX file.
+    lines: (points, timestamps, elevations, heart_rates) of every simplified
+    segment, the same as Track.add_line takes.
+    """
+
+    __slots__ = (
+        "calc_moving_time",
+        "end_time",
+        "extensions",
+        "length",
+        "lines",
+        "moving_distance",
+        "moving_time",
+        "start_time",
+        "track_name",
+        "track_type",
+        "uphill",
+    )
+
+    def __init__(self):
+        self.start_time = None
+        self.end_time = None
+        self.length = 0
+        self.calc_moving_time = 0
+        self.moving_time = 0.0
+        self.moving_distance = 0.0
+        self.uphill = 0.0
+        self.track_name = None
+        self.track_type = None
+        self.lines = []
+        self.extensions = {}
+
+
+class _Segment:
+    """Raw points of the segment being read"""
+
+    __slots__ = ("elevations", "heart_rates", "lats", "lngs", "timestamps")
+
+    def __init__(self):
+        self.lats = array("d")
+        self.lngs = array("d")
+        self.timestamps = array("d")
+        self.elevations = array("d")
+        self.heart_rates = array("d")
+
+    def add(self, lat, lng, elevation, time, heart_rate):
+        self.lats.append(lat)
+        self.lngs.append(lng)
+        self.timestamps.append(time.timestamp() if time else NAN)
+        self.elevations.append(NAN if elevation is None else elevation)
+        self.heart_rates.append(NAN if heart_rate is None else heart_rate)
+
+
+def _line_distance(lats, lngs, index, begin, end):
+    """gpxpy.geo.distance_from_line"""
+    a = distance(lats[begin], lngs[begin], None, lats[end], lngs[end], None)
+    if not a:
+        return distance(lats[begin], lngs[begin], None, lats[index], lngs[index], None)
+    b = distance(lats[begin], lngs[begin], None, lats[index], lngs[index], None)
+    c = distance(lats[end], lngs[end], None, lats[index], lngs[index], None)
+    s = (a + b + c) / 2
+    return 2 * math.sqrt(abs(s * (s - a) * (s - b) * (s - c))) / a
+
+
+def simplify_indexes(lats, lngs, max_distance=SIMPLIFY_MAX_DISTANCE):
+    """Indexes of the points gpxpy.geo.simplify_polyline keeps, without recursion"""
+    size = len(lats)
+    if size < 3:
+        return list(range(size))
+    keep = {0, size - 1}
+    stack = [(0, size - 1)]
+    while stack:
+        begin, end = stack.pop()
+        if end - begin < 2:
+            continue
+        # gpxpy.geo.get_line_equation_coefficients
+        if lngs[begin] == lngs[end]:
+            a, b, c = 0, 1, -lngs[begin]
+        else:
+            slope = (lats[begin] - lats[end]) / (lngs[begin] - lngs[end])
+            a, b, c = 1, -slope, -(lats[begin] - lngs[begin] * slope)
+        farthest = 0
+        position = begin + 1
+        for index in range(begin + 1, end):
+            d = abs(a * lats[index] + b * lngs[index] + c)
+            if d > farthest:
+                farthest = d
+                position = index
+        if _line_distance(lats, lngs, position, begin, end) < max_distance:
+            continue
+        keep.add(position)
+        stack.append((begin, position))
+        stack.append((position, end))
+    return sorted(keep)
+
+
+def _localname(element):
+    tag = element.tag
+    return tag[tag.rfind("}") + 1 :] if isinstance(tag, str) else None
+
+
+def _read_trackpoint(element):
+    """(lat, lng, elevation, time, heart_rate) of a trkpt like gpxpy reads it"""
+    elevation = time = heart_rate = None
+    seen = set()
+    for child in element:
+        name = _localname(child)
+        if name in seen:
+            continue
+        seen.add(name)
+        if name == "ele" and child.text is not None:
+            elevation = float(child.text.strip())
+        elif name == "time" and child.text:
+            try:
+                time = parse_time(child.text)
+            except (GPXException, ValueError):
+                time = None
+        elif name == "extensions" and len(child):
+            # Track._gpx_point_heart_rate: the hr of the first extension
+            extension = {_localname(i): i.text for i in child[0]}
+            if "hr" in extension:
+                heart_rate = int(extension["hr"])
+    return (
+        float(element.get("lat")),
+        float(element.get("lon")),
+        elevation,
+        time,
+        heart_rate,
+    )
+
+
+def read_gpx(file_name):
+    """Stream file_name once into a GPXSummary"""
+    summary = GPXSummary()
+    segment = None
+
+    for _, element in etree.iterparse(file_name, events=("end",), remove_comments=True):
+        name = _localname(element)
+        parent = element.getparent()
+        parent_name = None if parent is None else _localname(parent)
+
+        if name == "trkpt" and parent_name == "trkseg":
+            point = _read_trackpoint(element)
+            time = point[3]
+            if time:
+                if summary.start_time is None:
+                    summary.start_time = time
+                summary.end_time = time
+            if segment is None:
+                segment = _Segment()
+            segment.add(*point)
+        elif name == "trkseg" and parent_name == "trk":
+            # an empty segment is still an (empty) line, like in gpxpy
+            _end_segment(summary, segment or _Segment())
+            segment = None
+        elif name in ("name", "type") and parent_name == "trk":
+            if name == "name":
+                if summary.track_name is None:
+                    summary.track_name = element.text
+            elif element.text:
+                summary.track_type = element.text
+            continue
+        elif name == "extensions" and parent_name == "gpx":
+            summary.extensions = {_localname(i): i.text for i in element}
+        elif name != "trk":
+            continue
+        # drop what has been read, so the tree never holds more than a point
+        element.clear()
+        while element.getprevious() is not None:
+            del parent[0]
+    return summary
+
+
+def _end_segment(summary, segment):
+    # the same steps as Track._load_gpx_data
+    summary.length += track_length(segment.lats, segment.lngs)
+    summary.calc_moving_time += moving_time(
+        segment.timestamps,
+        summary.start_time.timestamp() if summary.start_time else None,
+    )
+
+    kept = simplify_indexes(segment.lats, segment.lngs)
+    points = [(segment.lats[i], segment.lngs[i]) for i in kept]
+    timestamps = [segment.timestamps[i] for i in kept]
+    elevations = [segment.elevations[i] for i in kept]
+    heart_rates = [segment.heart_rates[i] for i in kept]
+
+    seconds, meters = moving_data(
+        [p[0] for p in points], [p[1] for p in points], timestamps, elevations
+    )
+    summary.moving_time += seconds
+    summary.moving_distance += meters
+    summary.uphill += elevation_gain(elevations)
+    summary.lines.append((points, timestamps, elevations, heart_rates))
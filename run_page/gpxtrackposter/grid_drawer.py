@@ -11,7 +11,7 @@ from .exceptions import PosterError
 from .poster import Poster
 from .track import Track
 from .tracks_drawer import TracksDrawer
-from .utils import compute_grid, format_float, project
+from .utils import bbox_resolution, compute_grid, format_float, project
 from .xy import XY
 
 
@@ -22,6 +22,8 @@ class GridDrawer(TracksDrawer):
         draw: For each track, draw it on the poster.
     """
 
+    needs_geometry = True
+
     def __init__(self, the_poster: Poster):
         super().__init__(the_poster)
 
@@ -58,7 +60,10 @@ class GridDrawer(TracksDrawer):
         str_length = format_float(self.poster.m2u(tr.length))
 
         date_title = f"{str(tr.start_time_local)[:10]} {str_length}{self.poster.u()}"
-        for line in project(tr.bbox(), size, offset, tr.polylines):
+        bbox = tr.bbox()
+        # details smaller than the stroke are not visible, draw the coarsest polyline level that keeps the rest
+        polylines = tr.level_polylines(bbox_resolution(bbox, size, 0.5))
+        for line in project(bbox, size, offset, polylines):
             distance1 = self.poster.special_distance["special_distance"]
             distance2 = self.poster.special_distance["special_distance2"]
             has_special = distance1 < self.poster.m2u(tr.length) < distance2
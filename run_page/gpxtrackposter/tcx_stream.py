@@ -0,0 +1,217 @@
+"""
+Single pass TCX reader on lxml.etree.iterparse, without tcxreader's objects.
+
+TCXReader.read parses the whole file, builds a TCXTrackPoint for every point
+and walks them several times for its stats. read_tcx streams the trackpoints
+once into columns and keeps what Track reads (lap distances, start and end
+time, duration, average heart rate and ascent) as running values, the same
+way tcxreader computes them. header_only stops after the first kept
+trackpoint, for the syncers that only need the start time of a file.
+"""
+
+import datetime
+import re
+
+from lxml import etree
+
+TCX_NS = "{http://www.garmin.com/xmlschemas/TrainingCenterDatabase/v2}"
+EXTENSIONS_NS = "{http://www.garmin.com/xmlschemas/ActivityExtension/v2}"
+
+TRACKPOINT = TCX_NS + "Trackpoint"
+LAP = TCX_NS + "Lap"
+ACTIVITY = TCX_NS + "Activity"
+# the ancestors tcxreader reads laps and trackpoints in
+LAP_PATH = ("Activity", "Activities")
+TRACKPOINT_PATH = ("Track", "Lap") + LAP_PATH
+
+# tcxreader's time formats, in its order
+TIME_FORMATS = (
+    "%Y-%m-%dT%H:%M:%S.%fZ",
+    "%Y-%m-%dT%H:%M:%S.%f%z",
+    "%Y-%m-%dT%H:%M:%SZ",
+    "%Y-%m-%dT%H:%M:%S%z",
+)
+# what all of them read, fromisoformat gives the same datetimes (naive for Z)
+_ISO_TIME = re.compile(r"\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d(\.\d{1,6})?(Z|[+-]\d\d:\d\d)")
+
+
+class TCXSummary:
+    """
+    What Track._load_tcx_data needs of a TCX file, named like tcxreader's
+    TCXExercise: distance, start_time, end_time, duration, hr_avg and ascent.
+    times (datetimes), lats, lngs, elevations and heart_rates of every kept
+    trackpoint, None where a point has no value.
+    """
+
+    __slots__ = (
+        "ascent",
+        "distance",
+        "duration",
+        "elevations",
+        "end_time",
+        "heart_rates",
+        "hr_avg",
+        "lats",
+        "lngs",
+        "start_time",
+        "times",
+    )
+
+    def __init__(self):
+        self.distance = 0
+        self.start_time = None
+        self.end_time = None
+        self.duration = 0
+        self.hr_avg = None
+        self.ascent = 0.0
+        self.times = []
+        self.lats = []
+        self.lngs = []
+        self.elevations = []
+        self.heart_rates = []
+
+    def add(self, time, lat, lng, elevation, heart_rate):
+        self.times.append(time)
+        self.lats.append(lat)
+        self.lngs.append(lng)
+        self.elevations.append(elevation)
+        self.heart_rates.append(heart_rate)
+
+    @classmethod
+    def from_exercise(cls, exercise):
+        """From a tcxreader TCXExercise"""
+        summary = cls()
+        for name in ("distance", "start_time", "end_time", "duration", "hr_avg"):
+            setattr(summary, name, getattr(exercise, name))
+        summary.ascent = exercise.ascent
+        for point in exercise.trackpoints:
+            summary.add(
+                point.time,
+                point.latitude,
+                point.longitude,
+                point.elevation,
+                point.hr_value,
+            )
+        return summary
+
+
+def parse_time(text):
+    """A trackpoint time like tcxreader reads it"""
+    if text and _ISO_TIME.fullmatch(text):
+        return datetime.datetime.fromisoformat(text[:-1] if text[-1] == "Z" else text)
+    for time_format in TIME_FORMATS:
+        try:
+            return datetime.datetime.strptime(text, time_format)
+        except (ValueError, TypeError):
+            continue
+    raise ValueError(f"Cannot parse time {text!r}")
+
+
+def _float_or_none(text):
+    try:
+        return float(text)
+    except (ValueError, TypeError):
+        return None
+
+
+def _read_trackpoint(element):
+    """(time, lat, lng, elevation, heart_rate), TCXReader.trackpoint_parser"""
+    time = lat = lng = elevation = heart_rate = None
+    for child in element:
+        tag = child.tag
+        if tag == TCX_NS + "Time":
+            time = parse_time(child.text)
+        elif tag == TCX_NS + "Position":
+            for position in child:
+                if position.tag == TCX_NS + "LatitudeDegrees":
+                    lat = _float_or_none(position.text)
+                elif position.tag == TCX_NS + "LongitudeDegrees":
+                    lng = _float_or_none(position.text)
+        elif tag == TCX_NS + "AltitudeMeters":
+            elevation = _float_or_none(child.text)
+        elif tag == TCX_NS + "HeartRateBpm":
+            for value in child:
+                try:
+                    heart_rate = int(float(value.text))
+                except (ValueError, TypeError):
+                    heart_rate = None
+    return time, lat, lng, elevation, heart_rate
+
+
+def _read_lap(element, summary):
+    """Add the distance of a Lap, tcxreader fails on the values it can not read"""
+    for child in element:
+        tag = child.tag
+        if tag == TCX_NS + "DistanceMeters":
+            summary.distance += float(child.text)
+        elif tag == TCX_NS + "Calories":
+            round(float(child.text))
+        elif tag == TCX_NS + "Extensions":
+            for extension in child:
+                if extension.tag != EXTENSIONS_NS + "LX":
+                    continue
+                for value in extension:
+                    text = value.text
+                    float(text) if "." in text else int(text)
+
+
+def _under_root(element, *tags):
+    """element's ancestors are tags, the last one a child of the root"""
+    for tag in tags:
+        element = element.getparent()
+        if element is None or element.tag != TCX_NS + tag:
+            return False
+    parent = element.getparent()
+    return parent is not None and parent.getparent() is None
+
+
+def read_tcx(file_name, only_gps=True, header_only=False):
+    """
+    Stream file_name once into a TCXSummary, like TCXReader.read.
+    only_gps: leave out the trackpoints without a longitude.
+    header_only: stop after the first kept trackpoint.
+    """
+    summary = TCXSummary()
+    heart_rates_sum = heart_rates_count = 0
+    last_elevation = None
+
+    for _, element in etree.iterparse(
+        file_name, events=("end",), tag=(TRACKPOINT, LAP, ACTIVITY)
+    ):
+        tag = element.tag
+        if tag == TRACKPOINT:
+            if not _under_root(element, *TRACKPOINT_PATH):
+                continue
+            point = _read_trackpoint(element)
+            if not (only_gps and point[2] is None):
+                summary.add(*point)
+                elevation, heart_rate = point[3], point[4]
+                if heart_rate is not None:
+                    heart_rates_sum += heart_rate
+                    heart_rates_count += 1
+                if elevation is not None:
+                    if last_elevation is not None and elevation > last_elevation:
+                        summary.ascent += elevation - last_elevation
+                    last_elevation = elevation
+                if header_only:
+                    break
+        elif tag == LAP:
+            if not _under_root(element, *LAP_PATH):
+                continue
+            _read_lap(element, summary)
+        elif _under_root(element, "Activities"):
+            # tcxreader reads the sport of every activity
+            element.attrib["Sport"]
+        # drop what has been read, so the tree never holds more than a point
+        element.clear()
+        parent = element.getparent()
+        while element.getprevious() is not None:
+            del parent[0]
+
+    if heart_rates_count:
+        summary.hr_avg = heart_rates_sum / heart_rates_count
+    if len(summary.times) > 2:
+        summary.start_time = summary.times[0]
+        summary.end_time = summary.times[-1]
+        summary.duration = abs((summary.start_time - summary.end_time).total_seconds())
+    return summary
@@ -6,27 +6,57 @@
 # license that can be found in the LICENSE file.
 
 import datetime
+import itertools
+import math
+from array import array
 from datetime import timezone
 import os
 from collections import namedtuple
 
 import gpxpy as mod_gpxpy
 import lxml
-import polyline
+import polyline_codec
 import s2sphere as s2
 from garmin_fit_sdk import Decoder, Stream
 from garmin_fit_sdk.util import FIT_EPOCH_S
-from polyline_processor import filter_out
+from polyline_processor import POLYLINE_LEVELS, filter_out, pick_polyline_level
 from rich import print
 from tcxreader.tcxreader import TCXReader
+from track_metrics import (
+    average_heart_rate,
+    average_speed,
+    elevation_gain,
+    moving_data,
+    moving_time,
+    track_length,
+)
 
 from .exceptions import TrackLoadError
-from .utils import parse_datetime_to_local, get_normalized_sport_type
+from .fit_reader import UnsupportedFitError, read_fit
+from .gpx_stream import read_gpx
+from .tcx_stream import TCXSummary, read_tcx
+from .utils import (
+    get_normalized_sport_type,
+    parse_datetime_to_local,
+    parse_datetimes_to_local,
+)
 
 start_point = namedtuple("start_point", "lat lon")
 run_map = namedtuple("polyline", "summary_polyline")
 
 IGNORE_BEFORE_SAVING = os.getenv("IGNORE_BEFORE_SAVING", False)
+# "gpxpy" builds gpxpy's object tree, "iterparse" streams the file once
+# with gpx_stream.read_gpx, both give the same tracks
+GPX_LOADERS = ("gpxpy", "iterparse")
+GPX_LOADER = os.getenv("GPX_LOADER", "gpxpy")
+# "tcxreader" builds tcxreader's trackpoint objects, "iterparse" streams the
+# file once with tcx_stream.read_tcx, both give the same tracks
+TCX_LOADERS = ("tcxreader", "iterparse")
+TCX_LOADER = os.getenv("TCX_LOADER", "tcxreader")
+# "sdk" decodes every message with garmin_fit_sdk, "mmap" reads only what the
+# track needs with fit_reader.read_fit (and falls back to the sdk)
+FIT_LOADERS = ("sdk", "mmap")
+FIT_LOADER = os.getenv("FIT_LOADER", "sdk")
 
 # Garmin stores all latitude and longitude values as 32-bit integer values.
 # This unit is called semicircle.
@@ -35,17 +65,84 @@ IGNORE_BEFORE_SAVING = os.getenv("IGNORE_BEFORE_SAVING", False)
 # So dividing latitude and longitude (int32) value by 11930465 will give the decimal value.
 SEMICIRCLE = 11930465
 
+NAN = float("nan")
+
+# bump when a loader changes what it reads from a file,
+# so that the tracks in the track_loader parse cache are parsed again
+TRACK_PARSER_VERSION = 3
+
 
 class Track:
+    """
+    One activity. The points are kept in flat float arrays (lats, lngs and,
+    aligned with them, times as timestamps, elevations and heart rates, nan
+    where a file has none), line_starts holds the index of the first point of
+    every line. s2 objects are only built by polylines and bbox when asked for,
+    polylines keeps them until the points change.
+    """
+
+    __slots__ = (
+        "_appended_points",
+        "_encoded_lines",
+        "_end_time_local",
+        "_local_times_from",
+        "_polylines",
+        "_privacy_filter",
+        "_start_time_local",
+        "average_heartrate",
+        "device",
+        "elevation_gain",
+        "elevations",
+        "end_time",
+        "file_names",
+        "heart_rates",
+        "lats",
+        "length",
+        "line_starts",
+        "lngs",
+        "moving_dict",
+        "polyline_levels",
+        "polyline_str",
+        "run_id",
+        "special",
+        "start_latlng",
+        "start_time",
+        "subtype",
+        "times",
+        "track_name",
+        "type",
+    )
+
     def __init__(self):
         self.file_names = []
-        self.polylines = []
+        self.lats = array("d")
+        self.lngs = array("d")
+        self.times = array("d")
+        self.elevations = array("d")
+        self.heart_rates = array("d")
+        self.line_starts = array("l")
+        # (polyline_str, points per line or None for one line, the privacy
+        # filter to run on it first or None) of a cached or db track, decoded
+        # on first use
+        self._encoded_lines = None
+        # the lines as s2.LatLng, built by polylines on first use
+        self._polylines = None
+        # filter_out of the db polylines, None to keep them as they are
+        self._privacy_filter = None
+        # [lat, lng] of the tracks appended to this one, in polyline_container
+        # and polyline_str but not in the lines
+        self._appended_points = []
+        # encoded pre-simplified polylines from the db, level -> polyline str
+        self.polyline_levels = {}
         self.polyline_str = ""
         self.track_name = None
         self.start_time = None
         self.end_time = None
-        self.start_time_local = None
-        self.end_time_local = None
+        self._start_time_local = None
+        self._end_time_local = None
+        # (start_time, end_time, start point) of a track loaded from a file,
+        # the local times are found from on first use or by find_local_times
+        self._local_times_from = None
         self.length = 0
         self.special = False
         self.average_heartrate = None
@@ -57,8 +154,199 @@ class Track:
         self.subtype = None  # for fit file
         self.device = ""
 
-    def load_gpx(self, file_name):
+    def add_line(self, points, times=None, elevations=None, heart_rates=None):
         """
+        Append one line of (lat, lng) points, times (timestamps), elevations
+        and heart_rates are optional lists aligned with points, None for missing.
+        """
+        self._decode_lines()
+        self._polylines = None
+        self.line_starts.append(len(self.lats))
+        for lat, lng in points:
+            self.lats.append(lat)
+            self.lngs.append(lng)
+        count = len(self.lats) - len(self.times)
+        for values, column in (
+            (times, self.times),
+            (elevations, self.elevations),
+            (heart_rates, self.heart_rates),
+        ):
+            if values is None:
+                column.extend([NAN] * count)
+            else:
+                column.extend(NAN if v is None else v for v in values)
+
+    def lines(self):
+        """The points of every line as lists of (lat, lng)"""
+        self._decode_lines()
+        bounds = list(self.line_starts) + [len(self.lats)]
+        return [
+            list(zip(self.lats[start:end], self.lngs[start:end]))
+            for start, end in itertools.pairwise(bounds)
+        ]
+
+    @property
+    def polylines(self):
+        """The lines as lists of s2.LatLng, built once until the points change"""
+        if self._polylines is None:
+            self._polylines = [
+                [s2.LatLng.from_degrees(lat, lng) for lat, lng in line]
+                for line in self.lines()
+            ]
+        return self._polylines
+
+    @polylines.setter
+    def polylines(self, value):
+        self._clear_points()
+        for line in value:
+            self.add_line((p.lat().degrees, p.lng().degrees) for p in line)
+
+    @property
+    def start_time_local(self):
+        self._find_local_times()
+        return self._start_time_local
+
+    @start_time_local.setter
+    def start_time_local(self, value):
+        self._find_local_times()
+        self._start_time_local = value
+
+    @property
+    def end_time_local(self):
+        self._find_local_times()
+        return self._end_time_local
+
+    @end_time_local.setter
+    def end_time_local(self, value):
+        self._find_local_times()
+        self._end_time_local = value
+
+    def _set_local_times(self, point):
+        """The local times are the ones at point, None for no position"""
+        self._local_times_from = (self.start_time, self.end_time, point)
+
+    def _find_local_times(self):
+        if self._local_times_from is not None:
+            local_times = parse_datetime_to_local(*self._local_times_from)
+            self._local_times_from = None
+            self._start_time_local, self._end_time_local = local_times
+
+    @property
+    def polyline_container(self):
+        """All points as [lat, lng] lists, with the ones of the appended tracks"""
+        self._decode_lines()
+        return [
+            [lat, lng] for lat, lng in zip(self.lats, self.lngs)
+        ] + self._appended_points
+
+    @polyline_container.setter
+    def polyline_container(self, value):
+        self._clear_points()
+        self.add_line(value)
+
+    def _clear_points(self):
+        self._encoded_lines = None
+        self._polylines = None
+        self._appended_points = []
+        for column in (
+            self.lats,
+            self.lngs,
+            self.times,
+            self.elevations,
+            self.heart_rates,
+            self.line_starts,
+        ):
+            del column[:]
+
+    def _decode_lines(self):
+        if self._encoded_lines is None:
+            return
+        polyline_str, sizes, privacy_filter = self._encoded_lines
+        self._encoded_lines = None
+        self._polylines = None
+        if privacy_filter:
+            polyline_str = privacy_filter(polyline_str)
+        lats, lngs = polyline_codec.decode(polyline_str or "")
+        if sizes is None:
+            sizes = [len(lats)]
+        start = len(self.lats)
+        for size in sizes:
+            self.line_starts.append(start)
+            start += size
+        # the points after the lines come from appended tracks
+        count = sum(sizes)
+        self._appended_points.extend(
+            [lat, lng] for lat, lng in zip(lats[count:].tolist(), lngs[count:].tolist())
+        )
+        lats, lngs = lats[:count], lngs[:count]
+        self.lats.frombytes(lats.tobytes())
+        self.lngs.frombytes(lngs.tobytes())
+        for column in (self.times, self.elevations, self.heart_rates):
+            column.extend([NAN] * len(lats))
+
+    def to_cache(self):
+        """Scalar fields and the encoded polyline, as stored by the track_loader parse cache"""
+        return {
+            "file_names": self.file_names,
+            "track_name": self.track_name,
+            "start_time": _datetime_to_str(self.start_time),
+            "end_time": _datetime_to_str(self.end_time),
+            "start_time_local": _datetime_to_str(self.start_time_local),
+            "end_time_local": _datetime_to_str(self.end_time_local),
+            "length": self.length,
+            "average_heartrate": self.average_heartrate,
+            "elevation_gain": self.elevation_gain,
+            "moving_dict": {
+                key: (
+                    value.total_seconds()
+                    if isinstance(value, datetime.timedelta)
+                    else value
+                )
+                for key, value in self.moving_dict.items()
+            },
+            "run_id": self.run_id,
+            "start_latlng": list(self.start_latlng),
+            "type": self.type,
+            "subtype": self.subtype,
+            "device": self.device,
+            "polyline_str": self.polyline_str,
+            "line_sizes": [len(line) for line in self.lines()],
+        }
+
+    @classmethod
+    def from_cache(cls, data):
+        t = cls()
+        t.file_names = data["file_names"]
+        t.track_name = data["track_name"]
+        t.start_time = _str_to_datetime(data["start_time"])
+        t.end_time = _str_to_datetime(data["end_time"])
+        t.start_time_local = _str_to_datetime(data["start_time_local"])
+        t.end_time_local = _str_to_datetime(data["end_time_local"])
+        t.length = data["length"]
+        t.average_heartrate = data["average_heartrate"]
+        t.elevation_gain = data["elevation_gain"]
+        t.moving_dict = {
+            key: (
+                datetime.timedelta(seconds=value)
+                if key in ("moving_time", "elapsed_time")
+                else value
+            )
+            for key, value in data["moving_dict"].items()
+        }
+        t.run_id = data["run_id"]
+        t.start_latlng = (
+            start_point(*data["start_latlng"]) if data["start_latlng"] else []
+        )
+        t.type = data["type"]
+        t.subtype = data["subtype"]
+        t.device = data["device"]
+        t.polyline_str = data["polyline_str"]
+        t._encoded_lines = (data["polyline_str"], data["line_sizes"], None)
+        return t
+
+    def load_gpx(self, file_name, loader=GPX_LOADER):
+        """
+        loader: one of GPX_LOADERS
         TODO refactor with load_tcx to one function
         """
         try:
@@ -67,6 +355,9 @@ class Track:
             # (for example, treadmill runs pulled via garmin-connect-export)
             if os.path.getsize(file_name) == 0:
                 raise TrackLoadError("Empty GPX file")
+            if loader == "iterparse":
+                self._load_gpx_stream_data(read_gpx(file_name))
+                return
             with open(file_name, "r", encoding="utf-8", errors="ignore") as file:
                 self._load_gpx_data(mod_gpxpy.parse(file))
         except Exception as e:
@@ -76,28 +367,47 @@ class Track:
             print(str(e))
             pass
 
-    def load_tcx(self, file_name):
+    def load_tcx(self, file_name, loader=TCX_LOADER):
+        """loader: one of TCX_LOADERS"""
         try:
             self.file_names = [os.path.basename(file_name)]
             # Handle empty tcx files
             # (for example, treadmill runs pulled via garmin-connect-export)
-            tcx = TCXReader()
             if os.path.getsize(file_name) == 0:
                 raise TrackLoadError("Empty TCX file")
-            self._load_tcx_data(tcx.read(file_name), file_name=file_name)
+            if loader == "iterparse":
+                tcx = read_tcx(file_name)
+            else:
+                tcx = TCXSummary.from_exercise(TCXReader().read(file_name))
+            self._load_tcx_data(tcx, file_name=file_name)
         except Exception as e:
             print(
                 f"Something went wrong when loading TCX. for file {self.file_names[0]}, we just ignore this file and continue"
             )
             print(str(e))
 
-    def load_fit(self, file_name):
+    def load_fit(self, file_name, loader=FIT_LOADER):
+        """loader: one of FIT_LOADERS"""
         try:
             self.file_names = [os.path.basename(file_name)]
             # Handle empty fit files
             # (for example, treadmill runs pulled via garmin-connect-export)
             if os.path.getsize(file_name) == 0:
                 raise TrackLoadError("Empty FIT file")
+            if loader == "mmap":
+                try:
+                    fit = read_fit(file_name)
+                except UnsupportedFitError:
+                    # decode it with the SDK below
+                    fit = None
+                if fit is not None:
+                    if fit.session is None or fit.session.get("total_distance") is None:
+                        print(
+                            f"Session message or total distance is missing when loading FIT. for file {self.file_names[0]}, we just ignore this file and continue"
+                        )
+                        return
+                    self._load_fit_summary(fit)
+                    return
             stream = Stream.from_file(file_name)
             decoder = Decoder(stream)
             messages, errors = decoder.read(convert_datetimes_to_dates=False)
@@ -122,7 +432,13 @@ class Track:
             )
             print(str(e))
 
-    def load_from_db(self, activity):
+    def load_from_db(self, activity, with_geometry=True, privacy_filter=filter_out):
+        """
+        with_geometry: False leaves the polylines out, for drawers that never
+        look at the points (the columns may not even be loaded)
+        privacy_filter: run on the polylines when IGNORE_BEFORE_SAVING is set,
+        filter_out or the one of a generator.filter_cache.FilterCache
+        """
         # use strava as file name
         self.file_names = [str(activity.run_id)]
         start_time = datetime.datetime.strptime(
@@ -131,12 +447,18 @@ class Track:
         self.start_time_local = start_time
         self.end_time = start_time + activity.elapsed_time
         self.length = float(activity.distance)
-        if IGNORE_BEFORE_SAVING:
-            summary_polyline = filter_out(activity.summary_polyline)
-        else:
-            summary_polyline = activity.summary_polyline
-        polyline_data = polyline.decode(summary_polyline) if summary_polyline else []
-        self.polylines = [[s2.LatLng.from_degrees(p[0], p[1]) for p in polyline_data]]
+        if with_geometry:
+            # one line, decoded (and privacy filtered) on first use
+            self._privacy_filter = privacy_filter if IGNORE_BEFORE_SAVING else None
+            self._encoded_lines = (
+                activity.summary_polyline,
+                None,
+                self._privacy_filter,
+            )
+            self.polyline_levels = {
+                level: getattr(activity, f"summary_polyline_{level}")
+                for level in POLYLINE_LEVELS
+            }
         self.run_id = activity.run_id
         self.type = get_normalized_sport_type(activity.type)
         # Load moving_dict from database
@@ -147,21 +469,50 @@ class Track:
             "average_speed": activity.average_speed or 0,
         }
 
+    def level_polylines(self, resolution):
+        """
+        The polylines of the coarsest stored level whose details are below
+        resolution (meters), the full polylines if there is none.
+        """
+        level = pick_polyline_level(resolution)
+        polyline_str = self.polyline_levels.get(level) if level else None
+        if not polyline_str:
+            return self.polylines
+        if self._privacy_filter:
+            polyline_str = self._privacy_filter(polyline_str)
+        lats, lngs = polyline_codec.decode(polyline_str or "")
+        return [[s2.LatLng.from_degrees(lat, lng) for lat, lng in zip(lats, lngs)]]
+
     def bbox(self):
         """Compute the smallest rectangle that contains the entire track (border box)."""
-        bbox = s2.LatLngRect()
-        for line in self.polylines:
-            for latlng in line:
-                bbox = bbox.union(s2.LatLngRect.from_point(latlng.normalized()))
-        return bbox
+        self._decode_lines()
+        if not self.lats:
+            return s2.LatLngRect()
+        lngs = sorted(math.remainder(lng, 360) for lng in self.lngs)
+        # the longitudes cover the circle but its widest gap between two of
+        # them, which is the one over the 180th meridian unless the track
+        # crosses it
+        west, east = lngs[0], lngs[-1]
+        widest = west + 360 - east
+        for a, b in itertools.pairwise(lngs):
+            if b - a > widest:
+                west, east, widest = b, a, b - a
+        return s2.LatLngRect(
+            s2.LineInterval(
+                math.radians(max(min(self.lats), -90)),
+                math.radians(min(max(self.lats), 90)),
+            ),
+            s2.SphereInterval(math.radians(west), math.radians(east)),
+        )
 
     @staticmethod
     def __make_run_id(time_stamp):
         return int(datetime.datetime.timestamp(time_stamp) * 1000)
 
     def _load_tcx_data(self, tcx, file_name):
+        """tcx: a tcx_stream.TCXSummary"""
         self.length = float(tcx.distance)
-        time_values = [i.time for i in tcx.trackpoints]
+        time_values = tcx.times
         if not time_values:
             raise TrackLoadError("Track is empty.")
 
@@ -170,55 +521,48 @@ class Track:
         elapsed_time = tcx.duration or int(
             self.end_time.timestamp() - self.start_time.timestamp()
         )
-        moving_time = self._calc_moving_time(tcx.trackpoints, 10)
-        moving_time = moving_time or elapsed_time
+        timestamps = [t.timestamp() if t else None for t in time_values]
+        moving_seconds = moving_time(
+            timestamps, self.start_time.timestamp() if self.start_time else None
+        )
+        moving_seconds = moving_seconds or elapsed_time
         self.run_id = self.__make_run_id(self.start_time)
         self.average_heartrate = tcx.hr_avg
-        polyline_container = []
-        position_values = [(i.latitude, i.longitude) for i in tcx.trackpoints]
+        position_values = list(zip(tcx.lats, tcx.lngs))
         if not position_values and int(self.length) == 0:
             raise Exception(
                 f"This {file_name} TCX file do not contain distance and position values we ignore it"
             )
         if position_values:
-            line = [s2.LatLng.from_degrees(p[0], p[1]) for p in position_values]
-            self.polylines.append(line)
-            polyline_container.extend([[p[0], p[1]] for p in position_values])
-            self.polyline_container = polyline_container
-            self.start_time_local, self.end_time_local = parse_datetime_to_local(
-                self.start_time, self.end_time, polyline_container[0]
+            self.add_line(
+                position_values,
+                times=timestamps,
+                elevations=tcx.elevations,
+                heart_rates=tcx.heart_rates,
             )
+            self._set_local_times(position_values[0])
             # get start point
             try:
-                self.start_latlng = start_point(*polyline_container[0])
+                self.start_latlng = start_point(*position_values[0])
             except Exception as e:
                 print(f"Error getting start point: {e}")
                 pass
-            self.polyline_str = polyline.encode(polyline_container)
+            self.polyline_str = polyline_codec.encode_points(position_values)
         self.elevation_gain = tcx.ascent
         self.moving_dict = {
             "distance": self.length,
-            "moving_time": datetime.timedelta(seconds=moving_time),
+            "moving_time": datetime.timedelta(seconds=moving_seconds),
             "elapsed_time": datetime.timedelta(seconds=elapsed_time),
-            "average_speed": self.length / moving_time if moving_time else 0,
+            "average_speed": average_speed(self.length, moving_seconds),
         }
 
     def _calc_moving_time(self, trackpoints, seconds_threshold=10):
-        moving_time = 0
-        try:
-            start_time = self.start_time
-            for i in range(1, len(trackpoints)):
-                if trackpoints[i].time - trackpoints[i - 1].time <= datetime.timedelta(
-                    seconds=seconds_threshold
-                ):
-                    moving_time += (
-                        trackpoints[i].time.timestamp() - start_time.timestamp()
-                    )
-                start_time = trackpoints[i].time
-            return int(moving_time)
-        except Exception as e:
-            print(f"Error calculating moving time: {e}")
-            return 0
+        """Seconds of the steps no longer than seconds_threshold, see track_metrics.moving_time"""
+        return moving_time(
+            [p.time.timestamp() if p.time else None for p in trackpoints],
+            self.start_time.timestamp() if self.start_time else None,
+            seconds_threshold,
+        )
 
     def _load_gpx_data(self, gpx):
         self.start_time, self.end_time = gpx.get_time_bounds()
@@ -231,76 +575,123 @@ class Track:
             if end_time_str:
                 self.end_time = datetime.datetime.fromisoformat(end_time_str)
             if self.start_time and self.end_time:
-                self.start_time_local, self.end_time_local = parse_datetime_to_local(
-                    self.start_time, self.end_time, None
-                )
+                self._set_local_times(None)
         # use timestamp as id
         self.run_id = self.__make_run_id(self.start_time)
         if self.start_time is None:
             raise TrackLoadError("Track has no start time.")
         if self.end_time is None:
             raise TrackLoadError("Track has no end time.")
-        self.length = gpx.length_2d()
-        moving_time = 0
+        self.length = 0
+        calc_moving_time = 0
         for t in gpx.tracks:
             for s in t.segments:
-                moving_time += self._calc_moving_time(s.points, 10)
+                self.length += track_length(
+                    [p.latitude for p in s.points], [p.longitude for p in s.points]
+                )
+                calc_moving_time += self._calc_moving_time(s.points, 10)
         gpx.simplify()
         if self.length == 0:
             self._load_gpx_extensions_data(gpx)
             return
         polyline_container = []
-        heart_rate_list = []
+        gpx_moving_time = 0.0
+        moving_distance = 0.0
+        uphill = 0.0
         for t in gpx.tracks:
             if self.track_name is None:
                 self.track_name = t.name
             if hasattr(t, "type") and t.type:
                 self.type = "Run" if t.type == "running" else t.type
             for s in t.segments:
+                point_heart_rates = None
                 try:
-                    extensions = [
-                        {
-                            lxml.etree.QName(child).localname: child.text
-                            for child in p.extensions[0]
-                        }
-                        for p in s.points
-                        if p.extensions
+                    point_heart_rates = [
+                        self._gpx_point_heart_rate(p) for p in s.points
                     ]
-                    heart_rate_list.extend(
-                        [
-                            int(p["hr"]) if p.__contains__("hr") else None
-                            for p in extensions
-                            if extensions
-                        ]
-                    )
-                    heart_rate_list = list(filter(None, heart_rate_list))
                 except lxml.etree.XMLSyntaxError:
                     # Ignore XML syntax errors in extensions
                     # This can happen if the GPX file is malformed
                     pass
-                line = [
-                    s2.LatLng.from_degrees(p.latitude, p.longitude) for p in s.points
-                ]
-                self.polylines.append(line)
+                self.add_line(
+                    [(p.latitude, p.longitude) for p in s.points],
+                    times=[p.time.timestamp() if p.time else None for p in s.points],
+                    elevations=[p.elevation for p in s.points],
+                    heart_rates=point_heart_rates,
+                )
                 polyline_container.extend([[p.latitude, p.longitude] for p in s.points])
-                self.polyline_container = polyline_container
+                start = self.line_starts[-1]
+                seconds, meters = moving_data(
+                    self.lats[start:],
+                    self.lngs[start:],
+                    self.times[start:],
+                    self.elevations[start:],
+                )
+                gpx_moving_time += seconds
+                moving_distance += meters
+                uphill += elevation_gain(self.elevations[start:])
         # get start point
         try:
             self.start_latlng = start_point(*polyline_container[0])
         except Exception as e:
             print(f"Error getting start point: {e}")
             pass
-        self.start_time_local, self.end_time_local = parse_datetime_to_local(
-            self.start_time, self.end_time, polyline_container[0]
-        )
-        self.polyline_str = polyline.encode(polyline_container)
-        self.average_heartrate = (
-            sum(heart_rate_list) / len(heart_rate_list) if heart_rate_list else None
+        self._set_local_times(polyline_container[0])
+        self.polyline_str = polyline_codec.encode_points(polyline_container)
+        self.average_heartrate = average_heart_rate(self.heart_rates)
+        self.moving_dict = self._get_moving_data(
+            moving_distance, gpx_moving_time, calc_moving_time
         )
-        self.moving_dict = self._get_moving_data(gpx, moving_time)
-        self.elevation_gain = gpx.get_uphill_downhill().uphill
+        self.elevation_gain = uphill
         self._load_gpx_extensions_data(gpx)
 
+    def _load_gpx_stream_data(self, gpx):
+        """The same steps as _load_gpx_data, on a gpx_stream.GPXSummary"""
+        self.start_time, self.end_time = gpx.start_time, gpx.end_time
+        if self.start_time is None or self.end_time is None:
+            start_time_str = gpx.extensions.get("start_time")
+            end_time_str = gpx.extensions.get("end_time")
+            if start_time_str:
+                self.start_time = datetime.datetime.fromisoformat(start_time_str)
+            if end_time_str:
+                self.end_time = datetime.datetime.fromisoformat(end_time_str)
+            if self.start_time and self.end_time:
+                self._set_local_times(None)
+        self.run_id = self.__make_run_id(self.start_time)
+        if self.start_time is None:
+            raise TrackLoadError("Track has no start time.")
+        if self.end_time is None:
+            raise TrackLoadError("Track has no end time.")
+        self.length = gpx.length
+        if self.length == 0:
+            self._apply_gpx_extensions(gpx.extensions)
+            return
+        self.track_name = gpx.track_name
+        if gpx.track_type:
+            self.type = "Run" if gpx.track_type == "running" else gpx.track_type
+        for points, times, elevations, heart_rates in gpx.lines:
+            self.add_line(points, times, elevations, heart_rates)
+        first_point = [self.lats[0], self.lngs[0]]
+        self.start_latlng = start_point(*first_point)
+        self._set_local_times(first_point)
+        self.polyline_str = polyline_codec.encode(self.lats, self.lngs)
+        self.average_heartrate = average_heart_rate(self.heart_rates)
+        self.moving_dict = self._get_moving_data(
+            gpx.moving_distance, gpx.moving_time, gpx.calc_moving_time
+        )
+        self.elevation_gain = gpx.uphill
+        self._apply_gpx_extensions(gpx.extensions)
+
+    @staticmethod
+    def _gpx_point_heart_rate(point):
+        if not point.extensions:
+            return None
+        extension = {
+            lxml.etree.QName(child).localname: child.text
+            for child in point.extensions[0]
+        }
+        return int(extension["hr"]) if "hr" in extension else None
+
     def _load_gpx_extensions_item(self, gpx, item_name):
         """
         Load a specific extension item from the GPX file.
@@ -321,7 +712,7 @@ class Track:
         )
 
     def _load_gpx_extensions_data(self, gpx):
-        gpx_extensions = (
+        self._apply_gpx_extensions(
             {}
             if gpx.extensions is None
             else {
@@ -329,6 +720,9 @@ class Track:
                 for extension in gpx.extensions
             }
         )
+
+    def _apply_gpx_extensions(self, gpx_extensions):
+        """distance, average_hr, average_speed, moving_time and elapsed_time of the file override the computed ones"""
         self.length = (
             self.length
             if gpx_extensions.get("distance") is None
@@ -363,9 +757,33 @@ class Track:
         )
 
     def _load_fit_data(self, fit: dict):
-        _polylines = []
-        self.polyline_container = []
-        message = fit["session_mesgs"][0]
+        self._load_fit_session(fit["session_mesgs"][0])
+        lats, lngs, times, elevations, heart_rates = [], [], [], [], []
+        for record in fit["record_mesgs"]:
+            if "position_lat" in record and "position_long" in record:
+                lats.append(record["position_lat"])
+                lngs.append(record["position_long"])
+                times.append(
+                    record["timestamp"] + FIT_EPOCH_S if "timestamp" in record else None
+                )
+                elevations.append(
+                    record.get("enhanced_altitude", record.get("altitude"))
+                )
+                heart_rates.append(record.get("heart_rate"))
+        self._load_fit_points(lats, lngs, times, elevations, heart_rates)
+        if "file_id_mesgs" in fit:
+            self._load_fit_device(fit["file_id_mesgs"][0])
+
+    def _load_fit_summary(self, fit):
+        """The same as _load_fit_data, from a fit_reader.FitSummary"""
+        self._load_fit_session(fit.session)
+        self._load_fit_points(
+            fit.lats, fit.lngs, fit.timestamps, fit.elevations, fit.heart_rates
+        )
+        if fit.file_id is not None:
+            self._load_fit_device(fit.file_id)
+
+    def _load_fit_session(self, message):
         self.start_time = datetime.datetime.fromtimestamp(
             (message["start_time"] + FIT_EPOCH_S), tz=timezone.utc
         )
@@ -404,31 +822,26 @@ class Track:
             if message["enhanced_avg_speed"]
             else message["avg_speed"]
         )
-        for record in fit["record_mesgs"]:
-            if "position_lat" in record and "position_long" in record:
-                lat = record["position_lat"] / SEMICIRCLE
-                lng = record["position_long"] / SEMICIRCLE
-                _polylines.append(s2.LatLng.from_degrees(lat, lng))
-                self.polyline_container.append([lat, lng])
-        if self.polyline_container:
-            self.start_time_local, self.end_time_local = parse_datetime_to_local(
-                self.start_time, self.end_time, self.polyline_container[0]
-            )
-            self.start_latlng = start_point(*self.polyline_container[0])
-            self.polylines.append(_polylines)
-            self.polyline_str = polyline.encode(self.polyline_container)
+
+    def _load_fit_points(self, lats, lngs, times, elevations, heart_rates):
+        """lats, lngs in semicircles, of the records with a position"""
+        polyline_container = [
+            [lat / SEMICIRCLE, lng / SEMICIRCLE] for lat, lng in zip(lats, lngs)
+        ]
+        if polyline_container:
+            self._set_local_times(polyline_container[0])
+            self.start_latlng = start_point(*polyline_container[0])
+            self.add_line(polyline_container, times, elevations, heart_rates)
+            self.polyline_str = polyline_codec.encode_points(polyline_container)
         else:
-            self.start_time_local, self.end_time_local = parse_datetime_to_local(
-                self.start_time, self.end_time, None
-            )
+            self._set_local_times(None)
 
+    def _load_fit_device(self, device_message):
         # The FIT file created by Garmin
-        if "file_id_mesgs" in fit:
-            device_message = fit["file_id_mesgs"][0]
-            if "manufacturer" in device_message:
-                self.device = device_message["manufacturer"]
-            if "garmin_product" in device_message:
-                self.device += " " + device_message["garmin_product"]
+        if "manufacturer" in device_message:
+            self.device = device_message["manufacturer"]
+        if "garmin_product" in device_message:
+            self.device += " " + device_message["garmin_product"]
 
     def append(self, other):
         """Append other track to self."""
@@ -439,8 +852,29 @@ class Track:
             self.moving_dict["distance"] += other.moving_dict["distance"]
             self.moving_dict["moving_time"] += other.moving_dict["moving_time"]
             self.moving_dict["elapsed_time"] += other.moving_dict["elapsed_time"]
-            self.polyline_container.extend(other.polyline_container)
-            self.polyline_str = polyline.encode(self.polyline_container)
+            # the lines (and bbox) stay the ones of this track, only the
+            # polyline gets the other points
+            self._decode_lines()
+            points = other.polyline_container
+            if self._appended_points:
+                previous = self._appended_points[-1]
+            elif self.lats:
+                previous = (self.lats[-1], self.lngs[-1])
+            else:
+                previous = None
+            self._appended_points.extend(points)
+            if self.polyline_str and previous is not None:
+                # only encode the new points, from the last one already encoded
+                self.polyline_str = polyline_codec.append(
+                    self.polyline_str,
+                    [p[0] for p in points],
+                    [p[1] for p in points],
+                    previous,
+                )
+            else:
+                self.polyline_str = polyline_codec.encode_points(
+                    self.polyline_container
+                )
             self.moving_dict["average_speed"] = (
                 self.moving_dict["distance"]
                 / self.moving_dict["moving_time"].total_seconds()
@@ -458,17 +892,14 @@ class Track:
             pass
 
     @staticmethod
-    def _get_moving_data(gpx, moving_time):
-        moving_data = gpx.get_moving_data()
-        elapsed_time = moving_data.moving_time
+    def _get_moving_data(moving_distance, elapsed_time, moving_time):
+        """elapsed_time: seconds moving faster than 1 km/h, the fallback of moving_time"""
         moving_time = moving_time or elapsed_time
         return {
-            "distance": moving_data.moving_distance,
+            "distance": moving_distance,
             "moving_time": datetime.timedelta(seconds=moving_time),
             "elapsed_time": datetime.timedelta(seconds=elapsed_time),
-            "average_speed": (
-                moving_data.moving_distance / moving_time if moving_time else 0
-            ),
+            "average_speed": average_speed(moving_distance, moving_time),
         }
 
     def to_namedtuple(self, run_from="gpx"):
@@ -492,3 +923,23 @@ class Track:
         d.update(self.moving_dict)
         # return a nametuple that can use . to get attr
         return namedtuple("x", d.keys())(*d.values())
+
+
+def _datetime_to_str(value):
+    return value.isoformat() if value else None
+
+
+def _str_to_datetime(value):
+    return datetime.datetime.fromisoformat(value) if value else None
+
+
+def find_local_times(tracks):
+    """
+    Local times of the tracks loaded from files, the zones of all their start
+    points looked up at once, like for a whole import
+    """
+    tracks = [t for t in tracks if t._local_times_from is not None]
+    local_times = parse_datetimes_to_local([t._local_times_from for t in tracks])
+    for t, (start_time_local, end_time_local) in zip(tracks, local_times):
+        t._local_times_from = None
+        t._start_time_local, t._end_time_local = start_time_local, end_time_local
@@ -6,109 +6,404 @@
 # Use of this source code is governed by a MIT-style
 # license that can be found in the LICENSE file.
 
+import functools
+import hashlib
+import json
 import logging
 import os
+import pickle
+import signal
+import sqlite3
 import sys
+import threading
 
 sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
 import concurrent.futures
 
+from config import TRACK_CACHE_FILE
 from generator.db import Activity, init_db
+from generator.filter_cache import POLYLINE_COLUMNS, FilterCache, filter_cache_file
+from generator.spatial import bbox_filter_sql
+from polyline_processor import POLYLINE_LEVELS, filter_out
+from sqlalchemy import text
+from sqlalchemy.orm import defer
 
 from .exceptions import ParameterError, TrackLoadError
-from .track import Track
+from .track import (
+    FIT_LOADER,
+    FIT_LOADERS,
+    GPX_LOADER,
+    GPX_LOADERS,
+    IGNORE_BEFORE_SAVING,
+    TCX_LOADER,
+    TCX_LOADERS,
+    TRACK_PARSER_VERSION,
+    Track,
+    find_local_times,
+)
 from .year_range import YearRange
 
-from synced_data_file_logger import load_synced_file_list
+from synced_data_file_logger import SyncedFileManifest
 
 log = logging.getLogger(__name__)
 
+# parse every file again instead of using the track cache
+DISABLE_TRACK_CACHE = os.getenv("DISABLE_TRACK_CACHE", "").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+# also compare a content hash, for files rewritten with the same size and mtime
+TRACK_CACHE_HASH = os.getenv("TRACK_CACHE_HASH", "").lower() in ("1", "true", "yes")
 
-def load_gpx_file(file_name, activity_title_dict={}):
+# worker processes parsing data files, 1 parses everything in this process
+TRACK_LOAD_WORKERS = int(os.getenv("TRACK_LOAD_WORKERS", "0")) or os.cpu_count() or 1
+# batches of at most this many files are parsed in this process
+SERIAL_LOAD_THRESHOLD = int(os.getenv("SERIAL_LOAD_THRESHOLD", "8"))
+# files per task sent to a worker, and tasks queued per worker at most
+LOAD_CHUNK_SIZE = int(os.getenv("LOAD_CHUNK_SIZE", "4"))
+LOAD_TASKS_PER_WORKER = 2
+# seconds one file may take to parse before it is skipped, 0 for no limit
+TRACK_LOAD_TIMEOUT = float(os.getenv("TRACK_LOAD_TIMEOUT", "120"))
+
+
+def load_gpx_file(file_name, activity_title_dict=None, gpx_loader=GPX_LOADER):
     """Load an individual GPX file as a track by using Track.load_gpx()"""
     t = Track()
-    t.load_gpx(file_name)
+    t.load_gpx(file_name, loader=gpx_loader)
     file_id = os.path.basename(file_name).split(".")[0]
     if activity_title_dict:
         t.track_name = activity_title_dict.get(file_id, t.track_name)
     return t
 
 
-def load_tcx_file(file_name, activity_title_dict={}):
+def load_tcx_file(file_name, activity_title_dict=None, tcx_loader=TCX_LOADER):
     """Load an individual TCX file as a track by using Track.load_tcx()"""
     t = Track()
-    t.load_tcx(file_name)
+    t.load_tcx(file_name, loader=tcx_loader)
     file_id = os.path.basename(file_name).split(".")[0]
     if activity_title_dict:
         t.track_name = activity_title_dict.get(file_id, t.track_name)
     return t
 
 
-def load_fit_file(file_name, activity_title_dict={}):
+def load_fit_file(file_name, activity_title_dict=None, fit_loader=FIT_LOADER):
     """Load an individual FIT file as a track by using Track.load_fit()"""
     t = Track()
-    t.load_fit(file_name)
+    t.load_fit(file_name, loader=fit_loader)
     file_id = os.path.basename(file_name).split(".")[0]
     if activity_title_dict:
         t.track_name = activity_title_dict.get(file_id, t.track_name)
     return t
 
 
+# load function: (its loader keyword and TrackLoader attribute, the loaders)
+LOADER_OPTIONS = {
+    load_gpx_file: ("gpx_loader", GPX_LOADERS),
+    load_tcx_file: ("tcx_loader", TCX_LOADERS),
+    load_fit_file: ("fit_loader", FIT_LOADERS),
+}
+
+
+class _LoadTimeout(BaseException):
+    """Raised by the alarm, a BaseException so the loaders' except Exception let it through"""
+
+
+def _raise_load_timeout(signum, frame):
+    raise _LoadTimeout()
+
+
+def _load_one(load_func, file_name, timeout=TRACK_LOAD_TIMEOUT):
+    """Parse one file in this process, return (file_name, track, error)"""
+    # SIGALRM only exists on unix and only reaches the main thread
+    use_alarm = (
+        timeout > 0
+        and hasattr(signal, "SIGALRM")
+        and threading.current_thread() is threading.main_thread()
+    )
+    if use_alarm:
+        previous_handler = signal.signal(signal.SIGALRM, _raise_load_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return file_name, load_func(file_name), None
+    except _LoadTimeout:
+        return file_name, None, f"timed out after {timeout:g}s"
+    except TrackLoadError as e:
+        return file_name, None, str(e)
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous_handler)
+
+
+def _load_chunk(load_func, file_names, timeout):
+    return [_load_one(load_func, file_name, timeout) for file_name in file_names]
+
+
+_executor = None
+
+
+def _get_executor():
+    """One pool per process, reused by every load_tracks call"""
+    global _executor
+    if _executor is None:
+        _executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=TRACK_LOAD_WORKERS
+        )
+    return _executor
+
+
+def shutdown_load_pool():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown()
+        _executor = None
+
+
+def _pool_results(file_names, load_func, timeout):
+    max_pending = TRACK_LOAD_WORKERS * LOAD_TASKS_PER_WORKER
+    pending = {}
+
+    def results(future):
+        chunk = pending.pop(future)
+        try:
+            return future.result()
+        except concurrent.futures.process.BrokenProcessPool as e:
+            # a worker died, start a new pool for the next chunks
+            global _executor
+            _executor = None
+            return [(file_name, None, str(e)) for file_name in chunk]
+        except pickle.PicklingError as e:
+            # a track the worker could not send back
+            return [(file_name, None, str(e)) for file_name in chunk]
+
+    for start in range(0, len(file_names), LOAD_CHUNK_SIZE):
+        chunk = file_names[start : start + LOAD_CHUNK_SIZE]
+        pending[_get_executor().submit(_load_chunk, load_func, chunk, timeout)] = chunk
+        while len(pending) >= max_pending:
+            done, _ = concurrent.futures.wait(
+                pending, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in done:
+                yield from results(future)
+    for future in concurrent.futures.as_completed(list(pending)):
+        yield from results(future)
+
+
+def iter_load_tracks(file_names, load_func=load_gpx_file, timeout=TRACK_LOAD_TIMEOUT):
+    """
+    Yield (file_name, Track) as soon as each file is parsed.
+    Small batches are parsed in this process, bigger ones in the shared
+    worker pool with a bounded number of queued chunks.
+    A file failing or taking longer than timeout seconds is logged and skipped.
+    """
+    file_names = list(file_names)
+    if TRACK_LOAD_WORKERS == 1 or len(file_names) <= SERIAL_LOAD_THRESHOLD:
+        results = (_load_one(load_func, f, timeout) for f in file_names)
+    else:
+        results = _pool_results(file_names, load_func, timeout)
+    for done, (file_name, track, error) in enumerate(results, 1):
+        if error is not None:
+            log.error(f"Error while loading {file_name}: {error}")
+        else:
+            yield file_name, track
+        if done % 100 == 0:
+            log.info(f"Loaded {done}/{len(file_names)} files")
+
+
+class TrackCache:
+    """
+    Persistent cache of parsed tracks, one row per data file.
+
+    A row is only used while the file still has the same size, mtime (and
+    content hash if use_hash) and was parsed by the same TRACK_PARSER_VERSION.
+    Tracks are stored as Track.to_cache json, the points as the encoded polyline.
+    """
+
+    def __init__(self, file_name=TRACK_CACHE_FILE, use_hash=TRACK_CACHE_HASH):
+        self.use_hash = use_hash
+        self.conn = sqlite3.connect(file_name)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS tracks ("
+            "path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, hash TEXT, "
+            "parser_version INTEGER, track TEXT)"
+        )
+
+    def fingerprint(self, file_name):
+        stat = os.stat(file_name)
+        content_hash = None
+        if self.use_hash:
+            with open(file_name, "rb") as f:
+                content_hash = hashlib.sha1(f.read()).hexdigest()
+        return stat.st_size, stat.st_mtime_ns, content_hash
+
+    def load(self, file_names):
+        """
+        Return ({file_name: cached Track}, {file_name: fingerprint}) where the
+        second dict holds the files to parse again.
+        """
+        rows = {
+            row[0]: row[1:]
+            for row in self.conn.execute(
+                "SELECT path, size, mtime_ns, hash, parser_version, track FROM tracks"
+            )
+        }
+        tracks = {}
+        misses = {}
+        for file_name in file_names:
+            try:
+                fingerprint = self.fingerprint(file_name)
+            except OSError as e:
+                log.error(f"Error while reading {file_name}: {e}")
+                continue
+            row = rows.get(file_name)
+            if (
+                row is not None
+                and row[3] == TRACK_PARSER_VERSION
+                and tuple(row[:2]) == fingerprint[:2]
+                and (not self.use_hash or row[2] == fingerprint[2])
+            ):
+                try:
+                    tracks[file_name] = Track.from_cache(json.loads(row[4]))
+                    continue
+                except (ValueError, KeyError, TypeError) as e:
+                    log.error(f"Bad track cache entry of {file_name}: {e}")
+            misses[file_name] = fingerprint
+        return tracks, misses
+
+    def save(self, tracks, fingerprints):
+        """tracks: {file_name: Track} parsed from files with these fingerprints"""
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO tracks VALUES (?, ?, ?, ?, ?, ?)",
+            [
+                (
+                    file_name,
+                    *fingerprints[file_name],
+                    TRACK_PARSER_VERSION,
+                    json.dumps(t.to_cache()),
+                )
+                for file_name, t in tracks.items()
+                if file_name in fingerprints
+            ],
+        )
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
 class TrackLoader:
     """
     Attributes:
         min_length: All tracks shorter than this value are filtered out.
         special_file_names: Tracks marked as special in command line args
         year_range: All tracks outside of this range will be filtered out.
+        gpx_loader: How GPX files are parsed, one of GPX_LOADERS
+        tcx_loader: How TCX files are parsed, one of TCX_LOADERS
+        fit_loader: How FIT files are decoded, one of FIT_LOADERS
 
     Methods:
         load_tracks: Load all data from GPX files
+        load_track_files: Load the given data files
     """
 
     def __init__(self):
         self.min_length = 100
         self.special_file_names = []
         self.year_range = YearRange()
+        self.use_cache = not DISABLE_TRACK_CACHE
+        self.cache_file = TRACK_CACHE_FILE
+        self.gpx_loader = GPX_LOADER
+        self.tcx_loader = TCX_LOADER
+        self.fit_loader = FIT_LOADER
         self.load_func_dict = {
             "gpx": load_gpx_file,
             "tcx": load_tcx_file,
             "fit": load_fit_file,
         }
 
-    def load_tracks(self, data_dir, file_suffix="gpx", activity_title_dict={}):
+    def load_tracks(self, data_dir, file_suffix="gpx", activity_title_dict=None):
         """Load tracks data_dir and return as a List of tracks"""
         file_names = [x for x in self._list_data_files(data_dir, file_suffix)]
         print(f"{file_suffix.upper()} files: {len(file_names)}")
+        return self.load_track_files(file_names, file_suffix, activity_title_dict)
 
-        tracks = []
-
-        loaded_tracks = self._load_data_tracks(
-            file_names,
-            self.load_func_dict.get(file_suffix, load_gpx_file),
-            activity_title_dict,
-        )
+    def load_track_files(self, file_names, file_suffix="gpx", activity_title_dict=None):
+        """Load the given data files, synced or not, as a List of tracks"""
+        load_func = self.load_func_dict.get(file_suffix, load_gpx_file)
+        if load_func in LOADER_OPTIONS:
+            option, loaders = LOADER_OPTIONS[load_func]
+            loader = getattr(self, option)
+            if loader not in loaders:
+                raise ParameterError(f"Unknown {file_suffix.upper()} loader: {loader}")
+            load_func = functools.partial(load_func, **{option: loader})
+        if self.use_cache:
+            cache = TrackCache(self.cache_file)
+            loaded_tracks, fingerprints = cache.load(file_names)
+            log.info(f"Tracks from cache: {len(loaded_tracks)}")
+            # the cache keeps the parsed names, titles are applied below
+            parsed_tracks = self._load_data_tracks(list(fingerprints), load_func)
+            cache.save(parsed_tracks, fingerprints)
+            cache.close()
+        else:
+            loaded_tracks = {}
+            parsed_tracks = self._load_data_tracks(file_names, load_func)
+        loaded_tracks.update(parsed_tracks)
+        log.info(f"Conventionally loaded tracks: {len(parsed_tracks)}")
 
-        tracks.extend(loaded_tracks.values())
-        log.info(f"Conventionally loaded tracks: {len(loaded_tracks)}")
+        tracks = []
+        for file_name in file_names:
+            t = loaded_tracks.get(file_name)
+            if t is None:
+                continue
+            if activity_title_dict:
+                file_id = os.path.basename(file_name).split(".")[0]
+                t.track_name = activity_title_dict.get(file_id, t.track_name)
+            tracks.append(t)
 
         tracks = self._filter_tracks(tracks)
         # filter out tracks with length < min_length
         return [t for t in tracks if t.length >= self.min_length]
 
-    def load_tracks_from_db(self, sql_file, is_grid=False):
+    def load_tracks_from_db(
+        self, sql_file, is_grid=False, bbox=None, with_geometry=True
+    ):
+        """
+        bbox: (min_lat, min_lng, max_lat, max_lng), only load the tracks crossing it
+        with_geometry: False for drawers without TracksDrawer.needs_geometry,
+        the polyline columns are then not even read
+        """
         session = init_db(sql_file)
+        activities = session.query(Activity)
+        if not with_geometry:
+            activities = activities.options(
+                defer(Activity.summary_polyline),
+                *(
+                    defer(getattr(Activity, f"summary_polyline_{level}"))
+                    for level in POLYLINE_LEVELS
+                ),
+            )
         if is_grid:
-            activities = (
-                session.query(Activity)
-                .filter(Activity.summary_polyline != "")
-                .order_by(Activity.start_date_local)
+            activities = activities.filter(Activity.summary_polyline != "")
+        if bbox:
+            bbox_sql, params = bbox_filter_sql(bbox)
+            activities = activities.filter(text(bbox_sql)).params(**params)
+        activities = activities.order_by(Activity.start_date_local).all()
+        privacy_filter = filter_out
+        if with_geometry and IGNORE_BEFORE_SAVING:
+            # filter what is not in the db yet now, the tracks decode later
+            cache = FilterCache(filter_cache_file(sql_file))
+            cache.update(
+                getattr(activity, column)
+                for activity in activities
+                for column in POLYLINE_COLUMNS
             )
-        else:
-            activities = session.query(Activity).order_by(Activity.start_date_local)
+            cache.close()
+            privacy_filter = cache.filter_out
         tracks = []
         for activity in activities:
             t = Track()
-            t.load_from_db(activity)
+            t.load_from_db(activity, with_geometry, privacy_filter)
             tracks.append(t)
         print(f"All tracks: {len(tracks)}")
         tracks = self._filter_tracks(tracks)
@@ -133,37 +428,33 @@ class TrackLoader:
         return filtered_tracks
 
     @staticmethod
-    def _load_data_tracks(file_names, load_func=load_gpx_file, activity_title_dict={}):
+    def _load_data_tracks(
+        file_names, load_func=load_gpx_file, activity_title_dict=None
+    ):
         """
-        TODO refactor with _load_tcx_tracks
+        {file_name: Track} of the files that could be loaded, see
+        iter_load_tracks, with the zones of the whole import looked up at once
         """
-        tracks = {}
-        with concurrent.futures.ProcessPoolExecutor() as executor:
-            future_to_file_name = {
-                executor.submit(load_func, file_name, activity_title_dict): file_name
-                for file_name in file_names
-            }
-        for future in concurrent.futures.as_completed(future_to_file_name):
-            file_name = future_to_file_name[future]
-            try:
-                t = future.result()
-            except TrackLoadError as e:
-                log.error(f"Error while loading {file_name}: {e}")
-            else:
-                tracks[file_name] = t
+        if activity_title_dict:
+            load_func = functools.partial(
+                load_func, activity_title_dict=activity_title_dict
+            )
+        tracks = dict(iter_load_tracks(file_names, load_func))
+        find_local_times(tracks.values())
         return tracks
 
     @staticmethod
     def _list_data_files(data_dir, file_suffix):
-        synced_files = load_synced_file_list()
         data_dir = os.path.abspath(data_dir)
         if not os.path.isdir(data_dir):
             raise ParameterError(f"Not a directory: {data_dir}")
-        for name in os.listdir(data_dir):
-            if name.startswith("."):
-                continue
-            if name in synced_files:
-                continue
-            path_name = os.path.join(data_dir, name)
-            if name.endswith(f".{file_suffix}") and os.path.isfile(path_name):
-                yield path_name
+        manifest = SyncedFileManifest()
+        try:
+            for name in os.listdir(data_dir):
+                if name.startswith(".") or not name.endswith(f".{file_suffix}"):
+                    continue
+                path_name = os.path.join(data_dir, name)
+                if os.path.isfile(path_name) and not manifest.is_synced(path_name):
+                    yield path_name
+        finally:
+            manifest.close()
@@ -18,6 +18,10 @@ from .xy import XY
 class TracksDrawer:
     """Base class that other drawer classes inherit from."""
 
+    # whether draw looks at the points of the tracks, see
+    # TrackLoader.load_tracks_from_db
+    needs_geometry = False
+
     def __init__(self, the_poster: Poster):
         self.poster = the_poster
 
@@ -7,23 +7,12 @@
 
 import locale
 import math
-from datetime import datetime
 from typing import List, Optional, Tuple
 
 import colour
 import pytz
 import s2sphere as s2
-
-try:
-    from tzfpy import get_tz
-
-    tf = None
-except ImportError:
-    # tzfpy is not available, fallback to timezonefinder
-    from timezonefinder import TimezoneFinder
-
-    tf = TimezoneFinder()
-
+from timezones import DEFAULT_TIMEZONE, timezones_at, utc_offset
 
 from .xy import XY
 
@@ -77,6 +66,17 @@ def project(
     return lines
 
 
+def bbox_resolution(bbox: s2.LatLngRect, size: XY, stroke_width: float) -> float:
+    """Meters covered by one stroke width when bbox is drawn into size"""
+    lat_size = bbox.lat_hi().degrees - bbox.lat_lo().degrees
+    lng_size = (bbox.lng_hi().degrees - bbox.lng_lo().degrees) % 360
+    meters = max(
+        lat_size * 110540,
+        lng_size * 111320 * math.cos(math.radians(bbox.get_center().lat().degrees)),
+    )
+    return meters / max(min(size.x, size.y) / stroke_width, 1)
+
+
 def compute_grid(
     count: int, dimensions: XY
 ) -> Tuple[Optional[float], Optional[Tuple[int, int]]]:
@@ -120,23 +120,37 @@ def format_float(f):
 
 
 def parse_datetime_to_local(start_time, end_time, point):
-    if not point:
-        timezone = "Asia/Shanghai"
-    else:
-        # just parse the start time, because start/end maybe different
-        offset = start_time.utcoffset()
-        if offset:
-            return start_time + offset, end_time + offset
-        lat, lng = point
-        try:
-            timezone = get_tz(lng=lng, lat=lat)
-        except Exception as e:
-            # just a little trick when tzfpy support windows will delete this
-            print(f"tzfpy error: {e} fallback to timezonefinder")
-            lat, lng = point
-            timezone = tf.timezone_at(lng=lng, lat=lat)
-    tc_offset = datetime.now(pytz.timezone(timezone)).utcoffset()
-    return start_time + tc_offset, end_time + tc_offset
+    return parse_datetimes_to_local([(start_time, end_time, point)])[0]
+
+
+def parse_datetimes_to_local(times):
+    """
+    parse_datetime_to_local of many (start_time, end_time, point), like the
+    tracks of a whole import, with the zones of all points looked up at once.
+    (None, None) for the times whose zone is not known.
+    """
+    # just parse the start time, because start/end maybe different
+    tz_names = timezones_at(
+        [
+            point if point and not start_time.utcoffset() else None
+            for start_time, _, point in times
+        ]
+    )
+    local_times = []
+    for (start_time, end_time, point), tz_name in zip(times, tz_names):
+        if not point:
+            offset = utc_offset(start_time, DEFAULT_TIMEZONE)
+        elif start_time.utcoffset():
+            offset = start_time.utcoffset()
+        else:
+            try:
+                offset = utc_offset(start_time, tz_name)
+            except pytz.UnknownTimeZoneError:
+                print(f"Unknown time zone {tz_name!r} at {point}")
+                local_times.append((None, None))
+                continue
+        local_times.append((start_time + offset, end_time + offset))
+    return local_times
 
 
 def get_normalized_sport_type(sport_type):
@@ -1,7 +1,6 @@
 # some code from https://github.com/fieryd/PKURunningHelper great thanks
 import argparse
 import ast
-import json
 import os
 import subprocess
 import sys
@@ -16,7 +15,7 @@ from urllib.parse import quote
 import xml.etree.ElementTree as ET
 import gpxpy
 import numpy as np
-import polyline
+from polyline_codec import encode_points
 import requests
 from config import (
     BASE_TIMEZONE,
@@ -28,6 +27,9 @@ from config import (
     start_point,
 )
 from generator import Generator
+from generator.dedup import DedupEntry, DuplicateIndex
+from generator.id_index import get_downloaded_ids
+from track_metrics import gpx_elevation_gain
 from utils import adjust_time
 
 # struct body
@@ -560,7 +562,7 @@ class Joyrun:
                 run_data["heartrate"],
                 run_data["altitude"],
             )
-            elevation_gain = gpx_data.get_uphill_downhill().uphill
+            elevation_gain = gpx_elevation_gain(gpx_data)
             if with_gpx and str(joyrun_id) not in old_gpx_ids:
                 download_joyrun_gpx(gpx_data.to_xml(), str(joyrun_id))
 
@@ -581,7 +583,7 @@ class Joyrun:
             if heart_rate < 0:
                 heart_rate = None
 
-        polyline_str = polyline.encode(run_points_data) if run_points_data else ""
+        polyline_str = encode_points(run_points_data)
         start_latlng = start_point(*run_points_data[0]) if run_points_data else None
         start_date = datetime.fromtimestamp(start_time, tz=timezone.utc)
         start_date_local = adjust_time(start_date, BASE_TIMEZONE)
@@ -623,33 +625,34 @@ class Joyrun:
         self, old_tracks_ids, with_gpx=False, with_tcx=False, threshold=10
     ):
         run_ids = self.get_runs_records_ids()
-        old_tracks_ids = [int(i) for i in old_tracks_ids if i.isdigit()]
+        old_tracks_ids = {int(i) for i in old_tracks_ids if i.isdigit()}
 
-        old_gpx_ids = os.listdir(GPX_FOLDER)
-        old_gpx_ids = [i.split(".")[0] for i in old_gpx_ids if not i.startswith(".")]
-        new_run_ids = list(set(run_ids) - set(old_tracks_ids))
+        old_gpx_ids = get_downloaded_ids(GPX_FOLDER)
+        new_run_ids = list(set(run_ids) - old_tracks_ids)
         tracks = []
-        seen_runs = {}  # Dictionary to keep track of unique runs with start time as key
+        # runs starting within threshold seconds are one, the longest is kept
+        seen_runs = DuplicateIndex(threshold, distance_ratio=None, start_distance=None)
+        run_datas = {}
         for i in new_run_ids:
             run_data = self.get_single_run_record(i)
-            start_time = datetime.fromtimestamp(run_data["runrecord"]["starttime"])
-            distance = run_data["runrecord"]["meter"]
-
-            is_duplicate = False
-            for seen_start in list(seen_runs.keys()):
-                if abs((start_time - seen_start).total_seconds()) <= threshold:
-                    if distance > seen_runs[seen_start]["distance"]:
-                        seen_runs[seen_start] = {
-                            "run_data": run_data,
-                            "distance": distance,
-                        }
-                    is_duplicate = True
-                    break
-            if not is_duplicate:
-                seen_runs[start_time] = {"run_data": run_data, "distance": distance}
-        for run in seen_runs.values():
+            entry = DedupEntry(
+                i,
+                "joyrun",
+                run_data["runrecord"]["starttime"],
+                run_data["runrecord"]["meter"],
+                None,
+            )
+            seen = seen_runs.find(entry)
+            if seen is not None:
+                if entry.distance <= seen.distance:
+                    continue
+                seen_runs.remove(seen)
+                del run_datas[seen.run_id]
+            seen_runs.add(entry)
+            run_datas[i] = run_data
+        for run_data in run_datas.values():
             track = self.parse_raw_data_to_nametuple(
-                run["run_data"], old_gpx_ids, with_gpx, with_tcx
+                run_data, old_gpx_ids, with_gpx, with_tcx
             )
             tracks.append(track)
         return tracks
@@ -783,14 +786,12 @@ if __name__ == "__main__":
         j.login_by_phone()
 
     generator = Generator(SQL_FILE)
-    old_tracks_ids = generator.get_old_tracks_ids()
+    old_tracks_ids = generator.get_known_ids()
     tracks = j.get_all_joyrun_tracks(
         old_tracks_ids, options.with_gpx, options.with_tcx, options.threshold
     )
-    generator.sync_from_app(tracks)
-    activities_list = generator.load()
-    with open(JSON_FILE, "w") as f:
-        json.dump(activities_list, f)
+    generator.sync_from_app(tracks, source="joyrun")
+    generator.export_json(JSON_FILE)
 
     print("Data export to DB done")
     _generate_svg_profile(options.athlete, options.min_grid_distance)
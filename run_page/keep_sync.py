@@ -9,7 +9,7 @@ from datetime import datetime, timedelta, timezone
 from xml.dom import minidom
 import eviltransform
 import gpxpy
-import polyline
+from polyline_codec import encode_points
 import requests
 from config import (
     GPX_FOLDER,
@@ -21,6 +21,8 @@ from config import (
 )
 from Crypto.Cipher import AES
 from generator import Generator
+from generator.id_index import get_downloaded_ids
+from track_metrics import gpx_elevation_gain
 from utils import adjust_time
 import xml.etree.ElementTree as ET
 
@@ -162,7 +164,7 @@ def parse_raw_data_to_nametuple(
                 gpx_data = parse_points_to_gpx(
                     run_points_data_gpx, start_time, KEEP2STRAVA[run_data["dataType"]]
                 )
-                elevation_gain = gpx_data.get_uphill_downhill().uphill
+                elevation_gain = gpx_elevation_gain(gpx_data)
                 if str(keep_id) not in old_gpx_ids:
                     download_keep_gpx(gpx_data.to_xml(), str(keep_id))
             if with_tcx:
@@ -174,7 +176,7 @@ def parse_raw_data_to_nametuple(
                     download_keep_tcx(tcx_data.toprettyxml(), str(keep_id))
     else:
         print(f"ID {keep_id} no gps data")
-    polyline_str = polyline.encode(run_points_data) if run_points_data else ""
+    polyline_str = encode_points(run_points_data)
     start_latlng = start_point(*run_points_data[0]) if run_points_data else None
     start_date = datetime.fromtimestamp(start_time // 1000, tz=timezone.utc)
     tz_name = run_data.get("timezone", "")
@@ -229,18 +231,8 @@ def get_all_keep_tracks(
         runs = get_to_download_runs_ids(s, headers, api)
         runs = [run for run in runs if run.split("_")[1] not in old_tracks_ids]
         print(f"{len(runs)} new keep {api} data to generate")
-        old_gpx_ids = []
-        if with_gpx:
-            old_gpx_ids = os.listdir(GPX_FOLDER)
-            old_gpx_ids = [
-                i.split(".")[0] for i in old_gpx_ids if not i.startswith(".")
-            ]
-        old_tcx_ids = []
-        if with_tcx:
-            old_tcx_ids = os.listdir(TCX_FOLDER)
-            old_tcx_ids = [
-                i.split(".")[0] for i in old_tcx_ids if not i.startswith(".")
-            ]
+        old_gpx_ids = get_downloaded_ids(GPX_FOLDER) if with_gpx else set()
+        old_tcx_ids = get_downloaded_ids(TCX_FOLDER) if with_tcx else set()
         for run in runs:
             print(f"parsing keep id {run}")
             try:
@@ -496,15 +488,13 @@ def run_keep_sync(
     email, password, keep_sports_data_api, with_gpx=False, with_tcx=False
 ):
     generator = Generator(SQL_FILE)
-    old_tracks_ids = generator.get_old_tracks_ids()
+    old_tracks_ids = generator.get_known_ids()
     new_tracks = get_all_keep_tracks(
         email, password, old_tracks_ids, keep_sports_data_api, with_gpx, with_tcx
     )
-    generator.sync_from_app(new_tracks)
+    generator.sync_from_app(new_tracks, source="keep")
 
-    activities_list = generator.load()
-    with open(JSON_FILE, "w") as f:
-        json.dump(activities_list, f)
+    generator.export_json(JSON_FILE)
 
 
 if __name__ == "__main__":
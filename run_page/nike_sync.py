@@ -384,7 +384,7 @@ def make_new_gpxs(files):
                 continue
     if tracks_list:
         generator = Generator(SQL_FILE)
-        generator.sync_from_app(tracks_list)
+        generator.sync_from_app(tracks_list, source="nike")
     return gpx_files
 
 
@@ -1,6 +1,5 @@
 import argparse
 import hashlib
-import json
 import os
 import time
 import xml.etree.ElementTree as ET
@@ -9,7 +8,7 @@ from datetime import datetime, timedelta, timezone
 from xml.dom import minidom
 
 import gpxpy
-import polyline
+from polyline_codec import encode_points
 import requests
 from tzlocal import get_localzone
 
@@ -23,6 +22,7 @@ from config import (
     UTC_TIMEZONE,
 )
 from generator import Generator
+from track_metrics import gpx_elevation_gain
 from utils import adjust_time
 
 TOKEN_REFRESH_URL = "https://sport.health.heytapmobi.com/open/v1/oauth/token"
@@ -201,7 +201,7 @@ def parse_raw_data_to_name_tuple(sport_data, with_gpx, with_tcx):
         point_dict = prepare_track_points(sport_data, with_gpx)
 
         gpx_data = parse_points_to_gpx(sport_data, point_dict)
-        elevation_gain = gpx_data.get_uphill_downhill().uphill
+        elevation_gain = gpx_elevation_gain(gpx_data)
         if with_gpx is True:
             download_keep_gpx(gpx_data.to_xml(), str(oppo_id))
         if with_tcx is True:
@@ -213,7 +213,7 @@ def parse_raw_data_to_name_tuple(sport_data, with_gpx, with_tcx):
     gps_data = [
         (item["latitude"], item["longitude"]) for item in other_data["gpsPoint"]
     ]
-    polyline_str = polyline.encode(gps_data) if gps_data else ""
+    polyline_str = encode_points(gps_data)
     start_latlng = start_point(*gps_data[0]) if gps_data else None
     start_date = datetime.fromtimestamp(start_time / 1000, tz=timezone.utc)
     start_date_local = adjust_time(start_date, str(get_localzone()))
@@ -682,11 +682,9 @@ def run_oppo_sync(
         with_download_gpx,
         with_download_tcx,
     )
-    generator.sync_from_app(new_tracks)
+    generator.sync_from_app(new_tracks, source="oppo")
 
-    activities_list = generator.load()
-    with open(JSON_FILE, "w") as f:
-        json.dump(activities_list, f, indent=0)
+    generator.export_json(JSON_FILE)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,122 @@
+"""
+Google's Encoded Polyline Algorithm on numpy arrays.
+
+Gives the same strings and points as the polyline package, but encodes and
+decodes whole arrays at once instead of character by character. The deltas
+of a polyline only depend on the point before, so points can be appended to
+an encoded string in O(new points) by starting from the last point that is
+already encoded, instead of re-encoding everything.
+"""
+
+import numpy as np
+
+PRECISION = 5
+
+# every character carries 5 bits, 0x20 marks "more characters follow"
+_CHUNK_BITS = 5
+_CHUNK_MASK = 0x1F
+_CONTINUE = 0x20
+_OFFSET = 63
+
+
+def _round(values, factor):
+    """The polyline package's rounding, half away from zero"""
+    scaled = np.asarray(values, dtype=np.float64) * factor
+    return np.copysign(np.floor(np.abs(scaled) + 0.5), scaled).astype(np.int64)
+
+
+def _encode_values(values):
+    """The characters of signed int64 values"""
+    values = np.where(values < 0, ~(values << 1), values << 1)
+    chunks, present = [], []
+    keep = np.ones(len(values), dtype=bool)
+    while True:
+        rest = values >> _CHUNK_BITS
+        more = rest > 0
+        chunk = values & _CHUNK_MASK
+        chunks.append(np.where(more, chunk | _CONTINUE, chunk) + _OFFSET)
+        present.append(keep)
+        if not more.any():
+            break
+        keep = more
+        values = rest
+    chunks = np.stack(chunks, axis=1)[np.stack(present, axis=1)]
+    return chunks.astype(np.uint8).tobytes().decode("ascii")
+
+
+def encode(lats, lngs, previous=None, precision=PRECISION):
+    """
+    Encode aligned latitudes and longitudes (lists, array.array or numpy).
+    previous: (lat, lng) of the point encoded right before, the result then
+    continues a polyline ending at that point.
+    """
+    if not len(lats):
+        return ""
+    factor = 10**precision
+    values = np.zeros((len(lats) + 1, 2), dtype=np.int64)
+    if previous is not None:
+        values[0] = _round(previous, factor)
+    values[1:, 0] = _round(lats, factor)
+    values[1:, 1] = _round(lngs, factor)
+    return _encode_values(np.diff(values, axis=0).ravel())
+
+
+def append(polyline_str, lats, lngs, previous, precision=PRECISION):
+    """
+    polyline_str with the points added, previous is its last (lat, lng).
+    The same as encoding all points again, without touching polyline_str.
+    """
+    if not polyline_str:
+        previous = None
+    return polyline_str + encode(lats, lngs, previous, precision)
+
+
+def decode(polyline_str, precision=PRECISION):
+    """(lats, lngs) float64 arrays of polyline_str, ValueError if it is broken"""
+    data = np.frombuffer(polyline_str.encode("ascii"), dtype=np.uint8)
+    data = data.astype(np.int64) - _OFFSET
+    if not len(data):
+        return np.empty(0), np.empty(0)
+    if ((data < 0) | (data > _CONTINUE | _CHUNK_MASK)).any():
+        raise ValueError("invalid polyline character")
+    value_ends = np.flatnonzero(data < _CONTINUE)
+    if not len(value_ends) or value_ends[-1] != len(data) - 1 or len(value_ends) % 2:
+        raise ValueError("truncated polyline")
+    value_starts = np.concatenate(([0], value_ends[:-1] + 1))
+    # position of every character in its value
+    positions = np.arange(len(data)) - np.repeat(
+        value_starts, value_ends - value_starts + 1
+    )
+    values = np.add.reduceat(
+        (data & _CHUNK_MASK) << (_CHUNK_BITS * positions), value_starts
+    )
+    values = np.where(values & 1, ~(values >> 1), values >> 1)
+    factor = float(10**precision)
+    return np.cumsum(values[0::2]) / factor, np.cumsum(values[1::2]) / factor
+
+
+def encode_points(points, precision=PRECISION):
+    """polyline.encode for a list of (lat, lng), "" if there is none"""
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    return encode(points[:, 0], points[:, 1], precision=precision)
+
+
+def decode_points(polyline_str, precision=PRECISION):
+    """polyline.decode, a list of (lat, lng) tuples"""
+    lats, lngs = decode(polyline_str, precision)
+    return list(zip(lats.tolist(), lngs.tolist()))
+
+
+def first_point(polyline_str, precision=PRECISION):
+    """(lat, lng) of the first point, None for an empty or broken polyline"""
+    values = 0
+    for index, char in enumerate(polyline_str or ""):
+        if ord(char) - _OFFSET < _CONTINUE:
+            values += 1
+            if values == 2:
+                try:
+                    lats, lngs = decode(polyline_str[: index + 1], precision)
+                except ValueError:
+                    return None
+                return float(lats[0]), float(lngs[0])
+    return None
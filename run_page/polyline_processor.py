@@ -1,6 +1,11 @@
+from functools import cache
+from itertools import product
 from typing import List, Tuple
-import polyline
+import math
+import numpy as np
+import polyline_codec
 import os
+import track_metrics
 import warnings
 from haversine import haversine
 
@@ -9,7 +14,7 @@ IGNORE_POLYLINE = []
 ignore_polyline_env = os.getenv("IGNORE_POLYLINE")
 if ignore_polyline_env:
     try:
-        IGNORE_POLYLINE = polyline.decode(ignore_polyline_env)
+        IGNORE_POLYLINE = polyline_codec.decode_points(ignore_polyline_env)
     except Exception as e:
         warnings.warn(
             f"IGNORE_POLYLINE is not a valid polyline: {e}. "
@@ -45,6 +50,88 @@ except ValueError:
     )
     IGNORE_START_END_RANGE = 0.0
 
+# haversine.Unit.KILOMETERS, the earth radius of the haversine package
+HAVERSINE_RADIUS = 6371.0088
+_TO_HAVERSINE_KM = HAVERSINE_RADIUS / track_metrics.EARTH_RADIUS
+# numpy and math round differently, distances this close (relative) to the
+# hiding distance are computed again with haversine
+_RECHECK_TOLERANCE = 1e-6
+# IgnoreIndex cells: 3 coordinates of _CELL_BITS bits in one int64 key, the
+# smallest cells (about 12 m) have 2 ** 20 + 1 coordinates
+_CELL_BITS = 21
+_MIN_CELL_SIZE = 2.0**-19
+_CELL_SHIFT = 2**19 + 2
+# the cell of a point first, then the ones sharing a face, an edge, a corner
+_NEIGHBOURS = sorted(
+    (np.array(offset) for offset in product((-1, 0, 1), repeat=3)),
+    key=lambda offset: np.abs(offset).sum(),
+)
+
+
+# Douglas-Peucker tolerance in meters of the pre-simplified polylines
+# stored with each activity, from the coarsest to the finest
+POLYLINE_LEVELS = {
+    "overview": 100,
+    "city": 20,
+    "street": 5,
+}
+
+
+def simplify(points: List[Tuple[float]], tolerance: float) -> List[Tuple[float]]:
+    """Douglas-Peucker on (lat, lng) points, tolerance in meters"""
+    if len(points) < 3:
+        return list(points)
+    # equirectangular projection around the first point is enough for one track
+    kx = 111320 * math.cos(math.radians(points[0][0]))
+    ky = 110540
+    xy = [(p[1] * kx, p[0] * ky) for p in points]
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    tolerance2 = tolerance * tolerance
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        x1, y1 = xy[first]
+        dx, dy = xy[last][0] - x1, xy[last][1] - y1
+        segment2 = dx * dx + dy * dy
+        max_distance2, index = 0.0, None
+        for i in range(first + 1, last):
+            x, y = xy[i][0] - x1, xy[i][1] - y1
+            t = (x * dx + y * dy) / segment2 if segment2 else 0
+            t = max(0, min(t, 1))
+            distance2 = (x - t * dx) ** 2 + (y - t * dy) ** 2
+            if distance2 > max_distance2:
+                max_distance2, index = distance2, i
+        if index is not None and max_distance2 > tolerance2:
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+    return [p for p, k in zip(points, keep) if k]
+
+
+def simplify_levels(polyline_str: str) -> dict:
+    """Encoded polyline of every POLYLINE_LEVELS level"""
+    points = polyline_codec.decode_points(polyline_str or "")
+    levels = {}
+    # from the finest to the coarsest, each level simplifies the previous one
+    for level, tolerance in sorted(POLYLINE_LEVELS.items(), key=lambda x: x[1]):
+        points = simplify(points, tolerance)
+        levels[level] = polyline_codec.encode_points(points)
+    return levels
+
+
+def pick_polyline_level(resolution: float) -> str | None:
+    """The coarsest level whose tolerance is not visible at resolution meters, None for full"""
+    for level, tolerance in POLYLINE_LEVELS.items():
+        if tolerance <= resolution:
+            return level
+    return None
+
+
+def filter_fingerprint() -> str:
+    """Identify the privacy settings, filter_out output only changes with them"""
+    return repr((IGNORE_POLYLINE, IGNORE_RANGE, IGNORE_START_END_RANGE))
+
 
 def point_distance_in_range(
     point: Tuple[float], center_point: Tuple[float], distance: int
@@ -59,32 +146,171 @@ def point_in_list_points_range(
     return any(point_distance_in_range(point, p, distance) for p in points)
 
 
+def _distances(lats1, lngs1, lats2, lngs2) -> np.ndarray:
+    """Vectorized haversine (km) on the sphere of the haversine package"""
+    return track_metrics.haversine(lats1, lngs1, lats2, lngs2) * _TO_HAVERSINE_KM
+
+
+def _is_close(distances: np.ndarray, distance: float) -> np.ndarray:
+    """Distances too close to distance to trust how numpy rounded them"""
+    return np.abs(distances - distance) <= distance * _RECHECK_TOLERANCE
+
+
+def _expand(first: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """The indexes first[i] .. first[i] + counts[i] - 1, one range after the other"""
+    ends = np.cumsum(counts)
+    return (
+        np.repeat(first, counts)
+        + np.arange(ends[-1])
+        - np.repeat(ends - counts, counts)
+    )
+
+
+def _cell_keys(cells: np.ndarray) -> np.ndarray:
+    return (cells[:, 0] << (2 * _CELL_BITS)) | (cells[:, 1] << _CELL_BITS) | cells[:, 2]
+
+
+class IgnoreIndex:
+    """
+    The points to hide the surroundings of, hashed in a grid of cubic cells
+    of the unit sphere as wide as the hiding distance. A point can only be in
+    range of the points of its cell and of the 26 cells around it, so it is
+    only compared with those.
+    """
+
+    def __init__(self, points: List[Tuple[float]], distance: float):
+        self.points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        self.distance = distance
+        angle = min(distance / HAVERSINE_RADIUS, math.pi)
+        # chord of the hiding distance, a bit more for the rounding
+        chord = 2 * math.sin(angle / 2) * (1 + _RECHECK_TOLERANCE)
+        self.cell_size = max(chord, _MIN_CELL_SIZE)
+        keys = _cell_keys(self._cells(self.points[:, 0], self.points[:, 1]))
+        self.order = np.argsort(keys, kind="stable")
+        self.keys = keys[self.order]
+
+    def _cells(self, lats, lngs) -> np.ndarray:
+        lats, lngs = np.radians(lats), np.radians(lngs)
+        xyz = np.stack(
+            (np.cos(lats) * np.cos(lngs), np.cos(lats) * np.sin(lngs), np.sin(lats)),
+            axis=1,
+        )
+        return np.floor(xyz / self.cell_size).astype(np.int64) + _CELL_SHIFT
+
+    def hidden(self, lats, lngs) -> np.ndarray:
+        """Mask of the points in range of an indexed point"""
+        lats = np.asarray(lats, dtype=np.float64)
+        lngs = np.asarray(lngs, dtype=np.float64)
+        hidden = np.zeros(len(lats), dtype=bool)
+        if not len(lats) or not len(self.points) or self.distance <= 0:
+            return hidden
+        cells = self._cells(lats, lngs)
+        active = np.arange(len(lats))
+        for offset in _NEIGHBOURS:
+            keys = _cell_keys(cells[active] + offset)
+            first = np.searchsorted(self.keys, keys, side="left")
+            counts = np.searchsorted(self.keys, keys, side="right") - first
+            self._hide(hidden, active, first, counts, lats, lngs)
+            active = active[~hidden[active]]
+            if not len(active):
+                break
+        return hidden
+
+    def _hide(self, hidden, point_ids, first, counts, lats, lngs):
+        """
+        Compare the points with their candidates self.order[first:first + counts],
+        1, 2, 4... candidates at a time, until they are hidden
+        """
+        done, batch = 0, 1
+        while True:
+            left = (counts > done) & ~hidden[point_ids]
+            point_ids, first, counts = point_ids[left], first[left], counts[left]
+            if not len(point_ids):
+                return
+            taken = np.minimum(counts - done, batch)
+            pair_points = np.repeat(point_ids, taken)
+            pair_ignores = self.order[_expand(first + done, taken)]
+            distances = _distances(
+                lats[pair_points],
+                lngs[pair_points],
+                self.points[pair_ignores, 0],
+                self.points[pair_ignores, 1],
+            )
+            in_range = distances < self.distance
+            for i in np.flatnonzero(_is_close(distances, self.distance)).tolist():
+                point_id, ignore_id = pair_points[i], pair_ignores[i]
+                in_range[i] = point_distance_in_range(
+                    (float(lats[point_id]), float(lngs[point_id])),
+                    tuple(self.points[ignore_id].tolist()),
+                    self.distance,
+                )
+            hidden[pair_points[in_range]] = True
+            done += batch
+            batch *= 2
+
+
+@cache
+def ignore_index() -> IgnoreIndex:
+    """IgnoreIndex of IGNORE_POLYLINE and IGNORE_RANGE"""
+    return IgnoreIndex(IGNORE_POLYLINE, IGNORE_RANGE)
+
+
 def range_hiding(
     polyline: List[Tuple[float]], points: List[Tuple[float]], distance: int
 ) -> List[Tuple[float]]:
-    return [
-        point
-        for point in polyline
-        if not point_in_list_points_range(point, points, distance)
-    ]
+    if not polyline or not points:
+        return list(polyline)
+    lats, lngs = np.asarray(polyline, dtype=np.float64).T
+    hidden = IgnoreIndex(points, distance).hidden(lats, lngs)
+    return [point for point, h in zip(polyline, hidden.tolist()) if not h]
+
+
+def _first_beyond(steps: np.ndarray, distance: float, step) -> int | None:
+    """
+    Index of the first step the running sum of steps exceeds distance at,
+    None if it never does. When a sum is too close to distance the steps are
+    summed again one by one with step(i), like start_end_hiding used to.
+    """
+    totals = np.cumsum(steps)
+    if distance > 0 and _is_close(totals, distance).any():
+        total = 0
+        for i in range(len(steps)):
+            total += step(i)
+            if total > distance:
+                return i
+        return None
+    index = int(np.searchsorted(totals, distance, side="right"))
+    return index if index < len(steps) else None
+
+
+def start_end_indexes(lats, lngs, distance: float) -> Tuple[int, int]:
+    """First and last index of the points kept by start_end_hiding"""
+    lats = np.asarray(lats, dtype=np.float64)
+    lngs = np.asarray(lngs, dtype=np.float64)
+    start_index, end_index = 0, len(lats) - 1
+    if len(lats) < 2:
+        return start_index, end_index
+    steps = _distances(lats[1:], lngs[1:], lats[:-1], lngs[:-1])
+
+    def step(i):
+        return haversine(
+            (float(lats[i + 1]), float(lngs[i + 1])), (float(lats[i]), float(lngs[i]))
+        )
+
+    first = _first_beyond(steps, distance, step)
+    if first is not None:
+        start_index = first + 1
+    last = _first_beyond(steps[::-1], distance, lambda i: step(len(steps) - 1 - i))
+    if last is not None:
+        end_index = len(steps) - 1 - last
+    return start_index, end_index
 
 
 def start_end_hiding(polyline: List[Tuple[float]], distance: int) -> List[Tuple[float]]:
-    start_index, end_index = 0, len(polyline) - 1
-
-    starting_distance = 0
-    for i in range(1, len(polyline)):
-        starting_distance += haversine(polyline[i], polyline[i - 1])
-        if starting_distance > distance:
-            start_index = i
-            break
-
-    ending_distance = 0
-    for i in range(len(polyline) - 2, -1, -1):
-        ending_distance += haversine(polyline[i], polyline[i + 1])
-        if ending_distance > distance:
-            end_index = i
-            break
+    if not polyline:
+        return []
+    lats, lngs = np.asarray(polyline, dtype=np.float64).T
+    start_index, end_index = start_end_indexes(lats, lngs, distance)
 
     if start_index >= end_index:
         return []
@@ -95,13 +321,17 @@ def start_end_hiding(polyline: List[Tuple[float]], distance: int) -> List[Tuple[
 def filter_out(polyline_str):
     if not polyline_str:
         return
-    pl = polyline.decode(polyline_str)
-    if not pl:
+    lats, lngs = polyline_codec.decode(polyline_str)
+    if not len(lats):
         return polyline_str
 
-    new_pl = start_end_hiding(pl, IGNORE_START_END_RANGE)
-    new_pl = range_hiding(new_pl, IGNORE_POLYLINE, IGNORE_RANGE)
+    start_index, end_index = start_end_indexes(lats, lngs, IGNORE_START_END_RANGE)
+    if start_index >= end_index:
+        return
+    lats = lats[start_index : end_index + 1]
+    lngs = lngs[start_index : end_index + 1]
+    kept = ~ignore_index().hidden(lats, lngs)
 
-    if not new_pl:
+    if not kept.any():
         return
-    return polyline.encode(new_pl)
+    return polyline_codec.encode(lats[kept], lngs[kept])
@@ -0,0 +1,24 @@
+"""
+Privacy filter the stored polylines again after IGNORE_POLYLINE, IGNORE_RANGE
+or IGNORE_START_END_RANGE changed, instead of on the next exports and
+posters, see generator.filter_cache.
+"""
+
+import argparse
+
+from config import JSON_FILE, SQL_FILE
+from generator import Generator
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="filter every polyline, even the ones filtered with these settings",
+    )
+    options = parser.parse_args()
+
+    generator = Generator(SQL_FILE)
+    count = generator.refilter_polylines(force=options.force)
+    print(f"{count} polylines filtered")
+    generator.export_json(JSON_FILE)
@@ -1,5 +1,4 @@
 import argparse
-import json
 
 from config import JSON_FILE, SQL_FILE
 from generator import Generator
@@ -22,9 +21,7 @@ def run_strava_sync(
     generator.only_run = only_run
     generator.sync(False)
 
-    activities_list = generator.load()
-    with open(JSON_FILE, "w") as f:
-        json.dump(activities_list, f)
+    generator.export_json(JSON_FILE)
 
 
 if __name__ == "__main__":
@@ -1,24 +1,118 @@
-import os
-from config import SYNCED_FILE
-import json
+"""
+Manifest of the data files already imported into the db.
 
+One sqlite row per file name with the size, mtime and content hash the file
+had when it was imported, its format and the run_id it became. A file is
+skipped while it still has that size and mtime, or the same content when
+only its mtime changed (checkouts, cache restores). A file rewritten under the
+same name is imported again. The names of the old imported.json are taken
+over without a fingerprint and stay skipped, like before.
+"""
 
-def save_synced_data_file_list(file_list: list):
-    old_list = load_synced_file_list()
+import hashlib
+import json
+import os
+import sqlite3
 
-    with open(SYNCED_FILE, "w") as f:
-        file_list.extend(old_list)
+from config import SYNCED_FILE, SYNCED_MANIFEST_FILE
 
-        json.dump(file_list, f)
 
+def file_hash(file_name):
+    with open(file_name, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
 
-def load_synced_file_list():
-    if os.path.exists(SYNCED_FILE):
-        with open(SYNCED_FILE, "r") as f:
+
+def _load_legacy_list(file_name):
+    """The names of an imported.json"""
+    if os.path.exists(file_name):
+        with open(file_name, "r") as f:
             try:
                 return json.load(f)
             except Exception as e:
-                print(f"json load {SYNCED_FILE} \nerror {e}")
-                pass
-
+                print(f"json load {file_name} \nerror {e}")
     return []
+
+
+class SyncedFileManifest:
+    """
+    The rows are read once into a dict, so a lookup is O(1), and saving only
+    writes the rows of the files just imported.
+    """
+
+    def __init__(self, file_name=SYNCED_MANIFEST_FILE, legacy_file=SYNCED_FILE):
+        self.conn = sqlite3.connect(file_name)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS synced_files ("
+            "name TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, hash TEXT, "
+            "format TEXT, run_id INTEGER)"
+        )
+        # name: (size, mtime_ns, hash, format, run_id)
+        self.entries = {
+            row[0]: row[1:]
+            for row in self.conn.execute(
+                "SELECT name, size, mtime_ns, hash, format, run_id FROM synced_files"
+            )
+        }
+        if not self.entries:
+            self._import_legacy(legacy_file)
+
+    def _import_legacy(self, legacy_file):
+        names = set(_load_legacy_list(legacy_file))
+        if not names:
+            return
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO synced_files (name) VALUES (?)",
+            [(name,) for name in names],
+        )
+        self.conn.commit()
+        self.entries.update((name, (None, None, None, None, None)) for name in names)
+
+    def is_synced(self, file_name):
+        """The file was imported and has not changed since"""
+        name = os.path.basename(file_name)
+        entry = self.entries.get(name)
+        if entry is None:
+            return False
+        size, mtime_ns, content_hash, file_format, run_id = entry
+        if size is None:
+            return True
+        try:
+            stat = os.stat(file_name)
+        except OSError:
+            return False
+        if (stat.st_size, stat.st_mtime_ns) == (size, mtime_ns):
+            return True
+        if stat.st_size != size or file_hash(file_name) != content_hash:
+            return False
+        # only touched, remember the new mtime to not hash it again
+        self.save([(file_name, file_format, run_id)])
+        return True
+
+    def save(self, files):
+        """files: (file_name, format, run_id) of the imported files"""
+        rows = []
+        for file_name, file_format, run_id in files:
+            try:
+                stat = os.stat(file_name)
+                content_hash = file_hash(file_name)
+            except OSError as e:
+                print(f"can not read {file_name}: {e}")
+                continue
+            rows.append(
+                (
+                    os.path.basename(file_name),
+                    stat.st_size,
+                    stat.st_mtime_ns,
+                    content_hash,
+                    file_format,
+                    run_id,
+                )
+            )
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO synced_files VALUES (?, ?, ?, ?, ?, ?)", rows
+        )
+        self.conn.commit()
+        self.entries.update((row[0], row[1:]) for row in rows)
+
+    def close(self):
+        self.conn.close()
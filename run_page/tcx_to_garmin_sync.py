@@ -3,10 +3,9 @@ import asyncio
 import os
 from datetime import datetime
 
-from tcxreader.tcxreader import TCXReader
-
 from config import TCX_FOLDER
 from garmin_sync import Garmin
+from gpxtrackposter.tcx_stream import read_tcx
 
 
 def get_to_generate_files(last_time):
@@ -14,20 +13,19 @@ def get_to_generate_files(last_time):
     return to one sorted list for next time upload
     """
     file_names = os.listdir(TCX_FOLDER)
-    tcx = TCXReader()
+    # only the first trackpoint of every file is read
     tcx_files = [
         (
-            tcx.read(os.path.join(TCX_FOLDER, i), only_gps=False),
+            read_tcx(os.path.join(TCX_FOLDER, i), only_gps=False, header_only=True),
             os.path.join(TCX_FOLDER, i),
         )
         for i in file_names
         if i.endswith(".tcx")
     ]
     tcx_files_dict = {
-        int(i[0].trackpoints[0].time.timestamp()): i[1]
+        int(i[0].times[0].timestamp()): i[1]
         for i in tcx_files
-        if len(i[0].trackpoints) > 0
-        and int(i[0].trackpoints[0].time.timestamp()) > last_time
+        if len(i[0].times) > 0 and int(i[0].times[0].timestamp()) > last_time
     }
 
     dict(sorted(tcx_files_dict.items()))
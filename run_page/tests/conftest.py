@@ -0,0 +1,40 @@
+import datetime
+import os
+import sys
+from collections import namedtuple
+
+# the run_page modules import each other as top level modules
+RUN_PAGE = os.path.join(os.path.dirname(__file__), "..")
+sys.path.insert(0, RUN_PAGE)
+
+GPX_DIR = os.path.join(RUN_PAGE, "..", "GPX_OUT")
+
+RunActivity = namedtuple(
+    "RunActivity",
+    "id name distance moving_time elapsed_time type subtype start_date "
+    "start_date_local average_heartrate average_speed map start_latlng "
+    "elevation_gain location_country",
+)
+RunMap = namedtuple("RunMap", "summary_polyline")
+
+
+def make_activity(run_id, start, distance=5000.0, type="Run", polyline=""):
+    """A synced activity as the syncers hand it to generator.db, without a location lookup"""
+    moving_time = datetime.timedelta(seconds=distance / 3)
+    return RunActivity(
+        id=run_id,
+        name=f"run {run_id}",
+        distance=distance,
+        moving_time=moving_time,
+        elapsed_time=moving_time + datetime.timedelta(seconds=60),
+        type=type,
+        subtype=type,
+        start_date=(start - datetime.timedelta(hours=8)).strftime("%Y-%m-%d %H:%M:%S"),
+        start_date_local=start.strftime("%Y-%m-%d %H:%M:%S"),
+        average_heartrate=None,
+        average_speed=3.0,
+        map=RunMap(polyline),
+        start_latlng=None,
+        elevation_gain=10.0,
+        location_country="",
+    )
@@ -0,0 +1,71 @@
+import sqlite3
+
+from generator.db import SCHEMA_VERSION, Base, init_db
+from sqlalchemy import inspect
+
+LEGACY_SCHEMA = """CREATE TABLE activities (
+    run_id INTEGER NOT NULL, name VARCHAR, distance FLOAT,
+    moving_time DATETIME, elapsed_time DATETIME, type VARCHAR,
+    start_date VARCHAR, start_date_local VARCHAR, location_country VARCHAR,
+    summary_polyline VARCHAR, PRIMARY KEY (run_id)
+)"""
+
+
+def assert_schema_matches_models(session):
+    inspector = inspect(session.connection())
+    for table in Base.metadata.sorted_tables:
+        columns = {col["name"] for col in inspector.get_columns(table.name)}
+        assert columns == {column.name for column in table.columns}, table.name
+        indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+        assert {index.name for index in table.indexes} <= indexes, table.name
+    version = session.connection().exec_driver_sql("PRAGMA user_version").scalar()
+    assert version == SCHEMA_VERSION
+
+
+def test_new_database_gets_the_model_schema(tmp_path):
+    session = init_db(str(tmp_path / "data.db"))
+
+    assert_schema_matches_models(session)
+
+
+def test_legacy_database_is_migrated(tmp_path):
+    db = sqlite3.connect(tmp_path / "data.db")
+    db.execute(LEGACY_SCHEMA)
+    db.execute(
+        "INSERT INTO activities (run_id, name, distance, type, start_date, "
+        "start_date_local) VALUES (1, 'run', 5000.0, 'Run', "
+        "'2024-05-01 00:00:00', '2024-05-01 08:00:00')"
+    )
+    db.commit()
+    db.close()
+
+    session = init_db(str(tmp_path / "data.db"))
+
+    assert_schema_matches_models(session)
+    row = session.connection().exec_driver_sql(
+        "SELECT name, start_year, start_month, subtype FROM activities"
+    )
+    assert row.one() == ("run", 2024, 5, None)
+
+
+def test_stats_tables_are_dropped(tmp_path):
+    init_db(str(tmp_path / "data.db")).close()
+    db = sqlite3.connect(tmp_path / "data.db")
+    db.execute("CREATE TABLE daily_stats (type VARCHAR, period VARCHAR)")
+    db.execute("CREATE TABLE stats_dirty (type VARCHAR, day VARCHAR)")
+    db.execute(
+        "CREATE TRIGGER stats_dirty_insert AFTER INSERT ON activities BEGIN "
+        "INSERT OR IGNORE INTO stats_dirty VALUES (NEW.type, NEW.start_date_local); "
+        "END"
+    )
+    db.execute(f"PRAGMA user_version = {SCHEMA_VERSION - 1}")
+    db.commit()
+    db.close()
+
+    session = init_db(str(tmp_path / "data.db"))
+
+    assert_schema_matches_models(session)
+    names = session.connection().exec_driver_sql(
+        "SELECT name FROM sqlite_master WHERE name LIKE '%stats%'"
+    )
+    assert names.all() == []
@@ -0,0 +1,59 @@
+import datetime
+
+from conftest import make_activity
+from generator import Generator, db
+from sqlalchemy import text
+
+START = datetime.datetime(2024, 5, 1, 6, 30)
+
+
+def stored(generator):
+    return dict(
+        generator.session.execute(text("SELECT run_id, source FROM activities")).all()
+    )
+
+
+def copies():
+    """The same run as a FIT file, 20 seconds later on Strava, and another run"""
+    return [
+        [make_activity(1, START, distance=10000.0)],
+        [make_activity(2, START + datetime.timedelta(seconds=20), distance=9900.0)],
+        [make_activity(3, START + datetime.timedelta(hours=5), distance=9950.0)],
+    ]
+
+
+def test_sync_keeps_duplicates_by_default(tmp_path):
+    generator = Generator(str(tmp_path / "data.db"))
+    fit, strava, other = copies()
+    generator.sync_from_app(strava, source="strava")
+    generator.sync_from_app(fit + other, source="fit")
+
+    assert stored(generator) == {1: "fit", 2: "strava", 3: "fit"}
+
+
+def test_sync_drops_duplicates_with_dedup(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DEDUP", True)
+    generator = Generator(str(tmp_path / "data.db"))
+    fit, strava, other = copies()
+    generator.sync_from_app(strava, source="strava")
+    generator.sync_from_app(fit + other, source="fit")
+    # the dropped copy is not stored again
+    generator.sync_from_app(strava, source="strava")
+
+    assert stored(generator) == {1: "fit", 3: "fit"}
+    assert generator.session.execute(
+        text("SELECT run_id, duplicate_of FROM duplicate_activities")
+    ).all() == [(2, 1)]
+
+
+def test_dedup_only_removes_with_dry_run_off(tmp_path):
+    generator = Generator(str(tmp_path / "data.db"))
+    fit, strava, other = copies()
+    generator.sync_from_app(strava, source="strava")
+    generator.sync_from_app(fit + other, source="fit")
+
+    assert generator.dedup() == [(2, 1)]
+    assert set(stored(generator)) == {1, 2, 3}
+
+    assert generator.dedup(dry_run=False) == [(2, 1)]
+    assert set(stored(generator)) == {1, 3}
@@ -0,0 +1,163 @@
+import datetime
+import io
+import json
+import random
+
+import polyline_codec
+import polyline_processor
+from conftest import make_activity
+from generator import Generator
+from generator.db import update_or_create_activity
+from generator.exporter import write_activities_json
+from sqlalchemy import text
+
+FIRST = datetime.datetime(2024, 3, 1, 7)
+
+
+def make_polyline(run_id):
+    """A random walk of about 100 meters a point"""
+    rng = random.Random(run_id)
+    lat, lng = 39.9, 116.3
+    points = []
+    for _ in range(50):
+        lat += rng.uniform(-1, 1) * 1e-3
+        lng += rng.uniform(-1, 1) * 1e-3
+        points.append((lat, lng))
+    return polyline_codec.encode_points(points)
+
+
+def make_activities(days):
+    """One activity on each of days (offsets from FIRST)"""
+    return [
+        make_activity(
+            run_id,
+            FIRST + datetime.timedelta(days=day),
+            distance=1000.0 + run_id,
+            polyline=make_polyline(run_id),
+        )
+        for run_id, day in enumerate(days, start=1)
+    ]
+
+
+def export(generator, path):
+    version = generator.export_json(str(path))
+    with open(path) as f:
+        return version, f.read()
+
+
+def exported_versions(generator):
+    return dict(
+        generator.session.execute(
+            text("SELECT run_id, version FROM export_state")
+        ).all()
+    )
+
+
+def test_export_matches_load(tmp_path):
+    generator = Generator(str(tmp_path / "data.db"))
+    generator.sync_from_app(make_activities([0, 1, 2, 4, 5, 9]))
+
+    version, content = export(generator, tmp_path / "activities.json")
+
+    assert version == 1
+    assert content == json.dumps(generator.load())
+    assert [a["streak"] for a in json.loads(content)] == [1, 2, 3, 1, 2, 1]
+
+
+def test_export_only_rewrites_changed_activities(tmp_path):
+    generator = Generator(str(tmp_path / "data.db"))
+    activities = make_activities([0, 1, 2, 4, 5, 9])
+    generator.sync_from_app(activities)
+    json_file = tmp_path / "activities.json"
+    export(generator, json_file)
+
+    # syncing the same activities again changes nothing
+    generator.sync_from_app(activities)
+    assert export(generator, json_file)[0] == 1
+
+    # new activity 7 on day 3 joins the streaks of 4 and 5 to the first three
+    update_or_create_activity(
+        generator.session, activities[0]._replace(distance=4321.0)
+    )
+    new = make_activity(7, FIRST + datetime.timedelta(days=3), polyline="")
+    update_or_create_activity(generator.session, new)
+    generator.session.execute(text("DELETE FROM activities WHERE run_id = 6"))
+    generator.session.commit()
+
+    version, content = export(generator, json_file)
+
+    assert version == 2
+    assert content == json.dumps(generator.load())
+    versions = exported_versions(generator)
+    assert sorted(r for r, v in versions.items() if v == 2) == [1, 4, 5, 6, 7]
+    delta = generator.export_delta(1, str(json_file))
+    assert [a["run_id"] for a in delta["updated"]] == [1, 4, 5, 7]
+    assert delta["deleted"] == [6]
+    assert [a["streak"] for a in json.loads(content)] == [1, 2, 3, 4, 5, 6]
+
+
+def test_export_redone_for_other_privacy_settings(tmp_path, monkeypatch):
+    generator = Generator(str(tmp_path / "data.db"))
+    generator.sync_from_app(make_activities([0, 1, 2]))
+    json_file = tmp_path / "activities.json"
+    _, before = export(generator, json_file)
+
+    monkeypatch.setattr(polyline_processor, "IGNORE_START_END_RANGE", 0.1)
+    version, content = export(generator, json_file)
+
+    assert version == 2
+    assert content != before
+    assert content == json.dumps(generator.load())
+
+
+def test_export_leaves_out_filtered_activities(tmp_path):
+    generator = Generator(str(tmp_path / "data.db"))
+    generator.sync_from_app(make_activities([0, 1, 2]))
+    json_file = tmp_path / "activities.json"
+    export(generator, json_file)
+
+    generator.only_run = True
+    generator.sync_from_app([make_activity(4, FIRST, type="Ride")])
+    version, content = export(generator, json_file)
+
+    assert version == 1
+    assert content == json.dumps(generator.load())
+
+
+def test_write_keeps_non_ascii_text_when_asked():
+    activities = [{"run_id": 1, "name": "晨跑", "location_country": "北京市"}]
+    for fast in (False, True):
+        out = io.StringIO()
+        write_activities_json(iter(activities), out, fast=fast, ensure_ascii=False)
+        assert "晨跑" in out.getvalue()
+        assert json.loads(out.getvalue()) == activities
+
+    out = io.StringIO()
+    write_activities_json(iter(activities), out)
+    assert out.getvalue() == json.dumps(activities)
+
+
+def test_export_splices_and_repairs_the_file(tmp_path):
+    generator = Generator(str(tmp_path / "data.db"))
+    activities = make_activities([0, 1, 2])
+    generator.sync_from_app(activities)
+    json_file = tmp_path / "activities.json"
+    export(generator, json_file)
+
+    # a change undone before the export leaves the file and versions as they are
+    generator.sync_from_app([activities[0]._replace(name="renamed")])
+    generator.sync_from_app([activities[0]])
+    assert export(generator, json_file)[0] == 1
+
+    # a new activity at the end, and a fragment edited in the file
+    generator.sync_from_app([make_activity(4, FIRST + datetime.timedelta(days=5))])
+    content = json_file.read_text().replace('"run 2"', '"edited"')
+    json_file.write_text(content)
+
+    version, content = export(generator, json_file)
+
+    assert version == 2
+    assert content == json.dumps(generator.load())
+    assert sorted(r for r, v in exported_versions(generator).items() if v == 2) == [4]
+    delta = generator.export_delta(1, str(json_file))
+    assert [a["run_id"] for a in delta["updated"]] == [4]
@@ -0,0 +1,28 @@
+import sqlite3
+
+import polyline_processor
+from generator import Generator, filter_cache
+from generator.filter_cache import FilterCache
+from test_exporter import make_activities, make_polyline
+
+
+def test_filtered_polylines_are_kept_out_of_the_database(tmp_path, monkeypatch):
+    generator = Generator(str(tmp_path / "data.db"))
+    generator.sync_from_app(make_activities([0, 1, 2]))
+    generator.export_json(str(tmp_path / "activities.json"))
+
+    db = sqlite3.connect(tmp_path / "data.db")
+    tables = {name for (name,) in db.execute("SELECT name FROM sqlite_master")}
+    db.close()
+    assert "filtered_polylines" not in tables
+
+    # the next cache has them all, read with one query
+    calls = []
+    monkeypatch.setattr(filter_cache, "filter_out", lambda p: calls.append(p) or p[:10])
+    cache = FilterCache(generator.filter_cache_file)
+    for run_id in (1, 2, 3):
+        assert cache.filter_out(make_polyline(run_id)) == (
+            polyline_processor.filter_out(make_polyline(run_id))
+        )
+    assert calls == []
+    cache.close()
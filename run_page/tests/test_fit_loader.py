@@ -0,0 +1,93 @@
+import datetime
+
+import pytest
+from garmin_fit_sdk import Encoder, Profile
+from gpxtrackposter.track import FIT_LOADERS, Track
+
+MESG_NUM = Profile["mesg_num"]
+START = datetime.datetime(2024, 5, 1, 6, 0, tzinfo=datetime.UTC)
+
+
+def write_fit(path, session=None, points=120):
+    """A running activity, 1 record a second, session fields overridden by session"""
+    encoder = Encoder()
+    encoder.write_mesg(
+        {
+            "mesg_num": MESG_NUM["FILE_ID"],
+            "type": "activity",
+            "manufacturer": "garmin",
+            "product": 4315,
+            "time_created": START,
+            "serial_number": 1234,
+        }
+    )
+    lat, lng = 39.9, 116.3
+    for i in range(points):
+        encoder.write_mesg(
+            {
+                "mesg_num": MESG_NUM["RECORD"],
+                "timestamp": START + datetime.timedelta(seconds=i),
+                "position_lat": round((lat + i * 2e-5) * 11930465),
+                "position_long": round((lng + i * 1e-5) * 11930465),
+                "enhanced_altitude": 50.0 + (i % 10),
+                "heart_rate": 120 + i % 20,
+                "distance": i * 2.5,
+            }
+        )
+    message = {
+        "mesg_num": MESG_NUM["SESSION"],
+        "timestamp": START + datetime.timedelta(seconds=points),
+        "start_time": START,
+        "sport": "running",
+        "sub_sport": "generic",
+        "total_elapsed_time": float(points),
+        "total_timer_time": float(points - 5),
+        "total_distance": points * 2.5,
+        "avg_speed": 2.5,
+        "enhanced_avg_speed": 2.5,
+        "avg_heart_rate": 140,
+        "total_ascent": 42,
+    }
+    message.update(session or {})
+    encoder.write_mesg({k: v for k, v in message.items() if v is not None})
+    path.write_bytes(encoder.close())
+    return str(path)
+
+
+def load(file_name, loader):
+    track = Track()
+    track.load_fit(file_name, loader=loader)
+    return track
+
+
+@pytest.mark.parametrize("loader", FIT_LOADERS)
+def test_session_values(tmp_path, loader):
+    track = load(write_fit(tmp_path / "run.fit"), loader)
+
+    assert track.average_heartrate == 140
+    assert track.elevation_gain == 42
+    assert track.length == 300.0
+    assert track.type == "Run"
+    assert len(track.polyline_container) == 120
+
+
+@pytest.mark.parametrize("loader", FIT_LOADERS)
+def test_missing_session_values_are_not_derived_from_records(tmp_path, loader):
+    file_name = write_fit(
+        tmp_path / "run.fit", session={"avg_heart_rate": None, "total_ascent": None}
+    )
+
+    track = load(file_name, loader)
+
+    assert track.average_heartrate is None
+    assert track.elevation_gain is None
+    assert track.to_namedtuple().elevation_gain == 0
+
+
+def test_loaders_agree(tmp_path):
+    file_name = write_fit(tmp_path / "run.fit", session={"total_moving_time": 110.0})
+
+    sdk, mmap = (load(file_name, loader) for loader in FIT_LOADERS)
+
+    assert mmap.to_namedtuple() == sdk.to_namedtuple()
+    assert mmap.lines() == sdk.lines()
@@ -0,0 +1,79 @@
+from build_gazetteer import build_gazetteer
+from generator.offline_geocoder import OfflineGeocoder, normalize_location
+
+CITIES = [
+    # geonameid, name, asciiname, alternatenames, lat, lon, class, code,
+    # country, cc2, admin1, admin2, ...
+    "2036892\tHohhot\tHohhot\t\t40.81056\t111.65222\tP\tPPLA\tCN\t\t20\t1529",
+    "1816670\tBeijing\tBeijing\t\t39.9075\t116.39723\tP\tPPLC\tCN\t\t22\t",
+    "2950159\tBerlin\tBerlin\t\t52.52437\t13.41053\tP\tPPLC\tDE\t\t16\t00",
+]
+ADMIN1 = [
+    "CN.20\tInner Mongolia\tInner Mongolia\t2035607",
+    "CN.22\tBeijing\tBeijing\t2038349",
+    "DE.16\tLand Berlin\tLand Berlin\t2950157",
+]
+ADMIN2 = ["CN.20.1529\tHohhot Shi\tHohhot Shi\t2036891"]
+COUNTRIES = [
+    "#ISO\tISO3\tISO-Numeric\tfips\tCountry\tCapital\tArea\tPopulation\t"
+    + "Continent\ttld\tCurrencyCode\tCurrencyName\tPhone\tPostal Code Format\t"
+    + "Postal Code Regex\tLanguages\tgeonameid",
+    "CN\tCHN\t156\tCH\tChina\tBeijing\t9596960\t1411778724\tAS\t.cn\tCNY\tYuan\t"
+    + "86\t######\t^(\\d{6})$\tzh-CN,yue,wuu\t1814991",
+    "DE\tDEU\t276\tGM\tGermany\tBerlin\t357021\t82927922\tEU\t.de\tEUR\tEuro\t"
+    + "49\t#####\t^(\\d{5})$\tde\t2921044",
+]
+ALTERNATE_NAMES = [
+    # id, geonameid, language, name, preferred, short, colloquial, historic
+    "1\t2036891\tzh\t呼和浩特\t\t\t\t",
+    "2\t2035607\tzh\t内蒙古\t\t1\t\t",
+    "3\t2035607\tzh\t内蒙古自治区\t1\t\t\t",
+    "4\t2038349\tzh-CN\t北京\t\t\t\t",
+    "5\t1816670\tzh\t北京\t\t\t\t",
+    "6\t1814991\tzh\t中國\t\t\t\t1",
+    "7\t1814991\tzh\t中国\t\t\t\t",
+    "8\t2036891\ten\tHohhot\t1\t\t\t",
+]
+
+
+def write(path, lines):
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return str(path)
+
+
+def test_gazetteer_from_geonames(tmp_path):
+    rows = list(
+        build_gazetteer(
+            write(tmp_path / "cities1000.txt", CITIES),
+            write(tmp_path / "admin1CodesASCII.txt", ADMIN1),
+            write(tmp_path / "admin2Codes.txt", ADMIN2),
+            write(tmp_path / "countryInfo.txt", COUNTRIES),
+            alternate_names_file=write(tmp_path / "CN.txt", ALTERNATE_NAMES),
+        )
+    )
+
+    assert rows == [
+        (40.81056, 111.65222, "呼和浩特", "内蒙古自治区", "中国"),
+        (39.9075, 116.39723, "北京", "北京", "中国"),
+        (52.52437, 13.41053, "Berlin", "Land Berlin", "Germany"),
+    ]
+    geocoder = OfflineGeocoder(
+        [(lat, lon, normalize_location(*names)) for lat, lon, *names in rows]
+    )
+    assert geocoder.reverse_batch([(40.8, 111.66), (39.91, 116.4), (0, 0)]) == [
+        "呼和浩特市,内蒙古自治区,中国",
+        "北京市,北京市,中国",
+        None,
+    ]
+
+
+def test_gazetteer_of_some_countries(tmp_path):
+    rows = build_gazetteer(
+        write(tmp_path / "cities1000.txt", CITIES),
+        write(tmp_path / "admin1CodesASCII.txt", ADMIN1),
+        str(tmp_path / "admin2Codes.txt"),
+        write(tmp_path / "countryInfo.txt", COUNTRIES),
+        country_codes={"DE"},
+    )
+
+    assert list(rows) == [(52.52437, 13.41053, "Berlin", "Land Berlin", "Germany")]
@@ -0,0 +1,35 @@
+import glob
+import os
+
+import pytest
+from conftest import GPX_DIR
+from gpxtrackposter.track import Track
+
+
+def fields(file_name, loader):
+    """What ends up in the db, plus the points kept for drawing"""
+    t = Track()
+    t.load_gpx(file_name, loader=loader)
+    d = t.to_namedtuple()._asdict()
+    d["line_sizes"] = [len(line) for line in t.lines()]
+    d["points"] = [c for line in t.lines() for point in line for c in point]
+    d["times"] = list(t.times)
+    d["elevations"] = list(t.elevations)
+    d["heart_rates"] = list(t.heart_rates)
+    return d
+
+
+@pytest.mark.parametrize(
+    "file_name",
+    sorted(glob.glob(os.path.join(GPX_DIR, "*.gpx"))),
+    ids=os.path.basename,
+)
+def test_iterparse_matches_gpxpy(file_name):
+    expected = fields(file_name, "gpxpy")
+    actual = fields(file_name, "iterparse")
+
+    assert actual.keys() == expected.keys()
+    for key, value in expected.items():
+        if isinstance(value, (float, list)):
+            value = pytest.approx(value, rel=1e-9, nan_ok=True)
+        assert actual[key] == value, key
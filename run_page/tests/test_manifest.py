@@ -0,0 +1,66 @@
+import json
+import os
+
+from synced_data_file_logger import SyncedFileManifest
+
+
+def open_manifest(tmp_path):
+    return SyncedFileManifest(
+        str(tmp_path / "imported.db"), legacy_file=str(tmp_path / "imported.json")
+    )
+
+
+def write(path, content, mtime_ns=None):
+    path.write_text(content)
+    if mtime_ns is not None:
+        os.utime(path, ns=(mtime_ns, mtime_ns))
+    return str(path)
+
+
+def test_saved_files_stay_synced(tmp_path):
+    file_name = write(tmp_path / "1.gpx", "<gpx/>")
+    manifest = open_manifest(tmp_path)
+    assert not manifest.is_synced(file_name)
+
+    manifest.save([(file_name, "gpx", 1)])
+    manifest.close()
+
+    manifest = open_manifest(tmp_path)
+    assert manifest.is_synced(file_name)
+    assert manifest.entries["1.gpx"][3:] == ("gpx", 1)
+
+
+def test_touched_file_is_still_synced(tmp_path):
+    file_name = write(tmp_path / "1.gpx", "<gpx/>", mtime_ns=10**18)
+    manifest = open_manifest(tmp_path)
+    manifest.save([(file_name, "gpx", 1)])
+
+    write(tmp_path / "1.gpx", "<gpx/>", mtime_ns=2 * 10**18)
+
+    assert manifest.is_synced(file_name)
+    # the new mtime is remembered, the file is not hashed again
+    assert manifest.entries["1.gpx"][1] == 2 * 10**18
+
+
+def test_rewritten_or_missing_file_is_not_synced(tmp_path):
+    file_name = write(tmp_path / "1.gpx", "<gpx/>", mtime_ns=10**18)
+    manifest = open_manifest(tmp_path)
+    manifest.save([(file_name, "gpx", 1)])
+
+    # rewritten with the same size
+    write(tmp_path / "1.gpx", "<GPX/>", mtime_ns=2 * 10**18)
+    assert not manifest.is_synced(file_name)
+
+    os.remove(file_name)
+    assert not manifest.is_synced(file_name)
+
+
+def test_legacy_names_are_taken_over(tmp_path):
+    (tmp_path / "imported.json").write_text(json.dumps(["1.gpx", "2.fit"]))
+    file_name = write(tmp_path / "1.gpx", "<gpx/>")
+
+    manifest = open_manifest(tmp_path)
+
+    assert manifest.is_synced(file_name)
+    assert manifest.is_synced(str(tmp_path / "2.fit"))
+    assert not manifest.is_synced(str(tmp_path / "3.gpx"))
@@ -0,0 +1,80 @@
+import os
+import random
+import sqlite3
+
+import polyline
+import polyline_codec
+import pytest
+from conftest import RUN_PAGE
+
+
+def make_points(size, seed=0):
+    """A random walk with some long jumps, across the equator and 180th meridian"""
+    rng = random.Random(seed)
+    lat, lng = 0.001, 179.999
+    points = []
+    for _ in range(size):
+        step = 1 if rng.random() < 0.01 else 1e-4
+        lat = max(-89.9, min(89.9, lat + rng.uniform(-1, 1) * step))
+        lng = (lng + rng.uniform(-1, 1) * step + 180) % 360 - 180
+        points.append((lat, lng))
+    return points
+
+
+def stored_polylines():
+    db = sqlite3.connect(os.path.join(RUN_PAGE, "data.db"))
+    try:
+        return [
+            polyline_str
+            for (polyline_str,) in db.execute(
+                "SELECT summary_polyline FROM activities "
+                "WHERE summary_polyline != '' ORDER BY run_id LIMIT 50"
+            )
+        ]
+    finally:
+        db.close()
+
+
+@pytest.mark.parametrize("precision", [5, 6])
+def test_encode_matches_polyline(precision):
+    points = make_points(2000)
+    # values exactly half way between two steps round away from zero
+    points += [(0.000005, -0.000005), (1.234565, -1.234565), (0.0, 0.0)]
+
+    assert polyline_codec.encode_points(points, precision) == polyline.encode(
+        points, precision
+    )
+
+
+def test_decode_matches_polyline():
+    polylines = stored_polylines() + [polyline.encode(make_points(500, seed=1))]
+
+    for polyline_str in polylines:
+        assert polyline_codec.decode_points(polyline_str) == polyline.decode(
+            polyline_str
+        )
+
+
+def test_append_matches_encoding_everything():
+    points = make_points(300)
+    polyline_str, previous = "", None
+    for start in range(0, len(points), 70):
+        part = points[start : start + 70]
+        polyline_str = polyline_codec.append(
+            polyline_str, [p[0] for p in part], [p[1] for p in part], previous
+        )
+        previous = part[-1]
+
+    assert polyline_str == polyline.encode(points)
+
+
+def test_empty_and_broken_polylines():
+    assert polyline_codec.encode_points([]) == ""
+    assert polyline_codec.decode_points("") == []
+    assert polyline_codec.first_point("") is None
+    polyline_str = polyline.encode([(39.9, 116.3), (39.91, 116.31)])
+    assert polyline_codec.first_point(polyline_str) == (39.9, 116.3)
+    with pytest.raises(ValueError):
+        polyline_codec.decode(polyline_str[:-1])
+    with pytest.raises(ValueError):
+        polyline_codec.decode(polyline_str + " ")
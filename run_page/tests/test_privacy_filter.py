@@ -0,0 +1,63 @@
+import random
+
+import polyline_codec
+import polyline_processor
+import pytest
+from haversine import haversine
+
+
+def make_walk(size, lat, lng, rng, step=5e-5):
+    """A random walk from (lat, lng), about 5 meters a point"""
+    points = []
+    for _ in range(size):
+        lat += rng.uniform(-1, 1) * step
+        lng += rng.uniform(-1, 1) * step
+        points.append((lat, lng))
+    return points
+
+
+def scalar_filter_out(polyline_str, ignore_points, ignore_range, start_end_range):
+    """filter_out as it was, one haversine call at a time"""
+    pl = polyline_codec.decode_points(polyline_str)
+    start_index, end_index = 0, len(pl) - 1
+    starting_distance = 0
+    for i in range(1, len(pl)):
+        starting_distance += haversine(pl[i], pl[i - 1])
+        if starting_distance > start_end_range:
+            start_index = i
+            break
+    ending_distance = 0
+    for i in range(len(pl) - 2, -1, -1):
+        ending_distance += haversine(pl[i], pl[i + 1])
+        if ending_distance > start_end_range:
+            end_index = i
+            break
+    if start_index >= end_index:
+        return None
+    new_pl = [
+        point
+        for point in pl[start_index : end_index + 1]
+        if not any(haversine(point, p) < ignore_range for p in ignore_points)
+    ]
+    return polyline_codec.encode_points(new_pl) if new_pl else None
+
+
+@pytest.mark.parametrize(
+    "ignore_range, start_end_range", [(0.2, 0.2), (0.05, 0.0), (0.0, 0.5)]
+)
+def test_filter_out_matches_haversine(monkeypatch, ignore_range, start_end_range):
+    rng = random.Random(0)
+    home = (40.0, 116.3)
+    ignore_points = make_walk(100, *home, rng)
+    monkeypatch.setattr(polyline_processor, "IGNORE_POLYLINE", ignore_points)
+    monkeypatch.setattr(polyline_processor, "IGNORE_RANGE", ignore_range)
+    monkeypatch.setattr(polyline_processor, "IGNORE_START_END_RANGE", start_end_range)
+    polyline_processor.ignore_index.cache_clear()
+    try:
+        for _ in range(10):
+            track = polyline_codec.encode_points(make_walk(300, *home, rng, 3e-4))
+            assert polyline_processor.filter_out(track) == scalar_filter_out(
+                track, ignore_points, ignore_range, start_end_range
+            )
+    finally:
+        polyline_processor.ignore_index.cache_clear()
@@ -0,0 +1,93 @@
+import pytest
+from gpxtrackposter.track import Track
+
+TRACKPOINT = """
+        <Trackpoint>
+          <Time>2024-05-01T06:{minute:02d}:{second:02d}Z</Time>
+          {position}
+          <AltitudeMeters>{altitude}</AltitudeMeters>
+          <DistanceMeters>{distance}</DistanceMeters>
+          <HeartRateBpm><Value>{heart_rate}</Value></HeartRateBpm>
+        </Trackpoint>"""
+
+POSITION = """<Position>
+            <LatitudeDegrees>{lat}</LatitudeDegrees>
+            <LongitudeDegrees>{lng}</LongitudeDegrees>
+          </Position>"""
+
+TCX = """<?xml version="1.0" encoding="UTF-8"?>
+<TrainingCenterDatabase
+  xmlns="http://www.garmin.com/xmlschemas/TrainingCenterDatabase/v2"
+  xmlns:ns3="http://www.garmin.com/xmlschemas/ActivityExtension/v2">
+  <Activities>
+    <Activity Sport="Running">
+      <Id>2024-05-01T06:00:00Z</Id>
+      <Lap StartTime="2024-05-01T06:00:00Z">
+        <TotalTimeSeconds>{duration}</TotalTimeSeconds>
+        <DistanceMeters>{total_distance}</DistanceMeters>
+        <Calories>321</Calories>
+        <Track>{trackpoints}
+        </Track>
+        <Extensions><ns3:LX><ns3:AvgSpeed>2.9</ns3:AvgSpeed></ns3:LX></Extensions>
+      </Lap>
+    </Activity>
+  </Activities>
+</TrainingCenterDatabase>
+"""
+
+
+def make_tcx(path, points=200):
+    trackpoints = []
+    for i in range(points):
+        # a few points without position, like a tunnel
+        position = (
+            ""
+            if 50 <= i < 53
+            else POSITION.format(
+                lat=39.9 + i * 3e-5 + (i % 7) * 1e-5, lng=116.3 + i * 2e-5
+            )
+        )
+        trackpoints.append(
+            TRACKPOINT.format(
+                minute=i * 3 // 60,
+                second=i * 3 % 60,
+                position=position,
+                altitude=50 + (i % 17) * 0.4,
+                distance=i * 9.5,
+                heart_rate=130 + i % 25,
+            )
+        )
+    path.write_text(
+        TCX.format(
+            duration=points * 3,
+            total_distance=(points - 1) * 9.5,
+            trackpoints="".join(trackpoints),
+        )
+    )
+    return str(path)
+
+
+def fields(file_name, loader):
+    """What ends up in the db, plus the points kept for drawing"""
+    t = Track()
+    t.load_tcx(file_name, loader=loader)
+    d = t.to_namedtuple()._asdict()
+    d["line_sizes"] = [len(line) for line in t.lines()]
+    d["points"] = [c for line in t.lines() for point in line for c in point]
+    d["times"] = list(t.times)
+    d["elevations"] = list(t.elevations)
+    d["heart_rates"] = list(t.heart_rates)
+    return d
+
+
+def test_iterparse_matches_tcxreader(tmp_path):
+    file_name = make_tcx(tmp_path / "1714543200.tcx")
+    expected = fields(file_name, "tcxreader")
+    actual = fields(file_name, "iterparse")
+
+    assert expected["distance"] > 0
+    assert actual.keys() == expected.keys()
+    for key, value in expected.items():
+        if isinstance(value, (float, list)):
+            value = pytest.approx(value, rel=1e-9, nan_ok=True)
+        assert actual[key] == value, key
@@ -0,0 +1,59 @@
+import datetime
+import random
+
+import timezones
+from gpxtrackposter.track import Track, find_local_times
+from gpxtrackposter.utils import parse_datetime_to_local
+
+
+def border_points(size=500, seed=0):
+    """Points around the Rhine, the border of Europe/Paris and Europe/Berlin"""
+    rng = random.Random(seed)
+    return [(rng.uniform(48.5, 49.0), rng.uniform(7.7, 8.3)) for _ in range(size)]
+
+
+def test_zones_match_the_exact_lookup_near_a_border():
+    timezones._cell_timezone.cache_clear()
+    timezones._point_timezone.cache_clear()
+    points = border_points()
+    expected = [timezones._lookup(*point) for point in points]
+    assert set(expected) == {"Europe/Paris", "Europe/Berlin"}
+
+    assert timezones.timezones_at(points + [None]) == expected + [None]
+    assert [timezones.timezone_at(*point) for point in points] == expected
+    # the cells the border runs through have no zone of their own
+    assert any(
+        timezones._cell_timezone(timezones._cell(*point)) is None for point in points
+    )
+
+
+def test_utc_offset_is_the_one_at_that_time():
+    summer = datetime.datetime(2024, 7, 1, 6)
+    winter = datetime.datetime(2024, 1, 1, 6)
+    assert timezones.utc_offset(summer, "Europe/Berlin") == datetime.timedelta(hours=2)
+    assert timezones.utc_offset(winter, "Europe/Berlin") == datetime.timedelta(hours=1)
+
+
+def make_track(start, point):
+    track = Track()
+    track.start_time = start
+    track.end_time = start + datetime.timedelta(hours=1)
+    track._set_local_times(point)
+    return track
+
+
+def test_local_times_of_a_whole_import():
+    start = datetime.datetime(2024, 3, 31, 0, 30)
+    points = border_points(50) + [None]
+    tracks = [make_track(start, point) for point in points]
+    expected = [parse_datetime_to_local(start, start, point)[0] for point in points]
+
+    find_local_times(tracks)
+
+    assert [t.start_time_local for t in tracks] == expected
+    assert all(
+        t.end_time_local - t.start_time_local == datetime.timedelta(hours=1)
+        for t in tracks
+    )
+    # one by one, on first use
+    assert make_track(start, points[0]).start_time_local == expected[0]
@@ -0,0 +1,91 @@
+import datetime
+
+import polyline_codec
+import pytest
+import s2sphere as s2
+from gpxtrackposter.track import Track
+
+
+def make_track(points, start):
+    track = Track()
+    track.start_time = start
+    track.end_time = start + datetime.timedelta(minutes=10)
+    track.length = 1000.0
+    track.moving_dict = {
+        "distance": 1000.0,
+        "moving_time": datetime.timedelta(seconds=500),
+        "elapsed_time": datetime.timedelta(seconds=600),
+        "average_speed": 2.0,
+    }
+    track.add_line(points)
+    track.polyline_str = polyline_codec.encode_points(points)
+    return track
+
+
+def test_append_only_extends_the_polyline():
+    start = datetime.datetime(2024, 5, 1, 6)
+    first_points = [(39.9, 116.3), (39.90001, 116.30002)]
+    second_points = [(40.5, 117.1), (40.50002, 117.10001)]
+    third_points = [(41.0, 118.0)]
+    track = make_track(first_points, start)
+    lines, bbox = track.lines(), track.bbox()
+
+    track.append(make_track(second_points, start + datetime.timedelta(hours=1)))
+    track.append(make_track(third_points, start + datetime.timedelta(hours=2)))
+
+    points = first_points + second_points + third_points
+    assert track.polyline_container == [list(p) for p in points]
+    assert track.polyline_str == polyline_codec.encode_points(points)
+    assert track.lines() == lines
+    assert track.bbox() == bbox
+    assert track.length == 3000.0
+    assert track.moving_dict["distance"] == 3000.0
+
+
+def test_appended_points_survive_the_cache():
+    start = datetime.datetime(2024, 5, 1, 6)
+    track = make_track([(39.9, 116.3), (39.90001, 116.30002)], start)
+    track.append(make_track([(40.5, 117.1)], start + datetime.timedelta(hours=1)))
+
+    cached = Track.from_cache(track.to_cache())
+
+    assert cached.lines() == track.lines()
+    assert cached.polyline_container == track.polyline_container
+
+
+def union_bbox(track):
+    """bbox as it was, the union of the rectangles of every point"""
+    bbox = s2.LatLngRect()
+    for line in track.polylines:
+        for latlng in line:
+            bbox = bbox.union(s2.LatLngRect.from_point(latlng.normalized()))
+    return bbox
+
+
+@pytest.mark.parametrize(
+    "points, crosses",
+    [
+        ([(39.9, 116.3), (39.91, 116.32), (39.92, 116.31)], False),
+        # across the 180th meridian, both ways
+        ([(-16.5, 179.8), (-16.6, 179.95), (-16.7, -179.9), (-16.8, -179.7)], True),
+        ([(65.0, -179.9), (65.1, 179.9), (65.2, 179.6)], True),
+    ],
+)
+def test_bbox_matches_point_union(points, crosses):
+    track = make_track(points, datetime.datetime(2024, 5, 1, 6))
+
+    bbox = track.bbox()
+    expected = union_bbox(track)
+    assert bbox.lo().lat().degrees == pytest.approx(expected.lo().lat().degrees)
+    assert bbox.hi().lat().degrees == pytest.approx(expected.hi().lat().degrees)
+    assert bbox.lng() == expected.lng()
+    assert bbox.lng().is_inverted() == crosses
+
+
+def test_polylines_are_built_again_after_new_points():
+    track = make_track([(39.9, 116.3), (39.91, 116.32)], datetime.datetime(2024, 5, 1))
+
+    assert track.polylines is track.polylines
+    track.add_line([(40.0, 117.0)])
+    assert len(track.polylines) == 2
+    assert track.polylines[1][0].lat().degrees == pytest.approx(40.0)
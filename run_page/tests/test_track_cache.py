@@ -0,0 +1,70 @@
+import datetime
+import glob
+import json
+import os
+
+import polyline_codec
+from conftest import GPX_DIR
+from gpxtrackposter.track import Track
+from gpxtrackposter.track_loader import TrackCache
+
+
+def rounded(lines):
+    """The lines as the encoded polyline of the cache keeps them"""
+    return [
+        polyline_codec.decode_points(polyline_codec.encode_points(line))
+        for line in lines
+    ]
+
+
+def round_trip(track):
+    return Track.from_cache(json.loads(json.dumps(track.to_cache())))
+
+
+def test_round_trip_keeps_lines():
+    track = Track()
+    track.start_time = track.start_time_local = datetime.datetime(2024, 5, 1, 6)
+    track.end_time = track.end_time_local = datetime.datetime(2024, 5, 1, 7)
+    track.moving_dict = {
+        "distance": 1000.0,
+        "moving_time": datetime.timedelta(seconds=600),
+        "elapsed_time": datetime.timedelta(seconds=700),
+        "average_speed": 1.6,
+    }
+    track.add_line([(39.9, 116.3), (39.90001, 116.30002)])
+    track.add_line([(39.91, 116.31), (39.91002, 116.31001), (39.91003, 116.31)])
+    track.polyline_str = polyline_codec.encode_points(track.polyline_container)
+
+    cached = round_trip(track)
+
+    assert cached.lines() == track.lines()
+    assert cached.bbox() == track.bbox()
+    assert cached.moving_dict == track.moving_dict
+    assert cached.start_time == track.start_time
+
+
+def test_round_trip_of_an_empty_track():
+    cached = round_trip(Track())
+
+    assert cached.lines() == []
+    assert cached.polyline_container == []
+    assert cached.bbox().is_empty()
+
+
+def test_cached_gpx_tracks_match_parsed_ones(tmp_path):
+    file_names = sorted(glob.glob(os.path.join(GPX_DIR, "*.gpx")))[:10]
+    tracks = {}
+    for file_name in file_names:
+        track = Track()
+        track.load_gpx(file_name)
+        tracks[file_name] = track
+    cache = TrackCache(str(tmp_path / "track_cache.db"))
+    cache.save(tracks, {f: cache.fingerprint(f) for f in file_names})
+
+    cached, misses = cache.load(file_names)
+    cache.close()
+
+    assert not misses
+    for file_name, track in tracks.items():
+        assert cached[file_name].to_namedtuple() == track.to_namedtuple()
+        assert cached[file_name].lines() == rounded(track.lines())
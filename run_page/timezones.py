@@ -0,0 +1,110 @@
+"""
+Memoized time zones of activities.
+
+Finding the zone of a point (tzfpy, or timezonefinder where tzfpy is not
+available) is the slow part of a local start time, and the activities of one
+person start in a few places. Zone names are cached per cell of
+TZ_CELL_DEGREES and pytz zones per name. Offsets are the ones at the
+activity's own time, so DST is applied as it was then, not as it is today.
+
+A cell only has a zone when its corners and center are all in that zone,
+the points of a cell a zone border runs through are looked up themselves.
+timezones_at resolves the start points of a whole import at once.
+"""
+
+import functools
+import math
+import os
+from datetime import UTC
+
+import pytz
+
+try:
+    from tzfpy import get_tz
+except ImportError:
+    # tzfpy is not available (windows), timezonefinder is used instead
+    get_tz = None
+
+# zone of the activities without a position
+DEFAULT_TIMEZONE = "Asia/Shanghai"
+# points in the same cell of this size (about 1 km) share their zone
+TZ_CELL_DEGREES = float(os.getenv("TZ_CELL_DEGREES", "0.01"))
+TZ_CACHE_SIZE = 4096
+
+
+@functools.lru_cache(maxsize=1)
+def _timezone_finder():
+    from timezonefinder import TimezoneFinder
+
+    return TimezoneFinder()
+
+
+def _lookup(lat, lng):
+    if get_tz is not None:
+        try:
+            return get_tz(lng=lng, lat=lat)
+        except (TypeError, ValueError) as e:
+            print(f"tzfpy error: {e} fallback to timezonefinder")
+    return _timezone_finder().timezone_at(lng=lng, lat=lat)
+
+
+def _cell(lat, lng):
+    return math.floor(lat / TZ_CELL_DEGREES), math.floor(lng / TZ_CELL_DEGREES)
+
+
+@functools.lru_cache(maxsize=TZ_CACHE_SIZE)
+def _cell_timezone(cell):
+    """Zone name of the cell's corners and center, None if they are not in one zone"""
+    names = set()
+    for i, j in ((0, 0), (0, 1), (1, 0), (1, 1), (0.5, 0.5)):
+        lat = min(max((cell[0] + i) * TZ_CELL_DEGREES, -90), 90)
+        lng = min(max((cell[1] + j) * TZ_CELL_DEGREES, -180), 180)
+        names.add(_lookup(lat, lng))
+    return names.pop() if len(names) == 1 else None
+
+
+@functools.lru_cache(maxsize=TZ_CACHE_SIZE)
+def _point_timezone(lat, lng):
+    return _lookup(lat, lng)
+
+
+def timezone_at(lat, lng):
+    """Zone name of a point"""
+    tz_name = _cell_timezone(_cell(lat, lng))
+    return _point_timezone(lat, lng) if tz_name is None else tz_name
+
+
+def timezones_at(points):
+    """
+    Zone names of many (lat, lng) points, like the start points of a whole
+    import, every cell looked up once. None for the points that are None.
+    """
+    cells = [None if point is None else _cell(*point) for point in points]
+    names = {cell: _cell_timezone(cell) for cell in set(cells) if cell is not None}
+    result = []
+    for point, cell in zip(points, cells):
+        if point is None:
+            result.append(None)
+        elif names[cell] is None:
+            # a zone border runs through the cell
+            result.append(_point_timezone(*point))
+        else:
+            result.append(names[cell])
+    return result
+
+
+@functools.cache
+def get_zone(tz_name):
+    return pytz.timezone(tz_name)
+
+
+def utc_offset(time, tz_name):
+    """Offset of tz_name at the instant time, naive times are UTC"""
+    if time.tzinfo is None:
+        time = time.replace(tzinfo=UTC)
+    return time.astimezone(get_zone(tz_name)).utcoffset()
+
+
+def local_offset(local_time, tz_name):
+    """Offset of tz_name when its clocks show local_time, any tzinfo ignored"""
+    return get_zone(tz_name).localize(local_time.replace(tzinfo=None)).utcoffset()
@@ -0,0 +1,156 @@
+"""
+Vectorized track metrics on numpy arrays.
+
+Every function takes the points of one line as aligned sequences (lists,
+array.array or numpy arrays) of latitudes, longitudes, timestamps (seconds),
+elevations (meters) and heart rates, with nan (or None) where a point has
+no value, and computes what the loaders and syncers used to compute point by
+point in python. Distances follow gpxpy.geo.distance, so the results match
+the gpxpy based ones up to float rounding.
+"""
+
+import math
+
+import numpy as np
+
+# gpxpy.geo, WGS84 semi-major axis
+EARTH_RADIUS = 6378.137 * 1000
+ONE_DEGREE = (2 * math.pi * EARTH_RADIUS) / 360
+
+# gaps longer than this (seconds) are pauses, Track._calc_moving_time
+MOVING_GAP_SECONDS = 10
+# slower steps (km/h) are stops, gpxpy get_moving_data
+STOPPED_SPEED_THRESHOLD = 1
+
+
+def _floats(values):
+    """float64 array, None -> nan"""
+    return np.asarray(values, dtype=np.float64)
+
+
+def haversine(lats1, lngs1, lats2, lngs2):
+    """Great circle distances (meters) between the points of two arrays"""
+    lats1, lats2 = np.radians(lats1), np.radians(lats2)
+    d_lng = np.radians(np.subtract(lngs1, lngs2))
+    a = np.sin((lats1 - lats2) / 2) ** 2 + np.sin(d_lng / 2) ** 2 * np.cos(
+        lats1
+    ) * np.cos(lats2)
+    return EARTH_RADIUS * 2 * np.arcsin(np.sqrt(a))
+
+
+def step_distances(lats, lngs, elevations=None):
+    """
+    Distance (meters) from every point to the next one, len(lats) - 1 values.
+    Like gpxpy.geo.distance: a flat approximation for close points, haversine
+    for points more than 0.2 degrees apart, and 3d when both elevations are
+    set (and not 0, as in gpxpy's get_moving_data).
+    """
+    lats, lngs = _floats(lats), _floats(lngs)
+    lat1, lat2 = lats[1:], lats[:-1]
+    lng1, lng2 = lngs[1:], lngs[:-1]
+    far = (np.abs(lat1 - lat2) > 0.2) | (np.abs(lng1 - lng2) > 0.2)
+    x = lat1 - lat2
+    y = (lng1 - lng2) * np.cos(np.radians(lat1))
+    distances = np.sqrt(x * x + y * y) * ONE_DEGREE
+    if far.any():
+        distances[far] = haversine(lat1[far], lng1[far], lat2[far], lng2[far])
+    if elevations is not None:
+        elevations = _floats(elevations)
+        ele1, ele2 = elevations[1:], elevations[:-1]
+        with np.errstate(invalid="ignore"):
+            use_3d = ~far & (ele1 != 0) & (ele2 != 0) & (ele1 != ele2)
+        use_3d &= ~np.isnan(ele1) & ~np.isnan(ele2)
+        distances[use_3d] = np.sqrt(
+            distances[use_3d] ** 2 + (ele1[use_3d] - ele2[use_3d]) ** 2
+        )
+    return distances
+
+
+def track_length(lats, lngs):
+    """2d length (meters) of a line"""
+    if len(lats) < 2:
+        return 0.0
+    return float(step_distances(lats, lngs).sum())
+
+
+def _time_steps(timestamps):
+    # to whole microseconds, what datetime differences would give
+    return np.round(np.diff(timestamps), 6)
+
+
+def moving_time(timestamps, start_time=None, gap=MOVING_GAP_SECONDS):
+    """
+    Seconds spent in steps of at most gap seconds, as an int, 0 when a point
+    has no time. start_time (timestamp) replaces the first point's time as
+    the start of the first step, like Track._calc_moving_time does.
+    """
+    timestamps = _floats(timestamps)
+    if len(timestamps) < 2 or np.isnan(timestamps).any():
+        return 0
+    steps = _time_steps(timestamps)
+    spans = np.diff(timestamps)
+    if start_time is not None:
+        spans[0] = timestamps[1] - start_time
+    return int(spans[steps <= gap].sum())
+
+
+def moving_data(
+    lats, lngs, timestamps, elevations=None, stopped_speed=STOPPED_SPEED_THRESHOLD
+):
+    """
+    (moving seconds, moving meters) over the steps faster than stopped_speed
+    km/h, like gpxpy's get_moving_data. Steps without both times are skipped.
+    """
+    if len(lats) < 2:
+        return 0.0, 0.0
+    timestamps = _floats(timestamps)
+    distances = step_distances(lats, lngs, elevations)
+    seconds = _time_steps(timestamps)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        moving = (seconds > 0) & (distances > 0)
+        moving &= (distances / 1000) / (seconds / 3600) > stopped_speed
+    return float(seconds[moving].sum()), float(distances[moving].sum())
+
+
+def elevation_gain(elevations, smooth=True):
+    """
+    Total climb (meters), points without elevation are left out.
+    smooth: weigh every elevation 0.3/0.4/0.3 with its neighbours first,
+    like gpxpy's get_uphill_downhill, else sum the raw rises.
+    """
+    elevations = _floats(elevations)
+    elevations = elevations[~np.isnan(elevations)]
+    if len(elevations) < 2:
+        return 0.0
+    if smooth and len(elevations) > 2:
+        smoothed = elevations.copy()
+        smoothed[1:-1] = (
+            elevations[:-2] * 0.3 + elevations[1:-1] * 0.4 + elevations[2:] * 0.3
+        )
+        elevations = smoothed
+    rises = np.diff(elevations)
+    return float(rises[rises > 0].sum())
+
+
+def gpx_elevation_gain(gpx):
+    """gpx.get_uphill_downhill().uphill of a gpxpy GPX, segment by segment"""
+    return sum(
+        elevation_gain([p.elevation for p in segment.points])
+        for track in gpx.tracks
+        for segment in track.segments
+    )
+
+
+def average_heart_rate(heart_rates):
+    """Mean of the heart rates above 0, None if there is none"""
+    heart_rates = _floats(heart_rates)
+    with np.errstate(invalid="ignore"):
+        heart_rates = heart_rates[heart_rates > 0]
+    if not len(heart_rates):
+        return None
+    return float(heart_rates.mean())
+
+
+def average_speed(distance, seconds):
+    """m/s, 0 without time"""
+    return distance / seconds if seconds else 0
@@ -1,14 +1,15 @@
 import argparse
-import json
 import os
 from collections import namedtuple
 from datetime import datetime, timedelta, timezone
 from urllib.parse import quote
 import gpxpy
-import polyline
+from polyline_codec import encode_points
 import requests
 from config import GPX_FOLDER, JSON_FILE, SQL_FILE, run_map, start_point
 from generator import Generator
+from generator.id_index import get_downloaded_ids
+from track_metrics import elevation_gain
 from xml.etree import ElementTree
 from utils import adjust_time_to_utc
 
@@ -113,7 +114,7 @@ def merge_summary_and_detail_to_nametuple(summary, detail):
                 last_point[6]
             ) - datetime.fromisoformat(first_point[6])
             latlng_list = [[float(point[0]), float(point[1])] for point in point_list]
-            map = run_map(polyline.encode(latlng_list))
+            map = run_map(encode_points(latlng_list))
 
             altitude_list = [point[2] for point in detail["map_data_list"]]
             elevation_gain = compute_elevation_gain(altitude_list)
@@ -141,11 +142,8 @@ def merge_summary_and_detail_to_nametuple(summary, detail):
 
 
 def compute_elevation_gain(altitudes):
-    total_gain = 0
-    for i in range(1, len(altitudes)):
-        if float(altitudes[i]) > float(altitudes[i - 1]):
-            total_gain += float(altitudes[i]) - float(altitudes[i - 1])
-    return total_gain
+    # the raw rises, altitudes may be strings
+    return elevation_gain(altitudes, smooth=False)
 
 
 def find_last_tulipsport_start_time(track_ids):
@@ -177,8 +175,7 @@ def get_new_activities(token, old_tracks_ids, with_gpx=False):
     tracks = []
     if with_gpx and not os.path.exists(GPX_FOLDER):
         os.mkdir(GPX_FOLDER)
-    old_gpx_ids = os.listdir(GPX_FOLDER)
-    old_gpx_ids = [i.split(".")[0] for i in old_gpx_ids if not i.startswith(".")]
+    old_gpx_ids = get_downloaded_ids(GPX_FOLDER)
     for activity_summary in activity_summary_list:
         activity_id = activity_summary["aid"]
         print(f"parsing activity id {activity_id}")
@@ -266,13 +263,11 @@ def build_tulipsport_int_activity_id(activity):
 
 def sync_tulipsport_activites(token, with_gpx=False):
     generator = Generator(SQL_FILE)
-    old_tracks_ids = generator.get_old_tracks_ids()
+    old_tracks_ids = generator.get_known_ids(prefix=TULIPSPORT_FAKE_ID_PREFIX)
     new_tracks = get_new_activities(token, old_tracks_ids, with_gpx)
-    generator.sync_from_app(new_tracks)
+    generator.sync_from_app(new_tracks, source="tulipsport")
 
-    activities_list = generator.load()
-    with open(JSON_FILE, "w") as f:
-        json.dump(activities_list, f)
+    generator.export_json(JSON_FILE)
 
 
 if __name__ == "__main__":
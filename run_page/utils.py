@@ -1,8 +1,5 @@
-import json
 import time
-from datetime import datetime
-
-import pytz
+from datetime import UTC, datetime
 
 try:
     from rich import print
@@ -11,22 +8,24 @@ except Exception:
 from generator import Generator
 from stravalib.client import Client
 from stravalib.exc import RateLimitExceeded
+from timezones import local_offset, utc_offset
 
 
 def adjust_time(time, tz_name):
-    tc_offset = datetime.now(pytz.timezone(tz_name)).utcoffset()
-    return time + tc_offset
+    """UTC time to tz_name's local time, with the offset it had at that time"""
+    return time + utc_offset(time, tz_name)
 
 
 def adjust_time_to_utc(time, tz_name):
-    tc_offset = datetime.now(pytz.timezone(tz_name)).utcoffset()
-    return time - tc_offset
+    """tz_name's local time to UTC"""
+    return time - local_offset(time, tz_name)
 
 
 def adjust_timestamp_to_utc(timestamp, tz_name):
-    tc_offset = datetime.now(pytz.timezone(tz_name)).utcoffset()
-    delta = int(tc_offset.total_seconds())
-    return int(timestamp) - delta
+    """A timestamp of tz_name's local time to a UTC one"""
+    timestamp = int(timestamp)
+    local_time = datetime.fromtimestamp(timestamp, UTC)
+    return timestamp - int(local_offset(local_time, tz_name).total_seconds())
 
 
 def to_date(ts):
@@ -56,9 +55,7 @@ def make_activities_file(
     generator.sync_from_data_dir(
         data_dir, file_suffix=file_suffix, activity_title_dict=activity_title_dict
     )
-    activities_list = generator.load()
-    with open(json_file, "w") as f:
-        json.dump(activities_list, f)
+    generator.export_json(json_file)
 
 
 def make_strava_client(client_id, client_secret, refresh_token):
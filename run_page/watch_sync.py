@@ -0,0 +1,33 @@
+"""
+Keep importing the gpx, tcx and fit files landing in GPX_OUT, TCX_OUT and
+FIT_OUT, e.g. from a watch sync tool, until interrupted.
+"""
+
+import argparse
+
+from config import FOLDER_DICT, JSON_FILE, SQL_FILE
+from generator import Generator
+from generator.watch import WATCH_INTERVAL, watch
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--types",
+        nargs="+",
+        choices=sorted(FOLDER_DICT),
+        default=sorted(FOLDER_DICT),
+        help="the file types to watch, all by default",
+    )
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=WATCH_INTERVAL,
+        help="seconds between two looks at the folders",
+    )
+    options = parser.parse_args()
+    watch(
+        Generator(SQL_FILE),
+        {file_suffix: FOLDER_DICT[file_suffix] for file_suffix in options.types},
+        JSON_FILE,
+        interval=options.interval,
+    )